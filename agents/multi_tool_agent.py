@@ -1,7 +1,8 @@
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Iterator
 import re
 import os
+import time
 import sys
 from pathlib import Path
 
@@ -10,8 +11,22 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 from langchain.tools import Tool
 from langchain.agents import initialize_agent, AgentType
-from langchain_community.chat_models import ChatOpenAI
 from logs.query_logger import QueryLogger
+from src.context_packer import ContextPacker
+from src.ingest import load_premasked_sources
+from src.prompts import DOMAIN_FOCUS, select_template
+from src.router import DOMAIN_TOOLS, QueryRouter, contributes
+from config.settings import Settings
+from tools.llm_client import llm_client
+from tools.singleflight import flight_stats, get_flight, normalize
+from tools.tracing import isolated, span, start_trace
+
+# Per-answer fields from RAGPipeline copied into the query log
+LOGGED_LLM_FIELDS = ("prompt_version", "cached_prompt_tokens", "prompt_cache_ratio", "prompt_cache_savings_usd",
+                     "tier", "tiers_tried", "tier_latency", "escalation_reason", "cost_usd")
+
+# Section header each tool's output is packed under
+TOOL_HEADERS = {"sql": "**Database Results:**", "vector": "**Document Search:**", "graph": "**Knowledge Graph:**"}
 
 class MultiToolAgent:
     def __init__(self, sql_retriever, vector_retriever, graph_retriever, rag_pipeline):
@@ -21,79 +36,28 @@ class MultiToolAgent:
         self.rag_pipeline = rag_pipeline
         self.query_count = 0
         self.logger = QueryLogger()
-        
-        # Few-shot examples for response formatting
-        self.few_shot_examples = {
-            "high_risk_query": {
-                "keywords": ["high risk", "risky customer", "risk customer"],
-                "template": """### High-Risk Customers Identified
-
-**1. High-Risk Customers:**
-   - **[Customer Name 1]**
-   - **[Customer Name 2]**
-
-### Key Insights
-
-**A. Risk Analysis:**
-   - [Risk categorization details based on operational practices and violations]
-
-**B. Risk Connection Analysis:**
-   - **[Customer 1]:**
-     - Associated with **[Risk Type]** due to [specific reasons]
-   - **[Customer 2]:**
-     - Linked to **[Risk Type]** stemming from [specific issues]
-
-**C. Risk Propagation Effects:**
-   - **[Risk Category 1]:**
-     - [Impact description and long-term implications]
-   - **[Risk Category 2]:**
-     - [Relationship effects and consequences]
-
-### Conclusion
-[Summary of identified high-risk customers and monitoring recommendations]"""
-            },
-            "financial_analysis": {
-                "keywords": ["revenue", "profit", "financial performance", "top customers"],
-                "template": """### Financial Analysis Results
-
-**1. Key Financial Metrics:**
-   - **Total Revenue:** [Amount]
-   - **Top Performers:** [List]
-
-### Detailed Breakdown
-
-**A. Performance Analysis:**
-   - [Financial metrics and trends]
-
-**B. Customer Segmentation:**
-   - **High-Value Customers:** [Details]
-   - **Growth Opportunities:** [Analysis]
-
-### Summary
-[Key financial insights and recommendations]"""
-            }
-        }
+        # Tools whose output comes only from data PII-masked at ingestion. Not sql: its output
+        # is text the SQL agent's LLM wrote, which output masking must still scan
+        sources = load_premasked_sources(getattr(sql_retriever, "db_path", "compass.duckdb"))
+        self.premasked_tools = {"vector"} if "unstructured" in sources else set()
+        self.context_packer = ContextPacker(getattr(rag_pipeline, "model", "gpt-4o-mini"),
+                                            Settings.CONTEXT_TOKEN_BUDGET)
         
         # Domain-specific tool priorities
-        self.domain_tools = {
-            "Finance": ["sql", "vector", "graph"],
-            "Biotech": ["vector", "graph", "sql"],
-            "Energy": ["graph", "vector", "sql"]
-        }
+        self.domain_tools = dict(DOMAIN_TOOLS)
+        # Keyword matcher plus, once trained, the tool contribution classifier (src/router.py)
+        # and the learned routing policy (src/routing_policy.py)
+        self.router = QueryRouter(self.domain_tools)
         
         # Domain focus instructions
-        self.domain_focus = {
-            "Finance": "Focus on financial metrics, revenue, risk analysis, and regulatory compliance.",
-            "Biotech": "Emphasize research findings, clinical data, safety protocols, and lab compliance.",
-            "Energy": "Highlight environmental impact, emissions data, facility operations, and sustainability."
-        }
+        self.domain_focus = DOMAIN_FOCUS
         
         self._init_agent()
     
     def _init_agent(self):
         api_key = os.getenv("OPENAI_API_KEY")
         if api_key:
-            llm = ChatOpenAI(temperature=0, model="gpt-4o-mini", openai_api_key=api_key)
+            llm = llm_client.chat_model(temperature=0, model="gpt-4o-mini", openai_api_key=api_key)
             tools = [
                 Tool(name="sql_search", description="Customer/financial/risk data", func=self.sql_retriever.search),
                 Tool(name="document_search", description="Reports/documents/audits", func=self.vector_retriever.search),
@@ -113,138 +77,216 @@ class MultiToolAgent:
         clean_query = re.sub(r'\[Domain: \w+\]', '', query).strip()
         return domain, clean_query
     
-    def _get_response_template(self, query: str) -> str:
-        """Get appropriate response template based on query type"""
-        q = query.lower()
-        
-        for example_key, example_data in self.few_shot_examples.items():
-            if any(keyword in q for keyword in example_data["keywords"]):
-                return example_data["template"]
-        
-        return ""
+    def run_tool(self, tool: str, query: str, domain: str = "General") -> str:
+        """Raw output of one tool for a query"""
+        if tool == "sql":
+            return self.sql_retriever.search(query)
+        if tool == "vector":
+            # Narrow document search to the user's domain before scoring
+            return self.vector_retriever.search(query, domain=domain if domain in self.domain_focus else None)
+        if tool == "graph":
+            return self.graph_retriever.search(query)
+        raise ValueError(f"Unknown tool: {tool}")
     
-    def _enhance_query_with_template(self, query: str) -> str:
-        """Enhance query with few-shot template for better formatting"""
-        template = self._get_response_template(query)
-        
-        if template:
-            return f"""{query}
-
-Please format your response following this structure:
-
-{template}
-
-Use the actual data from the search results to fill in the specific details."""
-        
-        return query
-    
-    def _get_tools_for_query(self, domain: str, query: str) -> list:
-        """Determine which tools to use based on domain and query content"""
-        q = query.lower()
-        
-        # Use domain-specific tool order if available
-        if domain in self.domain_tools:
-            priority_tools = self.domain_tools[domain]
-        else:
-            priority_tools = ["sql", "vector", "graph"]
-        
-        # Keyword-based tool selection
-        sql_keywords = ["customer", "revenue", "risk", "financial", "profit", "top", "metric"]
-        vector_keywords = ["report", "document", "audit", "compliance", "research", "finding"]
-        graph_keywords = ["violation", "emission", "facility", "relationship", "connected"]
-        comprehensive_keywords = ["high risk", "analysis", "overview", "assessment", "status"]
-        
-        # For comprehensive queries, use all tools in domain priority order
-        if any(keyword in q for keyword in comprehensive_keywords):
-            return priority_tools
-        
-        # Select tools based on keywords
-        tools_needed = []
-        if any(word in q for word in sql_keywords):
-            tools_needed.append("sql")
-        if any(word in q for word in vector_keywords):
-            tools_needed.append("vector")
-        if any(word in q for word in graph_keywords):
-            tools_needed.append("graph")
-        
-        # If no specific keywords, use top 2 domain tools
-        return tools_needed if tools_needed else priority_tools[:2]
-    
-    def _execute_tools(self, query: str, tools_needed: list) -> tuple:
+    def _execute_tools(self, query: str, tools_needed: list, domain: str = "General") -> tuple:
         """Execute specified tools and collect results"""
         context_parts = []
         tools_used = []
         
         for tool in tools_needed:
             try:
-                if tool == "sql":
-                    result = self.sql_retriever.search(query)
-                    context_parts.append(f"**Database Results:**\n{result}")
-                elif tool == "vector":
-                    result = self.vector_retriever.search(query)
-                    context_parts.append(f"**Document Search:**\n{result}")
-                elif tool == "graph":
-                    result = self.graph_retriever.search(query)
-                    context_parts.append(f"**Knowledge Graph:**\n{result}")
+                with span(f"tool.{tool}") as s:
+                    result = self.run_tool(tool, query, domain)
+                    context_parts.append(f"{TOOL_HEADERS[tool]}\n{result}")
+                    # Training labels for the router's contribution classifier
+                    s.set(result_chars=len(result), contributed=contributes(result))
                 tools_used.append(tool)
             except Exception:
                 continue  
         
         return context_parts, tools_used
     
-    def execute(self, query: str) -> Dict:
+    def _prepare(self, query: str) -> Dict:
+        """Run retrieval and build the packed context and prompt shared by execute and execute_stream"""
         start_time = datetime.now()
         
         # Parse query and extract domain
-        domain, clean_query = self._parse_query(query)
+        with span("parse") as s:
+            domain, clean_query = self._parse_query(query)
+            s.set(domain=domain)
         
         # Determine tools to use
-        tools_needed = self._get_tools_for_query(domain, clean_query)
+        with span("route") as s:
+            route = self.router.route(domain, clean_query)
+            tools_needed = route["tools"]
+            s.set(tools=tools_needed, source=route["source"], probabilities=route["probabilities"],
+                  skipped=route["skipped"])
         
         # Execute tools
-        context_parts, tools_used = self._execute_tools(clean_query, tools_needed)
+        context_parts, tools_used = self._execute_tools(clean_query, tools_needed, domain)
         
-        # Generate answer using RAG pipeline
+        prepared = {
+            "start_time": start_time,
+            "domain": domain,
+            "clean_query": clean_query,
+            "tools_used": tools_used,
+            "combined_context": "",
+            "pack_stats": {},
+            "context_premasked": bool(tools_used) and set(tools_used) <= self.premasked_tools,
+            # Few-shot format added to the prompt after the shared prefix (src/prompts.py)
+            "template": select_template(clean_query)
+        }
         if context_parts:
-            combined_context = "\n\n".join(context_parts)
-            domain_context = self.domain_focus.get(domain, "")
-            
-            # Enhance query with few-shot template
-            template_enhanced_query = self._enhance_query_with_template(clean_query)
-            enhanced_query = f"{template_enhanced_query}\n\nDomain focus: {domain_context}" if domain_context else template_enhanced_query
-            
-            result = self.rag_pipeline.generate_answer(enhanced_query, combined_context)
-            answer = result.get("answer", "No answer generated")
-            tokens_used = result.get("tokens_used", 0)
-        else:
-            answer = "No relevant data found for the query."
-            tokens_used = 0
+            # Dedupe overlapping chunks and fit the most relevant passages into the token budget
+            with span("context.pack") as s:
+                prepared["combined_context"], prepared["pack_stats"] = self.context_packer.pack(clean_query, context_parts)
+                s.set(**prepared["pack_stats"])
         
+        return prepared
+    
+    def _finish(self, prepared: Dict, answer: str, tokens_used: int, llm_time: float,
+                time_to_first_token: float, llm_stats: Dict = None) -> Dict:
+        """Log the query execution and build the result returned to callers"""
         self.query_count += 1
-        execution_time = (datetime.now() - start_time).total_seconds()
+        execution_time = (datetime.now() - prepared["start_time"]).total_seconds()
+        tools_used = prepared["tools_used"]
+        llm_stats = llm_stats or {}
+        cache_hit = llm_stats.get("cached", False)
+        prompt_stats = {k: llm_stats[k] for k in LOGGED_LLM_FIELDS if k in llm_stats}
         
-        # Log the query execution
-        self.logger.log_query(
-            query=clean_query,
+        query_id = self.logger.log_query(
+            query=prepared["clean_query"],
             tools_used=tools_used,
             execution_time=execution_time,
             answer_length=len(answer),
             tokens_used=tokens_used,
-            domain=domain
+            domain=prepared["domain"],
+            llm_time=llm_time,
+            time_to_first_token=time_to_first_token,
+            cache_hit=cache_hit,
+            llm_tokens_saved=llm_stats.get("tokens_saved", 0),
+            **prompt_stats,
+            **prepared["pack_stats"]
         )
         
         return {
+            "query_id": query_id,
             "answer": answer,
             "tools_used": tools_used,
             "execution_time": execution_time,
-            "context": "\n\n".join(context_parts) if context_parts else "No context available",
-            "domain": domain,
+            "time_to_first_token": time_to_first_token,
+            "cache_hit": cache_hit,
+            "context_premasked": prepared["context_premasked"],
+            "tier": llm_stats.get("tier"),
+            "context": prepared["combined_context"] or "No context available",
+            "domain": prepared["domain"],
             "tools_summary": f"Tools used: {', '.join([f'{tool.upper()}' for tool in tools_used])}"
         }
     
+    def _llm_attributes(self, llm_stats: Dict) -> Dict:
+        return {"tokens": llm_stats.get("tokens_used", 0), "tier": llm_stats.get("tier"),
+                "cache_hit": llm_stats.get("cached", False), "cost_usd": llm_stats.get("cost_usd")}
+    
+    def _flight_key(self, query: str) -> tuple:
+        domain, clean_query = self._parse_query(query)
+        return id(self), domain, normalize(clean_query)
+    
+    def _coalesced_result(self, query: str, result: Dict, start: float) -> Dict:
+        """A result shared from another caller's execution, logged as this caller's own query"""
+        domain, clean_query = self._parse_query(query)
+        waited = round(time.perf_counter() - start, 6)
+        self.query_count += 1
+        query_id = self.logger.log_query(
+            query=clean_query,
+            tools_used=result["tools_used"],
+            execution_time=waited,
+            answer_length=len(result["answer"]),
+            domain=domain,
+            coalesced=True,
+            coalesced_with=result.get("query_id")
+        )
+        return {**result, "query_id": query_id, "execution_time": waited, "coalesced": True}
+    
+    def execute(self, query: str) -> Dict:
+        """Answer a query; identical concurrent queries (same domain and normalised text) share one run"""
+        start = time.perf_counter()
+        result, shared = get_flight("agent.execute").do(self._flight_key(query), self._execute, query)
+        return self._coalesced_result(query, result, start) if shared else result
+    
+    def execute_stream(self, query: str) -> Iterator[Dict]:
+        """Yield token events while the answer streams, then a result event with the same fields as execute
+        
+        Identical concurrent queries follow one run and receive its token events as they arrive."""
+        start = time.perf_counter()
+        events, _ = get_flight("agent.execute_stream").stream(self._flight_key(query),
+                                                              self._execute_stream, query)
+        for event in events:
+            # A follower whose leader stalled runs the query itself and is no longer shared
+            if events.shared and event["type"] == "result":
+                event = {"type": "result", "result": self._coalesced_result(query, event["result"], start)}
+            yield event
+    
+    def _execute(self, query: str) -> Dict:
+        with start_trace("agent.execute"):
+            prepared = self._prepare(query)
+            llm_time, result = 0.0, {}
+            
+            # Generate answer using RAG pipeline
+            if prepared["combined_context"]:
+                with span("llm") as s:
+                    llm_start = time.perf_counter()
+                    result = self.rag_pipeline.generate_answer(prepared["clean_query"], prepared["combined_context"],
+                                                               prepared["domain"], prepared["template"])
+                    llm_time = time.perf_counter() - llm_start
+                    s.set(**self._llm_attributes(result))
+                answer = result.get("answer", "No answer generated")
+                tokens_used = result.get("tokens_used", 0)
+            else:
+                answer = "No relevant data found for the query."
+                tokens_used = 0
+            
+            # Without streaming the first token arrives with the whole answer
+            time_to_first_token = (datetime.now() - prepared["start_time"]).total_seconds()
+            return self._finish(prepared, answer, tokens_used, llm_time, time_to_first_token, result)
+    
+    @isolated
+    def _execute_stream(self, query: str) -> Iterator[Dict]:
+        with start_trace("agent.execute_stream"):
+            prepared = self._prepare(query)
+            llm_time, tokens_used, time_to_first_token = 0.0, 0, None
+            done = {}
+            
+            if prepared["combined_context"]:
+                pieces = []
+                with span("llm", streaming=True) as s:
+                    llm_start = time.perf_counter()
+                    for event in self.rag_pipeline.stream_answer(prepared["clean_query"], prepared["combined_context"],
+                                                                 prepared["domain"], prepared["template"]):
+                        if event["type"] == "token":
+                            if time_to_first_token is None:
+                                time_to_first_token = (datetime.now() - prepared["start_time"]).total_seconds()
+                                s.set(first_token_ms=round((time.perf_counter() - llm_start) * 1000, 1))
+                            pieces.append(event["text"])
+                            yield event
+                        elif event["type"] == "done":
+                            done = event
+                            tokens_used = event.get("tokens_used", 0)
+                    llm_time = time.perf_counter() - llm_start
+                    s.set(**self._llm_attributes(done))
+                answer = "".join(pieces) or "No answer generated"
+            else:
+                answer = "No relevant data found for the query."
+                yield {"type": "token", "text": answer}
+            
+            if time_to_first_token is None:
+                time_to_first_token = (datetime.now() - prepared["start_time"]).total_seconds()
+            result = self._finish(prepared, answer, tokens_used, llm_time, time_to_first_token, done)
+        yield {"type": "result", "result": result}
+    
     def get_metrics(self) -> Dict:
         return {
             "total_queries": self.query_count,
             "supported_domains": list(self.domain_focus.keys()),
-            "agent_available": self.agent is not None
+            "agent_available": self.agent is not None,
+            "coalescing": flight_stats()
         }
\ No newline at end of file
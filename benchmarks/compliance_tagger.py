@@ -0,0 +1,90 @@
+"""ComplianceTagger automaton against the previous per-category regexes
+
+The reference is the former tagger: one alternation regex per category. A secured query
+used to scan the text with get_risk_score and again inside flag_high_risk, so eight regex
+scans; the automaton gives the same tags, counts and flag from one analyze() call. Counts
+are checked for equality on the parsed chunks before timing. --extra-terms pads every
+category with synthetic multi-word terms to show how each side scales with vocabulary size.
+
+    python benchmarks/compliance_tagger.py --extra-terms 0,1000,5000
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from security.compliance_tagger import ComplianceTagger
+
+BASE_TERMS = ComplianceTagger(risk_terms=None).risk_terms
+
+
+def reference_patterns(risk_terms):
+    return {
+        category: re.compile(r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\b', re.IGNORECASE)
+        for category, terms in risk_terms.items()
+    }
+
+
+def reference_secure(patterns, text):
+    """get_risk_score followed by flag_high_risk, as SecureQueryWrapper called them"""
+    for _ in range(2):
+        counts = {c: len(p.findall(text)) for c, p in patterns.items()}
+    return {c: n for c, n in counts.items() if n}
+
+
+def padded_terms(extra: int, rng: random.Random):
+    syllables = "ra ko mi tel sun var os pel dri qua net lum fer zo".split()
+    word = lambda: "".join(rng.choice(syllables) for _ in range(3))
+    return {
+        category: terms + [f"{word()} {word()}" for _ in range(extra // len(BASE_TERMS))]
+        for category, terms in BASE_TERMS.items()
+    }
+
+
+def timed(fn, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            fn(text)
+    return (time.perf_counter() - start) * 1000 / (repeat * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", default="data/unstructured/parsed.jsonl")
+    parser.add_argument("--extra-terms", default="0,1000,5000")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with open(args.chunks, 'r') as f:
+        chunks = [json.loads(line)["text"] for line in f if line.strip()]
+    queries = ["Which customers have active violations and pending litigation?",
+               "Show facilities with a data breach or SEC investigation this quarter"]
+
+    rng = random.Random(0)
+    for extra in (int(n) for n in args.extra_terms.split(",")):
+        terms = padded_terms(extra, rng)
+        patterns = reference_patterns(terms)
+        start = time.perf_counter()
+        tagger = ComplianceTagger(risk_terms=terms)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        mismatches = sum(tagger.analyze(t)["counts"] != reference_secure(patterns, t) for t in chunks + queries)
+        vocabulary = sum(len(t) for t in terms.values())
+        print(f"{vocabulary} terms (automaton built in {build_ms:.1f} ms), mismatches: {mismatches}")
+        for label, texts in (("query", queries), ("chunk", chunks)):
+            before = timed(lambda t: reference_secure(patterns, t), texts, args.repeat)
+            after = timed(tagger.analyze, texts, args.repeat)
+            print(f"  per {label}: regex x8 {before:.4f} ms, automaton {after:.4f} ms ({before / after:.1f}x)")
+        start = time.perf_counter()
+        tagger.score_batch(chunks)
+        print(f"  score_batch over {len(chunks)} chunks: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Latency of unfiltered vs domain-filtered vector search at scale
+
+Loads N synthetic 384-d chunks into a scratch Qdrant collection with the same payload
+indexes ingestion creates, then times unfiltered searches against searches scoped to
+one domain and to one domain + document type. Needs the Qdrant service running.
+
+    python benchmarks/filtered_search.py --n 1000000
+"""
+import argparse
+import sys
+import time
+import numpy as np
+from pathlib import Path
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from retrievers.vector import PAYLOAD_INDEXES, build_filter
+
+DOMAINS = ["Finance", "Biotech", "Energy"]
+DOC_TYPES = ["pdf", "email"]
+
+
+def load(client: QdrantClient, collection: str, n: int, batch: int, rng: np.random.Generator):
+    client.recreate_collection(
+        collection_name=collection,
+        vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE)
+    )
+    for field, schema in PAYLOAD_INDEXES.items():
+        client.create_payload_index(collection, field_name=field, field_schema=schema)
+
+    for start in range(0, n, batch):
+        size = min(batch, n - start)
+        vectors = rng.standard_normal((size, 384), dtype=np.float32)
+        domains = rng.choice(DOMAINS, size=size, p=[0.5, 0.3, 0.2])
+        types = rng.choice(DOC_TYPES, size=size, p=[0.8, 0.2])
+        client.upload_collection(
+            collection_name=collection,
+            vectors=vectors,
+            payload=[{"domain": d, "type": t} for d, t in zip(domains, types)],
+            ids=range(start, start + size)
+        )
+        print(f"\r loaded {start + size:,}/{n:,}", end="", flush=True)
+    print()
+
+
+def time_searches(client, collection, queries, query_filter, top_k):
+    latencies = []
+    for vector in queries:
+        start = time.perf_counter()
+        client.search(collection_name=collection, query_vector=vector.tolist(),
+                      query_filter=query_filter, limit=top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--collection", default="bench_filtered")
+    parser.add_argument("--skip-load", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    client = QdrantClient("localhost", port=6333, timeout=120)
+    if not args.skip_load:
+        load(client, args.collection, args.n, args.batch, rng)
+
+    queries = rng.standard_normal((args.queries, 384), dtype=np.float32)
+    scopes = {
+        "unfiltered": None,
+        "domain=Energy": build_filter(domain="Energy"),
+        "domain=Energy,type=email": build_filter(domain="Energy", doc_type="email")
+    }
+
+    print(f"\n{'scope':<28} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, query_filter in scopes.items():
+        p50, p95 = time_searches(client, args.collection, queries, query_filter, args.top_k)
+        print(f"{name:<28} {p50:>8.2f} {p95:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Recall@k and latency of dense-only, BM25-only and hybrid (RRF) retrieval on parsed.jsonl
+
+Queries are the exact identifiers analysts search for (customer ids, facility ids,
+underscore names); a chunk is relevant when it contains the identifier verbatim.
+Dense search is brute-force cosine over the same embeddings Qdrant would hold, so the
+numbers isolate ranking quality from the vector DB.
+
+    python benchmarks/hybrid_retrieval.py [--k 5] [--candidates 20]
+"""
+import argparse
+import json
+import re
+import sys
+import tempfile
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from retrievers.bm25 import BM25Index, reciprocal_rank_fusion
+from tools.embeddings import embedding_engine
+
+IDENTIFIER_PATTERN = re.compile(r"\b(?:C\d{3}|F\d{3}|[A-Z][A-Za-z]+_[A-Z0-9][A-Za-z0-9]*)\b")
+
+
+def load_chunks(path: Path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def build_queries(chunks):
+    """Identifier -> indexes of chunks containing it"""
+    relevant = {}
+    for i, chunk in enumerate(chunks):
+        for identifier in set(IDENTIFIER_PATTERN.findall(chunk["text"])):
+            relevant.setdefault(identifier, set()).add(i)
+    return relevant
+
+
+def recall_at_k(ranked, relevant, k):
+    hits = len(set(ranked[:k]) & relevant)
+    return hits / min(len(relevant), k)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", default="data/unstructured/parsed.jsonl")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=20)
+    args = parser.parse_args()
+
+    chunks = load_chunks(Path(args.chunks))
+    queries = build_queries(chunks)
+    print(f"{len(chunks)} chunks, {len(queries)} identifier queries")
+
+    if embedding_engine.available:
+        embeddings = embedding_engine.encode([c["text"] for c in chunks])
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    else:
+        print("Embedding model unavailable; reporting BM25 only")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bm25 = BM25Index(Path(tmp) / "bm25")
+        bm25.update(args.chunks)
+        pool = ThreadPoolExecutor(max_workers=2)
+
+        def dense(query):
+            vector = embedding_engine.encode_single(query)
+            scores = embeddings @ (vector / np.linalg.norm(vector))
+            return list(np.argsort(-scores)[:args.candidates])
+
+        def sparse(query):
+            return [hit["point_id"] for hit in bm25.search(query, args.candidates)]
+
+        def hybrid(query):
+            dense_future, sparse_future = pool.submit(dense, query), pool.submit(sparse, query)
+            return [i for i, _ in reciprocal_rank_fusion([dense_future.result(), sparse_future.result()])]
+
+        print(f"\n{'mode':<8} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8}")
+        modes = (("dense", dense), ("bm25", sparse), ("hybrid", hybrid))
+        for name, search in modes if embedding_engine.available else modes[1:2]:
+            recalls, latencies = [], []
+            for query, relevant in queries.items():
+                start = time.perf_counter()
+                ranked = search(query)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(recall_at_k(ranked, relevant, args.k))
+            print(f"{name:<8} {np.mean(recalls):>10.3f} "
+                  f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
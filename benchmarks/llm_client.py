@@ -0,0 +1,82 @@
+"""Throughput and failure rate of the shared LLM client against the local stub server
+
+Fires --calls concurrent chat completions at tools/llm_stub_server.py, which injects
+latency and 429s. First a bare httpx client (no pacing, no retries), then the
+shared rate-limited transport. Starts its own stub unless --base-url is given.
+
+    python benchmarks/llm_client.py --calls 200 --workers 32 --rate-limit 0.2
+"""
+import argparse
+import sys
+import time
+import numpy as np
+import httpx
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from tools.llm_client import RateLimitedTransport
+from tools.llm_stub_server import serve
+
+PAYLOAD = {
+    "model": "gpt-4o-mini",
+    "max_tokens": 400,
+    "messages": [{"role": "user", "content": "Which customers have emission violations? " * 20}]
+}
+
+
+def run(client: httpx.Client, url: str, calls: int, workers: int):
+    def call(_):
+        start = time.perf_counter()
+        try:
+            ok = client.post(url, json=PAYLOAD).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        return ok, (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(call, range(calls)))
+    elapsed = time.perf_counter() - start
+    latencies = [ms for _, ms in results]
+    return sum(ok for ok, _ in results), elapsed, np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=3000)
+    parser.add_argument("--tpm", type=int, default=2_000_000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate-limit", type=float, default=0.2)
+    parser.add_argument("--base-url", help="existing OpenAI-compatible endpoint instead of the built-in stub")
+    args = parser.parse_args()
+
+    if args.base_url:
+        base_url = args.base_url.rstrip("/")
+    else:
+        serve(port=8089, latency=args.latency, rate_limit=args.rate_limit, retry_after=0.2)
+        base_url = "http://127.0.0.1:8089/v1"
+    url = f"{base_url}/chat/completions"
+
+    transport = RateLimitedTransport(max_connections=args.concurrency, max_concurrency=args.concurrency,
+                                     requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+                                     max_retries=5, backoff_base=0.1)
+    clients = {
+        "bare": httpx.Client(timeout=30),
+        "shared": httpx.Client(transport=transport, timeout=30)
+    }
+
+    print(f"{args.calls} calls, {args.workers} callers\n")
+    print(f"{'client':<8} {'ok':>5} {'calls/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for name, client in clients.items():
+        ok, elapsed, p50, p95 = run(client, url, args.calls, args.workers)
+        print(f"{name:<8} {ok:>5} {args.calls / elapsed:>8.1f} {p50:>8.1f} {p95:>8.1f}")
+    print(f"\nshared transport: {transport.stats}")
+
+
+if __name__ == "__main__":
+    main()
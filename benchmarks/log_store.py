@@ -0,0 +1,94 @@
+"""Dashboard cost against log history size: JSONL re-reads vs the DuckDB log store
+
+For each --sizes value a synthetic query log of that many entries is written to a temporary
+directory. The former dashboard path (load_logs parsing every line, then summary and chart
+aggregation in Python) is timed against LogStore: one initial refresh to land the history,
+then the median per-rerun cost over 5 reruns, each after 100 more queries are appended
+(tail + rollup update + dashboard queries).
+
+    python benchmarks/log_store.py --sizes 1000,100000,1000000
+"""
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from dashboards.log_store import LogStore
+
+TOOLS = ["sql", "vector", "graph"]
+DOMAINS = ["Finance", "Energy", "Biotech", "General"]
+
+
+def write_entries(path: Path, count: int, start: datetime, rng: random.Random):
+    with open(path, 'a') as f:
+        for i in range(count):
+            f.write(json.dumps({
+                "timestamp": (start + timedelta(seconds=i * 30)).isoformat(),
+                "query": f"Which customers are high risk? #{i}", "domain": rng.choice(DOMAINS),
+                "tools_used": rng.sample(TOOLS, rng.randint(1, 2)), "execution_time": rng.uniform(0.5, 6),
+                "answer_length": 400, "tokens_used": rng.randint(300, 1500), "query_length": 34,
+                "cache_hit": rng.random() < 0.2, "tier": "full"
+            }) + '\n')
+
+
+def jsonl_dashboard(path: Path):
+    """What a rerun used to cost: parse everything, aggregate in Python"""
+    with open(path, 'r') as f:
+        logs = [json.loads(line) for line in f]
+    today = datetime.now().date()
+    summary = (len(logs), sum(l["execution_time"] for l in logs) / len(logs),
+               sum(1 for l in logs if datetime.fromisoformat(l["timestamp"]).date() == today))
+    daily = Counter(datetime.fromisoformat(l["timestamp"]).date() for l in logs)
+    tools = Counter(t for l in logs for t in l["tools_used"])
+    return summary, daily, tools, [l["execution_time"] for l in logs[-10:]]
+
+
+def store_dashboard(store: LogStore):
+    store.refresh(force=True)
+    return store.summary(), store.daily_counts(), store.tool_counts(), store.recent_times(10)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for size in (int(n) for n in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            log = tmp / "query_log.jsonl"
+            start = datetime.now() - timedelta(seconds=size * 30)
+            write_entries(log, size, start, rng)
+            store = LogStore(db_path=tmp / "logs.duckdb", query_log=log, feedback_log=tmp / "feedback.jsonl")
+
+            t = time.perf_counter()
+            store.refresh(force=True)
+            initial = time.perf_counter() - t
+
+            reruns = []
+            for _ in range(5):
+                write_entries(log, 100, datetime.now(), rng)
+                t = time.perf_counter()
+                summary = store_dashboard(store)[0]
+                reruns.append(time.perf_counter() - t)
+            rerun = sorted(reruns)[len(reruns) // 2]
+
+            t = time.perf_counter()
+            old = jsonl_dashboard(log)
+            before = time.perf_counter() - t
+            assert summary["total_queries"] == old[0][0] == size + 500
+
+            print(f"{size:>9} queries: JSONL rerun {before * 1000:8.1f} ms | store rerun {rerun * 1000:6.1f} ms median "
+                  f"(one-time backfill {initial:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Tier mix, escalation rate, latency and cost of the RAG model cascade, fully offline
+
+Runs a fixed set of lookup and analytic questions over retriever-shaped contexts through
+RAGPipeline twice: cascade on, then cascade off (every answer from the full model).
+Models are served by tools/llm_stub_server.py; --small-confidence sets how sure the
+small model sounds, which drives its escalations. EXTRACTIVE_CASES are checked first:
+questions the extractive tier must answer or refuse; any mismatch exits with status 1.
+
+    python benchmarks/model_cascade.py --small-confidence 0.7
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from collections import Counter
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+RISK_CONTEXT = """**Database Results:**
+Customers ranked by propagated risk score:
+
+1. Natural Gas Solutions (C013) - propagated risk 0.82 [base 0.90, emissions 0.75, graph 0.70, documents 0.40]
+2. Green Power Systems (C004) - propagated risk 0.71 [base 0.80, emissions 0.62, graph 0.55, documents 0.35]
+3. Atlas Refining (C021) - propagated risk 0.58 [base 0.60, emissions 0.50, graph 0.48, documents 0.20]"""
+
+EMISSIONS_CONTEXT = """**Knowledge Graph:**
+Emission violations by facility:
+- Terminal A (F031): Methane 234 kg/day, limit 100 (ratio 2.34)
+- Terminal B (F032): CO2 8,900 tons/month, limit 5,000 (ratio 1.78)
+- Portland Facility (F007): SO2 89 kg/day, limit 50 (ratio 1.78)"""
+
+REPORT_CONTEXT = """**Document Search:**
+**1. pdf_Energy_Sector_Compliance_Report** [pdf] (Score: 0.031)
+   The analysis reveals significant challenges in emission control, with 45% of monitored
+   facilities exceeding regulatory limits for at least one pollutant category."""
+
+SCENARIOS = [
+    ("Which customers are high risk?", RISK_CONTEXT),
+    ("Show customers by propagated risk score", RISK_CONTEXT),
+    ("Find CO2 emissions violations", EMISSIONS_CONTEXT),
+    ("List facilities with methane violations", EMISSIONS_CONTEXT),
+    ("Why are emission violations increasing?", EMISSIONS_CONTEXT + "\n\n" + REPORT_CONTEXT),
+    ("Summarize the compliance report findings", REPORT_CONTEXT),
+    ("Environmental compliance status", REPORT_CONTEXT),
+    ("Compare risk across customers and explain the drivers", RISK_CONTEXT),
+    ("Which customers have the lowest risk?", RISK_CONTEXT),
+    ("What are the total emissions of C013?", RISK_CONTEXT),
+    ("Which customers are not high risk?", RISK_CONTEXT),
+]
+
+# (query, context, whether the extractive tier may answer it from that context)
+EXTRACTIVE_CASES = [
+    ("Which customers have the highest risk?", RISK_CONTEXT, True),
+    ("List facilities with methane violations", EMISSIONS_CONTEXT, True),
+    # The ranking is highest-first
+    ("Which customers have the lowest risk?", RISK_CONTEXT, False),
+    # C013's line is a risk ranking entry, not its emissions
+    ("What are the total emissions of C013?", RISK_CONTEXT, False),
+    ("Which customers are not high risk?", RISK_CONTEXT, False),
+]
+
+
+def check_extractive() -> int:
+    """Print extractive-tier decisions that differ from EXTRACTIVE_CASES; returns how many"""
+    from src.cascade import extractive_answer
+    from config.settings import Settings
+
+    failures = 0
+    for query, context, expected in EXTRACTIVE_CASES:
+        extracted = extractive_answer(query, context)
+        answered = bool(extracted) and extracted["confidence"] >= Settings.CASCADE_EXTRACTIVE_MIN_CONFIDENCE
+        if answered != expected:
+            failures += 1
+            print(f"  unexpected: {query!r} {'answered' if answered else 'refused'} extractively")
+    print(f"extractive tier: {len(EXTRACTIVE_CASES) - failures}/{len(EXTRACTIVE_CASES)} cases as expected\n")
+    return failures
+
+
+def run(pipeline, rounds: int):
+    tiers, latencies, costs, reasons = Counter(), [], [], Counter()
+    for _ in range(rounds):
+        for query, context in SCENARIOS:
+            start = time.perf_counter()
+            result = pipeline.generate_answer(query, context, "Energy")
+            latencies.append((time.perf_counter() - start) * 1000)
+            tiers[result.get("tier")] += 1
+            costs.append(result.get("cost_usd", 0.0))
+            if len(result.get("tiers_tried", [])) > 1 and result.get("escalation_reason"):
+                reasons[result["escalation_reason"]] += 1
+    return tiers, latencies, costs, reasons
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="stub full-model latency in seconds")
+    parser.add_argument("--small-confidence", type=float, default=0.9)
+    parser.add_argument("--full-model", default="ft:gpt-4o-mini-2024-07-18:compass")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so point everything at the stub first
+    os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:8092/v1"
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    from tools.llm_stub_server import serve
+    from src.rag import RAGPipeline
+    from config.settings import Settings
+
+    if check_extractive():
+        sys.exit(1)
+
+    serve(port=8092, latency=args.latency, rate_limit=0.0, confidence=0.95,
+          model_confidence={Settings.CASCADE_SMALL_MODEL: args.small_confidence})
+
+    pipeline = RAGPipeline("stub-key")
+    pipeline.model = args.full_model
+    pipeline.small_model = Settings.CASCADE_SMALL_MODEL
+
+    print(f"{len(SCENARIOS) * args.rounds} answers, small model confidence {args.small_confidence}\n")
+    print(f"{'mode':<9} {'extract':>8} {'small':>6} {'full':>5} {'escalated %':>12} {'p50 ms':>8} {'cost $':>10}")
+    for mode, enabled in (("cascade", True), ("full", False)):
+        pipeline.cascade = enabled
+        tiers, latencies, costs, reasons = run(pipeline, args.rounds)
+        total = sum(tiers.values())
+        escalated = sum(reasons.values())
+        print(f"{mode:<9} {tiers['extractive']:>8} {tiers['small']:>6} {tiers['full']:>5} "
+              f"{100 * escalated / total:>12.1f} {np.percentile(latencies, 50):>8.1f} {sum(costs):>10.6f}")
+        if reasons:
+            print(f"          escalation reasons: {dict(reasons)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Throughput of PIIFilter masking on MB-sized inputs against the previous multi-pass version
+
+The reference implementation below is the former mask_pii: one re.findall per type, then a
+full-string str.replace per match. Inputs are synthetic report text with SSNs, emails and
+phone numbers mixed in at --density matches per KB. Masked output and counts are checked
+for equality before timing.
+
+    python benchmarks/pii_masking.py --sizes 1,4,16 --density 2
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from security.pii_filter import PIIFilter
+
+WORDS = ("facility emission report methane violation customer compliance audit quarterly "
+         "terminal pipeline threshold exceeded regulatory monitoring station").split()
+
+
+def reference_mask(patterns, text):
+    masked_text = text
+    pii_counts = {}
+    ssn_matches = re.findall(patterns['ssn'], text)
+    for ssn in ssn_matches:
+        masked_text = masked_text.replace(ssn, f"XXX-XX-{ssn[-4:]}")
+    pii_counts['ssn'] = len(ssn_matches)
+    email_matches = re.findall(patterns['email'], text)
+    for email in email_matches:
+        masked_text = masked_text.replace(email, f"{email.split('@')[0][:2]}***@***.***")
+    pii_counts['email'] = len(email_matches)
+    phone_matches = re.findall(patterns['phone'], text)
+    for phone in phone_matches:
+        masked_text = masked_text.replace(phone, "(XXX) XXX-XXXX")
+    pii_counts['phone'] = len(phone_matches)
+    return masked_text, pii_counts
+
+
+def synthetic(size_mb: float, density: float, rng: random.Random) -> str:
+    pii = [
+        lambda: f"{rng.randint(100, 899)}-{rng.randint(10, 99)}-{rng.randint(1000, 9999)}",
+        lambda: f"{rng.choice(['ops', 'j.doe', 'compliance'])}{rng.randint(1, 999)}@example.com",
+        lambda: f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"
+    ]
+    target = int(size_mb * 1024 * 1024)
+    parts, length = [], 0
+    while length < target:
+        words = [rng.choice(WORDS) for _ in range(int(1024 / 7 / density))]
+        words.append(rng.choice(pii)())
+        chunk = " ".join(words) + ". "
+        parts.append(chunk)
+        length += len(chunk)
+    return "".join(parts)
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1,4,16", help="input sizes in MB")
+    parser.add_argument("--density", type=float, default=2.0, help="PII matches per KB")
+    parser.add_argument("--chunk", type=int, default=4096, help="chunk size for the batch and stream APIs")
+    parser.add_argument("--skip-reference", action="store_true", help="reference is quadratic; skip on big inputs")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pii_filter = PIIFilter()
+    print(f"{'MB':>5} {'matches':>8} {'reference s':>12} {'single-pass s':>14} {'MB/s':>7} "
+          f"{'batch MB/s':>11} {'stream MB/s':>12}")
+    for size in (float(s) for s in args.sizes.split(",")):
+        text = synthetic(size, args.density, rng)
+        chunks = [text[i:i + args.chunk] for i in range(0, len(text), args.chunk)]
+
+        single_s, (masked, counts) = timed(lambda: pii_filter.mask_pii(text))
+        if args.skip_reference:
+            ref_s = float("nan")
+        else:
+            ref_s, (ref_masked, ref_counts) = timed(lambda: reference_mask(pii_filter.patterns, text), repeat=1)
+            assert ref_masked == masked and ref_counts == counts, "single-pass output differs from reference"
+        batch_s, _ = timed(lambda: pii_filter.mask_batch(chunks))
+        stream_s, streamed = timed(lambda: "".join(pii_filter.mask_stream(chunks)))
+        assert streamed == masked, "streamed output differs from single-pass output"
+
+        mb = len(text) / 1024 / 1024
+        print(f"{mb:>5.1f} {sum(counts.values()):>8,} {ref_s:>12.2f} {single_s:>14.3f} {mb / single_s:>7.1f} "
+              f"{mb / batch_s:>11.1f} {mb / stream_s:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Query-time PII scanning CPU with and without ingest-time pre-masking
+
+Builds query contexts the way the agent does (top-k chunks from parsed.jsonl plus a
+database section), then runs SecureQueryWrapper's post-processing on each: once as
+before (answer and context both scanned) and once with the context flagged as
+pre-masked (answer only). CPU time is process time, so waiting does not count.
+
+    python benchmarks/pii_premask.py --queries 500 --top-k 5
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from security.security_wrapper import SecureQueryWrapper
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", default="data/unstructured/parsed.jsonl")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.chunks, 'r') as f:
+        chunks = [json.loads(line)["text"] for line in f if line.strip()]
+    rng = random.Random(0)
+    contexts = [
+        "**Document Search:**\n" + "\n\n".join(rng.sample(chunks, min(args.top_k, len(chunks))))
+        for _ in range(args.queries)
+    ]
+    answer = "- Natural Gas Solutions (C013): 6 active violations, propagated risk 0.82\n" * 8
+
+    wrapper = SecureQueryWrapper(agent=None)
+    timings = {}
+    for premasked in (False, True):
+        start = time.process_time()
+        for context in contexts:
+            wrapper._secure_result({"answer": answer, "context": context, "context_premasked": premasked},
+                                   wrapper.compliance_tagger.analyze("Which customers are high risk?"))
+        timings[premasked] = (time.process_time() - start) * 1000 / len(contexts)
+
+    chars = sum(len(c) for c in contexts) / len(contexts)
+    print(f"{args.queries} queries, {chars:,.0f} context chars each")
+    print(f"scan answer + context: {timings[False]:.3f} ms CPU/query")
+    print(f"scan answer only:      {timings[True]:.3f} ms CPU/query")
+    print(f"saved:                 {timings[False] - timings[True]:.3f} ms CPU/query "
+          f"({100 * (1 - timings[True] / timings[False]):.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
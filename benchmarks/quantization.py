@@ -0,0 +1,116 @@
+"""Memory, recall@10 and latency for each vector storage mode (none, int8, binary)
+
+Each mode gets its own scratch Qdrant collection built through ensure_collection, so the
+numbers reflect exactly what ingestion deploys. RAM and disk are the segment usage Qdrant
+reports in its telemetry once the collection is optimized, scaled to 1M vectors; if the
+server does not report it, the row shows the per-vector arithmetic instead, marked as an
+estimate. Ground truth is brute-force cosine over the same vectors. Pass --embeddings with a saved (N, 384) .npy of real chunk embeddings for
+representative recall; random clustered vectors are used otherwise. Needs Qdrant running.
+
+    python benchmarks/quantization.py --n 200000 --oversampling 3
+"""
+import argparse
+import sys
+import time
+import httpx
+import numpy as np
+from pathlib import Path
+from typing import Optional, Tuple
+from qdrant_client import QdrantClient
+from qdrant_client.models import CollectionStatus
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from retrievers.vector import ensure_collection, search_params
+
+DIM = 384
+
+# Estimated bytes per vector, used only when telemetry has no segment usage: quantized modes
+# hold the codes in RAM and keep the float32 originals on disk for rescoring
+EST_RAM_BYTES = {"none": DIM * 4, "int8": DIM, "binary": DIM // 8}
+EST_DISK_BYTES = {"none": 0, "int8": DIM * 4, "binary": DIM * 4}
+
+
+def synthetic(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Clustered unit vectors, closer to sentence embeddings than isotropic noise"""
+    centers = rng.standard_normal((64, DIM), dtype=np.float32)
+    vectors = centers[rng.integers(0, 64, n)] + 0.6 * rng.standard_normal((n, DIM), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def segment_usage(host: str, port: int, collection: str) -> Optional[Tuple[int, int]]:
+    """(RAM bytes, disk bytes) Qdrant reports across the collection's local segments"""
+    response = httpx.get(f"http://{host}:{port}/telemetry", params={"details_level": 10}, timeout=60)
+    response.raise_for_status()
+    for telemetry in response.json()["result"].get("collections", {}).get("collections", []):
+        if telemetry.get("id") != collection:
+            continue
+        infos = [segment.get("info", {}) for shard in telemetry.get("shards", [])
+                 for segment in (shard.get("local") or {}).get("segments", [])]
+        if infos and all("ram_usage_bytes" in i and "disk_usage_bytes" in i for i in infos):
+            return sum(i["ram_usage_bytes"] for i in infos), sum(i["disk_usage_bytes"] for i in infos)
+    return None
+
+
+def wait_optimized(client: QdrantClient, collection: str, timeout: float = 1800):
+    """Block until indexing and quantization finish, so usage reflects the deployed layout"""
+    deadline = time.monotonic() + timeout
+    while client.get_collection(collection).status != CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{collection} still optimizing after {timeout:.0f}s")
+        time.sleep(1)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--oversampling", type=float, default=3.0)
+    parser.add_argument("--embeddings", help="optional .npy of real embeddings")
+    parser.add_argument("--modes", default="none,int8,binary")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = np.load(args.embeddings) if args.embeddings else synthetic(args.n, rng)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+
+    host, port = "localhost", 6333
+    client = QdrantClient(host, port=port, timeout=300)
+
+    print(f"{len(vectors):,} vectors, oversampling {args.oversampling}\n")
+    print(f"{'mode':<8} {'RAM MB/1M':>10} {'disk MB/1M':>11} {'memory':>9} {'recall@10':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in args.modes.split(","):
+        collection = f"bench_quant_{mode}"
+        if client.collection_exists(collection):
+            client.delete_collection(collection)
+        ensure_collection(client, collection, mode)
+        client.upload_collection(collection_name=collection, vectors=vectors,
+                                 ids=range(len(vectors)), batch_size=2048)
+        wait_optimized(client, collection)
+
+        # Bytes per vector equal MB per 1M vectors
+        usage = segment_usage(host, port, collection)
+        if usage is not None:
+            ram, disk, source = usage[0] / len(vectors), usage[1] / len(vectors), "measured"
+        else:
+            ram, disk, source = EST_RAM_BYTES[mode], EST_DISK_BYTES[mode], "estimate"
+
+        params = search_params(mode, args.oversampling)
+        recalls, latencies = [], []
+        for query, expected in zip(queries, truth):
+            start = time.perf_counter()
+            hits = client.search(collection_name=collection, query_vector=query.tolist(),
+                                 search_params=params, limit=10)
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len({hit.id for hit in hits} & set(expected.tolist())) / 10)
+
+        print(f"{mode:<8} {ram:>10,.0f} {disk:>11,.0f} {source:>9} {np.mean(recalls):>10.3f} "
+              f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f}")
+        client.delete_collection(collection)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Request-path cost of QueryLogger and multi-process safety of the background JSONL writer
+
+Part 1 times log_query as the request path sees it: the former synchronous open/append/close
+against JSONLWriter.write (enqueue only), reporting p50/p99 microseconds per call.
+Part 2 starts --processes writers appending to one file with a small size limit so rotation
+and gzip happen mid-run, then checks every line in every file parses and none are missing.
+
+    python benchmarks/query_logger.py --calls 20000 --processes 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from logs.jsonl_writer import JSONLWriter, log_files, open_log
+
+
+def entry(i: int, pid: int = 0) -> dict:
+    return {"timestamp": datetime.now().isoformat(), "query": f"Which customers are high risk? #{i}",
+            "pid": pid, "seq": i, "domain": "Energy", "tools_used": ["sql", "vector"],
+            "execution_time": 1.234, "answer_length": 512, "tokens_used": 900, "query_length": 34}
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def synchronous(path: Path, calls: int):
+    timings = []
+    for i in range(calls):
+        record = entry(i)
+        start = time.perf_counter()
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def buffered(path: Path, calls: int):
+    writer = JSONLWriter(path, max_bytes=0)
+    timings = []
+    for i in range(calls):
+        record = entry(i)
+        start = time.perf_counter()
+        writer.write(record)
+        timings.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    writer.close()
+    return timings, time.perf_counter() - start, writer.stats
+
+
+def worker(path: str, calls: int, max_bytes: int):
+    writer = JSONLWriter(path, max_bytes=max_bytes, flush_interval=0.01)
+    for i in range(calls):
+        while not writer.write(entry(i, os.getpid())):
+            time.sleep(0.001)
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--max-bytes", type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        sync_p50, sync_p99 = percentiles(synchronous(tmp / "sync.jsonl", args.calls))
+        timings, drain, stats = buffered(tmp / "buffered.jsonl", args.calls)
+        buf_p50, buf_p99 = percentiles(timings)
+        print(f"{args.calls} log_query calls")
+        print(f"  synchronous append: p50 {sync_p50:.1f} us, p99 {sync_p99:.1f} us")
+        print(f"  background writer:  p50 {buf_p50:.1f} us, p99 {buf_p99:.1f} us "
+              f"({stats['batches']} batches, {drain * 1000:.0f} ms to drain at close)")
+
+        path = tmp / "shared.jsonl"
+        procs = [multiprocessing.Process(target=worker, args=(str(path), args.calls, args.max_bytes))
+                 for _ in range(args.processes)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        files = log_files(path)
+        seen, bad = set(), 0
+        for f in files:
+            with open_log(f) as lines:
+                for line in lines:
+                    try:
+                        record = json.loads(line)
+                        seen.add((record["pid"], record["seq"]))
+                    except (ValueError, KeyError):
+                        bad += 1
+        expected = args.processes * args.calls
+        print(f"{args.processes} processes x {args.calls} entries into one log: {len(files)} files "
+              f"({sum(f.suffix == '.gz' for f in files)} gzipped), {len(seen)}/{expected} entries, "
+              f"{bad} corrupt lines")
+
+
+if __name__ == "__main__":
+    main()
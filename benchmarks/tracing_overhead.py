@@ -0,0 +1,56 @@
+"""Per-span cost of tools.tracing, disabled and enabled
+
+A query opens about a dozen spans (security pre/post, parse, route, one per tool, context
+packing, LLM tiers, vector dense/BM25). This times a root trace with --spans child spans,
+each setting two attributes, with TRACING_ENABLED off and on, and the bare loop for reference.
+Log writing and OTLP export are left out; they happen once per trace on the writer thread.
+
+    python benchmarks/tracing_overhead.py --traces 20000 --spans 12
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import Settings
+from tools.tracing import span, start_trace
+
+
+def run(traces: int, spans: int, traced: bool) -> float:
+    Settings.TRACING_ENABLED = traced
+    Settings.TRACE_EXPORT_PATH = None
+    start = time.perf_counter()
+    for _ in range(traces):
+        with start_trace("query"):
+            for i in range(spans):
+                with span("stage") as s:
+                    s.set(hits=i, cache_hit=False)
+    return (time.perf_counter() - start) / traces * 1e6
+
+
+def baseline(traces: int, spans: int) -> float:
+    start = time.perf_counter()
+    for _ in range(traces):
+        for i in range(spans):
+            pass
+    return (time.perf_counter() - start) / traces * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--traces", type=int, default=20000)
+    parser.add_argument("--spans", type=int, default=12)
+    args = parser.parse_args()
+
+    bare = baseline(args.traces, args.spans)
+    disabled = run(args.traces, args.spans, traced=False)
+    enabled = run(args.traces, args.spans, traced=True)
+    print(f"{args.spans} spans per query")
+    print(f"  tracing disabled: {disabled - bare:6.2f} us/query ({(disabled - bare) / args.spans * 1000:.0f} ns/span)")
+    print(f"  tracing enabled:  {enabled - bare:6.2f} us/query ({(enabled - bare) / args.spans * 1000:.0f} ns/span)")
+
+
+if __name__ == "__main__":
+    main()
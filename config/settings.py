@@ -7,11 +7,46 @@ class Settings:
     # OpenAI
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     FINE_TUNED_MODEL = os.getenv("FINE_TUNED_MODEL")
+    OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+    
+    # Shared LLM client: connection pool, in-flight cap, provider limits, per-attempt timeout
+    LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 16))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 500))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 200000))
+    LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 30))
+    LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 4))
+    
+    # Seconds a coalesced call waits without hearing from the shared execution before running its own
+    COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", 120))
+    
+    # Model cascade: extractive answer, then the small model, then model.txt / gpt-4o-mini
+    CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "true").lower() == "true"
+    CASCADE_SMALL_MODEL = os.getenv("CASCADE_SMALL_MODEL", "gpt-4o-mini")
+    CASCADE_EXTRACTIVE_MIN_CONFIDENCE = float(os.getenv("CASCADE_EXTRACTIVE_MIN_CONFIDENCE", 0.8))
+    CASCADE_MIN_CONFIDENCE = float(os.getenv("CASCADE_MIN_CONFIDENCE", 0.85))
+    CASCADE_MIN_GROUNDING = float(os.getenv("CASCADE_MIN_GROUNDING", 0.8))
+    
+    # Persistent exact-match LLM response cache (TTL in seconds, 0 disables expiry)
+    LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/index/llm_cache.sqlite")
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 5000))
+    LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 86400))
+    
+    # Compliance tagger vocabulary: JSON {category: [terms]} replacing the built-in terms
+    COMPLIANCE_TERMS_PATH = os.getenv("COMPLIANCE_TERMS_PATH") or None
     
     # Vector DB
     QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
     QDRANT_PORT = int(os.getenv("QDRANT_PORT", 6333))
     
+    # Vector storage: none (float32 in RAM), int8 or binary; quantized modes keep originals on disk
+    VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none")
+    VECTOR_OVERSAMPLING = float(os.getenv("VECTOR_OVERSAMPLING", 3.0))
+    
+    # Maximum tokens of retrieved context sent with each RAG call
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+    
     # Graph DB
     NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
     NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
@@ -20,6 +55,45 @@ class Settings:
     # Embedding model
     EMBEDDING_MODEL = "all-MiniLM-L6-v2"
     
+    # Tool router classifier (trained by src/router.py): per-tool recall target for thresholds, and the
+    # probability below which a tool named by a query keyword is still skipped
+    ROUTER_MODEL_PATH = os.getenv("ROUTER_MODEL_PATH", "data/index/router.npz")
+    ROUTER_MIN_RECALL = float(os.getenv("ROUTER_MIN_RECALL", 0.95))
+    ROUTER_VETO_PROBABILITY = float(os.getenv("ROUTER_VETO_PROBABILITY", 0.05))
+    
+    # Learned routing policy (src/routing_policy.py): a tool is skipped for a domain and query cluster only
+    # when it takes at least POLICY_MIN_LATENCY seconds and adds little to positively rated answers
+    ROUTING_POLICY_PATH = os.getenv("ROUTING_POLICY_PATH", "data/index/routing_policy.json")
+    POLICY_MIN_LATENCY = float(os.getenv("POLICY_MIN_LATENCY", 0.5))
+    POLICY_MIN_CONTRIBUTION = float(os.getenv("POLICY_MIN_CONTRIBUTION", 0.3))
+    POLICY_MIN_SUPPORT = int(os.getenv("POLICY_MIN_SUPPORT", 20))
+    
+    # Cache warm-up (src/warmup.py): quick actions plus the WARMUP_TOP_QUERIES most frequent logged queries,
+    # run in the background at start-up and whenever the source data version changes (checked every
+    # WARMUP_CHECK_INTERVAL seconds), at most WARMUP_CONCURRENCY at a time on threads niced by WARMUP_NICE
+    WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    WARMUP_TOP_QUERIES = int(os.getenv("WARMUP_TOP_QUERIES", 20))
+    WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", 2))
+    WARMUP_NICE = int(os.getenv("WARMUP_NICE", 10))
+    WARMUP_CHECK_INTERVAL = float(os.getenv("WARMUP_CHECK_INTERVAL", 300))
+    WARMUP_REPORT_PATH = os.getenv("WARMUP_REPORT_PATH", "data/index/warmup.json")
+    
+    # Query/feedback logs: background writer queue, batch delay (s), rotation by size and/or period (s)
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+    LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 0.2))
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 50 * 1024 * 1024))
+    LOG_ROTATE_INTERVAL = float(os.getenv("LOG_ROTATE_INTERVAL", 0))
+    LOG_COMPRESS = os.getenv("LOG_COMPRESS", "true").lower() == "true"
+    
+    # Per-stage tracing; spans go into each query log entry and, when a path is set, OTLP/JSON lines
+    TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+    TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH") or None
+    TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "allyin-compass")
+    
+    # Prometheus /metrics endpoint started by the dashboard (0 = off)
+    METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    
     # Data paths
     DATA_STRUCTURED = "data/structured"
     DATA_UNSTRUCTURED = "data/unstructured"
@@ -0,0 +1,97 @@
+import math
+from typing import Dict, Iterable, List, Sequence
+
+# Relative error of any quantile estimate; bucket i covers (GAMMA^(i-1), GAMMA^i]
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+# Values at or below MIN_VALUE (zero latency, zero tokens) share one bucket
+MIN_VALUE = 1e-9
+ZERO_BUCKET = -(2 ** 31)
+
+# Same bucketing as bucket_index(), for computing bucket ids inside DuckDB
+BUCKET_SQL = (f"CASE WHEN {{value}} <= {MIN_VALUE} THEN {ZERO_BUCKET} "
+              f"ELSE CAST(ceil(ln({{value}}) / {math.log(GAMMA)!r}) AS INTEGER) END")
+
+
+def bucket_index(value: float) -> int:
+    if value <= MIN_VALUE:
+        return ZERO_BUCKET
+    return math.ceil(math.log(value) / math.log(GAMMA))
+
+
+def bucket_value(index: int) -> float:
+    """Estimate for every value in a bucket, within RELATIVE_ACCURACY of each of them"""
+    if index == ZERO_BUCKET:
+        return 0.0
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+
+class LogHistogram:
+    """Log-bucketed histogram: sparse bucket counts plus the exact count and sum
+
+    Buckets are fixed by GAMMA, so histograms recorded separately (per day, per domain,
+    in another process) merge by adding counts, and quantiles of the merge are as accurate
+    as those of a single histogram."""
+
+    def __init__(self, buckets: Dict[int, int] = None, total: float = 0.0):
+        self.buckets: Dict[int, int] = dict(buckets or {})
+        self.count = sum(self.buckets.values())
+        self.total = total
+
+    def add(self, value: float, count: int = 1):
+        index = bucket_index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+
+    def merge(self, other: "LogHistogram") -> "LogHistogram":
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    @classmethod
+    def merged(cls, histograms: Iterable["LogHistogram"]) -> "LogHistogram":
+        result = cls()
+        for histogram in histograms:
+            result.merge(histogram)
+        return result
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantiles(self, qs: Sequence[float]) -> List[float]:
+        """Estimates for several quantiles in one walk over the sorted buckets"""
+        if not self.count:
+            return [0.0] * len(qs)
+        ranks = sorted((q * (self.count - 1), i) for i, q in enumerate(qs))
+        results, seen, r = [0.0] * len(qs), 0, 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            while r < len(ranks) and ranks[r][0] < seen:
+                results[ranks[r][1]] = bucket_value(index)
+                r += 1
+        return results
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles([q])[0]
+
+    def cumulative(self, bounds: Sequence[float]) -> List[int]:
+        """Count of values at or below each bound (ascending), as Prometheus histogram buckets"""
+        counts, seen, b = [], 0, 0
+        for index in sorted(self.buckets):
+            value = bucket_value(index)
+            while b < len(bounds) and value > bounds[b]:
+                counts.append(seen)
+                b += 1
+            seen += self.buckets[index]
+        return counts + [seen] * (len(bounds) - len(counts))
+
+    def to_dict(self) -> Dict:
+        return {"buckets": {str(k): v for k, v in self.buckets.items()}, "total": self.total}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LogHistogram":
+        return cls({int(k): v for k, v in data.get("buckets", {}).items()}, data.get("total", 0.0))
@@ -0,0 +1,414 @@
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Sequence
+
+import duckdb
+import pandas as pd
+
+from dashboards.histograms import BUCKET_SQL, LogHistogram
+from logs.jsonl_writer import log_files
+
+# Rows kept in recent_queries for the response-time chart
+RECENT_QUERIES = 100
+
+# Copies kept next to db_path for processes that find it locked; each keeps its own log offsets
+READER_COPIES = 4
+
+# Histogram samples (metric, dimension, key, value) drawn from a table shaped like queries.
+# Latencies are in seconds; stage durations come from the spans of traced entries.
+HISTOGRAM_SAMPLES = """
+    SELECT day, 'query_latency' AS metric, 'domain' AS dimension, domain AS key, execution_time AS value
+    FROM {source}
+    UNION ALL
+    SELECT day, 'query_latency', 'tool', tool, execution_time
+    FROM (SELECT day, execution_time, unnest(tools) AS tool FROM {source})
+    UNION ALL
+    SELECT day, 'stage_latency', 'stage', span->>'name', TRY_CAST(span->>'duration_ms' AS DOUBLE) / 1000
+    FROM (SELECT day, unnest(coalesce(TRY_CAST(entry->'spans' AS JSON[]), [])) AS span FROM {source})
+    UNION ALL
+    SELECT day, 'tokens', 'domain', domain, tokens_used FROM {source}
+    UNION ALL
+    SELECT day, 'cost_usd', 'domain', domain, TRY_CAST(entry->>'cost_usd' AS DOUBLE) FROM {source}"""
+
+
+class LogStore:
+    """DuckDB copy of the JSONL query and feedback logs with rollups the dashboard reads
+
+    refresh() tails every log file from the byte offset it reached last time, so its cost
+    depends on what was appended since (files are recognised by a hash of their first line,
+    so rotation and gzip do not cause re-reads), and folds the new rows into per-day rollups by
+    domain and by tool, and into per-day log-bucketed histograms of latency (per domain, tool
+    and pipeline stage), tokens and cost. Dashboard queries only touch the rollups and a short
+    recent-queries table, so they cost the same for a thousand logged queries as for ten million.
+
+    DuckDB lets one process open a database file, even read-only. When another process (usually
+    the app) holds db_path, this store opens the first free of READER_COPIES persistent copies
+    next to it (logs.reader1.duckdb, ...) and lands the logs there, so offline tools (router and
+    routing-policy training, warm-up reports, the fine-tuning notebook) and further app
+    processes get the same answers while the app runs. The copy is not free: the first process
+    to use a copy reads the whole JSONL history into it, which costs as much as the app's first
+    start; later users of that copy only tail what was appended since. If every copy is in use,
+    the logs go into a temporary database removed at exit, which reads the full history each time."""
+
+    def __init__(self, db_path: str = "data/index/logs.duckdb", query_log: str = "logs/query_log.jsonl",
+                 feedback_log: str = "feedback/feedback.jsonl", refresh_interval: float = 2.0):
+        self.db_path = Path(db_path)
+        self.logs = {"queries": Path(query_log), "feedback": Path(feedback_log)}
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self._db = None
+        self._refreshed = 0.0
+        self._fingerprints = {}
+        # Set when db_path was locked by another process and a private copy is used instead
+        self.private_path = None
+
+    def _open(self) -> duckdb.DuckDBPyConnection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        copies = [self.db_path.with_name(f"{self.db_path.stem}.reader{i}{self.db_path.suffix}")
+                  for i in range(1, READER_COPIES + 1)]
+        for path in [self.db_path, *copies]:
+            try:
+                db = duckdb.connect(str(path))
+            except duckdb.IOException as e:
+                if "lock" not in str(e).lower():
+                    raise
+                continue
+            if path != self.db_path:
+                self.private_path = path
+                print(f" {self.db_path} is in use by another process; landing logs into {path}")
+            return db
+        fd, path = tempfile.mkstemp(prefix="logs-", suffix=".duckdb")
+        os.close(fd)
+        os.unlink(path)
+        self.private_path = Path(path)
+        atexit.register(self._remove_private)
+        print(f" {self.db_path} and its reader copies are in use; landing all logs into {self.private_path}")
+        return duckdb.connect(path)
+
+    def _remove_private(self):
+        if self._db is not None:
+            self._db.close()
+        for suffix in ("", ".wal"):
+            Path(f"{self.private_path}{suffix}").unlink(missing_ok=True)
+
+    def _connect(self) -> duckdb.DuckDBPyConnection:
+        if self._db is None:
+            db = self._open()
+            db.execute("""CREATE TABLE IF NOT EXISTS log_offsets (
+                fingerprint VARCHAR PRIMARY KEY, name VARCHAR, log VARCHAR, byte_offset BIGINT, complete BOOLEAN)""")
+            db.execute("""CREATE TABLE IF NOT EXISTS queries (
+                ts TIMESTAMP, day DATE, query VARCHAR, domain VARCHAR, tools VARCHAR[],
+                execution_time DOUBLE, answer_length BIGINT, tokens_used BIGINT, cache_hit BOOLEAN, entry JSON,
+                query_id VARCHAR)""")
+            db.execute("""CREATE TABLE IF NOT EXISTS feedback (
+                ts TIMESTAMP, day DATE, query VARCHAR, rating INTEGER, query_id VARCHAR, domain VARCHAR,
+                answer VARCHAR)""")
+            db.execute("""CREATE TABLE IF NOT EXISTS daily_rollup (
+                day DATE, domain VARCHAR, queries BIGINT, total_time DOUBLE, tokens BIGINT, cache_hits BIGINT,
+                PRIMARY KEY (day, domain))""")
+            db.execute("""CREATE TABLE IF NOT EXISTS tool_rollup (
+                day DATE, tool VARCHAR, domain VARCHAR, uses BIGINT, total_time DOUBLE,
+                PRIMARY KEY (day, tool, domain))""")
+            db.execute("""CREATE TABLE IF NOT EXISTS feedback_rollup (
+                day DATE PRIMARY KEY, positive BIGINT, negative BIGINT)""")
+            db.execute("CREATE TABLE IF NOT EXISTS recent_queries AS SELECT * FROM queries LIMIT 0")
+            # Stores created before query ids were logged gain the new columns (empty for old queries);
+            # feedback is landed again from the start so that its answers are kept
+            if not db.execute("SELECT count(*) FROM information_schema.columns "
+                              "WHERE table_name = 'feedback' AND column_name = 'answer'").fetchone()[0]:
+                for table in ("feedback", "feedback_rollup"):
+                    db.execute(f"DELETE FROM {table}")
+                db.execute("DELETE FROM log_offsets WHERE log = 'feedback'")
+            for table, column in (("queries", "query_id"), ("recent_queries", "query_id"),
+                                  ("feedback", "query_id"), ("feedback", "domain"), ("feedback", "answer")):
+                db.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} VARCHAR")
+            db.execute("CREATE INDEX IF NOT EXISTS queries_query_id ON queries (query_id)")
+            db.execute("CREATE INDEX IF NOT EXISTS feedback_query_id ON feedback (query_id)")
+            counted = db.execute("SELECT count(*) FROM information_schema.tables "
+                                 "WHERE table_name = 'feedback_counts'").fetchone()[0]
+            db.execute("""CREATE TABLE IF NOT EXISTS feedback_counts (
+                domain VARCHAR PRIMARY KEY, positive BIGINT, negative BIGINT)""")
+            if not counted:
+                self._count_feedback(db, "feedback")
+            backfill = not db.execute("SELECT count(*) FROM information_schema.tables "
+                                      "WHERE table_name = 'histogram_buckets'").fetchone()[0]
+            db.execute("""CREATE TABLE IF NOT EXISTS histogram_buckets (
+                day DATE, metric VARCHAR, dimension VARCHAR, key VARCHAR, bucket INTEGER, samples BIGINT,
+                total DOUBLE, PRIMARY KEY (day, metric, dimension, key, bucket))""")
+            if backfill:
+                # Stores created before histograms existed get them from the queries already landed
+                self._add_histograms(db, "queries")
+            self._db = db
+        return self._db
+
+    def _fingerprint(self, path: Path, st: os.stat_result) -> str:
+        """Hash of a file's first line: survives rotation renames and gzip, unlike name or inode"""
+        key = (path.name, st.st_size, st.st_mtime_ns)
+        if key not in self._fingerprints:
+            opener = gzip.open if path.suffix == ".gz" else open
+            with opener(path, 'rb') as f:
+                first = f.readline()
+            if not first.endswith(b"\n"):
+                return None
+            self._fingerprints[key] = hashlib.sha1(first).hexdigest()
+        return self._fingerprints[key]
+
+    def _read_new(self, path: Path, offset: int) -> tuple:
+        """Complete lines after offset (in uncompressed bytes) and the offset just past them"""
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        return data[:end], offset + end
+
+    def _tail(self, db, log: str) -> Path:
+        """Write every not yet landed line of a log to one NDJSON scratch file; None when there are none"""
+        path = self.logs[log]
+        # Next to the database actually open, so a private copy never shares the app's scratch file
+        base = self.private_path or self.db_path
+        scratch = base.with_name(f".{base.stem}.{log}.ndjson")
+        pending = 0
+        with open(scratch, 'wb') as out:
+            for f in log_files(path):
+                try:
+                    st = f.stat()
+                    fingerprint = self._fingerprint(f, st)
+                except (FileNotFoundError, OSError, EOFError):
+                    continue
+                if fingerprint is None:
+                    continue
+                row = db.execute("SELECT byte_offset, complete FROM log_offsets WHERE fingerprint = ?",
+                                 [fingerprint]).fetchone()
+                offset, complete = row or (0, False)
+                if complete or (f.suffix != ".gz" and st.st_size == offset):
+                    continue
+
+                data, offset = self._read_new(f, offset)
+                out.write(data)
+                pending += len(data)
+                # Rotated files never grow again, so they are not reopened after this
+                db.execute("INSERT OR REPLACE INTO log_offsets VALUES (?, ?, ?, ?, ?)",
+                           [fingerprint, f.name, log, offset, f != path])
+        return scratch if pending else None
+
+    def _add_queries(self, db, scratch: Path) -> int:
+        # DuckDB parses the JSON; malformed lines and entries without a valid timestamp are skipped
+        db.execute("""CREATE OR REPLACE TEMP TABLE new_queries AS
+            SELECT ts, CAST(ts AS DATE) AS day, query, domain, tools, execution_time, answer_length,
+                   tokens_used, cache_hit, entry, query_id
+            FROM (SELECT TRY_CAST(json->>'timestamp' AS TIMESTAMP) AS ts,
+                         json->>'query' AS query,
+                         coalesce(json->>'domain', 'General') AS domain,
+                         coalesce(TRY_CAST(json->'tools_used' AS VARCHAR[]), []) AS tools,
+                         coalesce(TRY_CAST(json->>'execution_time' AS DOUBLE), 0) AS execution_time,
+                         coalesce(TRY_CAST(json->>'answer_length' AS BIGINT), 0) AS answer_length,
+                         coalesce(TRY_CAST(json->>'tokens_used' AS BIGINT), 0) AS tokens_used,
+                         coalesce(TRY_CAST(json->>'cache_hit' AS BOOLEAN), false) AS cache_hit,
+                         json AS entry,
+                         json->>'query_id' AS query_id
+                  FROM read_ndjson_objects(?, ignore_errors = true))
+            WHERE ts IS NOT NULL""", [str(scratch)])
+        db.execute("INSERT INTO queries SELECT * FROM new_queries")
+        # Cache warm-up runs (src/warmup.py) are kept in queries but not counted as user traffic
+        db.execute("CREATE OR REPLACE TEMP VIEW new_traffic AS "
+                   "SELECT * FROM new_queries WHERE json_extract_string(entry, '$.warmup') IS NULL")
+        db.execute("""INSERT INTO daily_rollup
+            SELECT day, domain, count(*), sum(execution_time), sum(tokens_used), count(*) FILTER (WHERE cache_hit)
+            FROM new_traffic GROUP BY day, domain
+            ON CONFLICT (day, domain) DO UPDATE SET
+                queries = queries + excluded.queries, total_time = total_time + excluded.total_time,
+                tokens = tokens + excluded.tokens, cache_hits = cache_hits + excluded.cache_hits""")
+        db.execute("""INSERT INTO tool_rollup
+            SELECT day, tool, domain, count(*), sum(execution_time)
+            FROM (SELECT day, domain, execution_time, unnest(tools) AS tool FROM new_traffic)
+            GROUP BY day, tool, domain
+            ON CONFLICT (day, tool, domain) DO UPDATE SET
+                uses = uses + excluded.uses, total_time = total_time + excluded.total_time""")
+        self._add_histograms(db, "new_traffic")
+        db.execute("INSERT INTO recent_queries SELECT * FROM new_traffic ORDER BY ts DESC LIMIT ?", [RECENT_QUERIES])
+        db.execute("""DELETE FROM recent_queries WHERE ts < (
+            SELECT min(ts) FROM (SELECT ts FROM recent_queries ORDER BY ts DESC LIMIT ?))""", [RECENT_QUERIES])
+        return db.execute("SELECT count(*) FROM new_queries").fetchone()[0]
+
+    def _add_histograms(self, db, source: str):
+        db.execute(f"""INSERT INTO histogram_buckets
+            SELECT day, metric, dimension, key, {BUCKET_SQL.format(value='value')} AS bucket, count(*), sum(value)
+            FROM ({HISTOGRAM_SAMPLES.format(source=source)})
+            WHERE key IS NOT NULL AND value IS NOT NULL AND value >= 0
+            GROUP BY ALL
+            ON CONFLICT (day, metric, dimension, key, bucket) DO UPDATE SET
+                samples = samples + excluded.samples, total = total + excluded.total""")
+
+    def _add_feedback(self, db, scratch: Path) -> int:
+        # Feedback without a domain of its own takes the domain of the query it rates
+        db.execute("""CREATE OR REPLACE TEMP TABLE new_feedback AS
+            SELECT f.ts, CAST(f.ts AS DATE) AS day, f.query, f.rating, f.query_id,
+                   coalesce(f.domain, (SELECT any_value(q.domain) FROM queries q WHERE q.query_id = f.query_id))
+                       AS domain,
+                   f.answer
+            FROM (SELECT TRY_CAST(json->>'timestamp' AS TIMESTAMP) AS ts, json->>'query' AS query,
+                         TRY_CAST(json->>'rating' AS INTEGER) AS rating, json->>'query_id' AS query_id,
+                         json->>'domain' AS domain, json->>'answer' AS answer
+                  FROM read_ndjson_objects(?, ignore_errors = true)) f
+            WHERE f.ts IS NOT NULL AND f.rating IS NOT NULL""", [str(scratch)])
+        db.execute("INSERT INTO feedback SELECT * FROM new_feedback")
+        db.execute("""INSERT INTO feedback_rollup
+            SELECT day, count(*) FILTER (WHERE rating > 0), count(*) FILTER (WHERE rating <= 0)
+            FROM new_feedback GROUP BY day
+            ON CONFLICT (day) DO UPDATE SET
+                positive = positive + excluded.positive, negative = negative + excluded.negative""")
+        self._count_feedback(db, "new_feedback")
+        return db.execute("SELECT count(*) FROM new_feedback").fetchone()[0]
+
+    def _count_feedback(self, db, source: str):
+        db.execute(f"""INSERT INTO feedback_counts
+            SELECT coalesce(domain, 'Unknown'), count(*) FILTER (WHERE rating > 0), count(*) FILTER (WHERE rating <= 0)
+            FROM {source} GROUP BY ALL
+            ON CONFLICT (domain) DO UPDATE SET
+                positive = positive + excluded.positive, negative = negative + excluded.negative""")
+
+    def refresh(self, force: bool = False) -> int:
+        """Land newly appended log lines; returns entries added (throttled to refresh_interval)"""
+        now = time.monotonic()
+        with self.lock:
+            if not force and self._refreshed and now - self._refreshed < self.refresh_interval:
+                return 0
+            self._refreshed = now
+            db = self._connect()
+            added = 0
+            # Offsets move in the same transaction as the rows, so a failed refresh is retried whole
+            db.execute("BEGIN TRANSACTION")
+            try:
+                for log, land in (("queries", self._add_queries), ("feedback", self._add_feedback)):
+                    scratch = self._tail(db, log)
+                    if scratch:
+                        added += land(db, scratch)
+                        scratch.unlink()
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+            return added
+
+    def query(self, sql: str, params: list = None) -> pd.DataFrame:
+        with self.lock:
+            return self._connect().execute(sql, params or []).df()
+
+    def summary(self) -> Dict:
+        """Totals across all history plus today's count and latency percentiles, from the rollups only"""
+        with self.lock:
+            db = self._connect()
+            queries, total_time = db.execute("SELECT coalesce(sum(queries), 0), coalesce(sum(total_time), 0) "
+                                             "FROM daily_rollup").fetchone()
+            today = db.execute("SELECT coalesce(sum(queries), 0) FROM daily_rollup WHERE day = current_date"
+                               ).fetchone()[0]
+            positive, negative = db.execute("SELECT coalesce(sum(positive), 0), coalesce(sum(negative), 0) "
+                                            "FROM feedback_rollup").fetchone()
+        latency = LogHistogram.merged(self.histograms("query_latency", "domain").values())
+        p50, p90, p99 = latency.quantiles([0.5, 0.9, 0.99])
+        return {
+            "total_queries": int(queries),
+            "queries_today": int(today),
+            "avg_response_time": total_time / queries if queries else 0,
+            "p50_response_time": p50,
+            "p90_response_time": p90,
+            "p99_response_time": p99,
+            "positive_feedback": int(positive),
+            "satisfaction_rate": positive / (positive + negative) if positive + negative else 0
+        }
+
+    def feedback_stats(self) -> Dict:
+        """Feedback totals and satisfaction per domain from the maintained counters"""
+        with self.lock:
+            rows = self._connect().execute("SELECT domain, positive, negative FROM feedback_counts "
+                                           "ORDER BY domain").fetchall()
+        by_domain = {domain: {"positive": int(positive), "negative": int(negative),
+                              "satisfaction_rate": positive / (positive + negative) if positive + negative else 0}
+                     for domain, positive, negative in rows}
+        positive = sum(d["positive"] for d in by_domain.values())
+        negative = sum(d["negative"] for d in by_domain.values())
+        return {"positive": positive, "negative": negative, "by_domain": by_domain}
+
+    def query_feedback(self, query_id: str) -> pd.DataFrame:
+        """Ratings given to one logged query (index lookup on query_id)"""
+        return self.query("SELECT ts, rating, answer FROM feedback WHERE query_id = ? ORDER BY ts", [query_id])
+
+    def feedback_examples(self, min_rating: int = 1, batch_size: int = 1000) -> Iterator[Dict]:
+        """Rated answers joined to their query log entries, streamed in batches (e.g. for fine-tuning)
+
+        Feedback logged before query ids existed has no entry (None). Runs on its own cursor,
+        so refreshes and dashboard queries are not held up while the caller iterates."""
+        with self.lock:
+            cursor = self._connect().cursor()
+        try:
+            cursor.execute("""SELECT f.ts, f.query, f.answer, f.rating, f.query_id, f.domain, q.entry
+                FROM feedback f LEFT JOIN queries q ON q.query_id = f.query_id
+                WHERE f.rating >= ? ORDER BY f.ts""", [min_rating])
+            columns = [d[0] for d in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    example = dict(zip(columns, row))
+                    example["entry"] = json.loads(example["entry"]) if example["entry"] else None
+                    yield example
+        finally:
+            cursor.close()
+
+    def histograms(self, metric: str, dimension: str, days: int = None) -> Dict[str, LogHistogram]:
+        """Histogram per key (domain, tool or stage), merged over all days or the last `days`"""
+        where = "metric = ? AND dimension = ?"
+        params = [metric, dimension]
+        if days:
+            where += " AND day > current_date - CAST(? AS INTEGER)"
+            params.append(days)
+        with self.lock:
+            rows = self._connect().execute(f"""SELECT key, bucket, sum(samples), sum(total) FROM histogram_buckets
+                WHERE {where} GROUP BY key, bucket""", params).fetchall()
+        histograms: Dict[str, LogHistogram] = {}
+        for key, bucket, samples, total in rows:
+            histogram = histograms.setdefault(key, LogHistogram())
+            histogram.buckets[bucket] = int(samples)
+            histogram.count += int(samples)
+            histogram.total += total
+        return histograms
+
+    def percentiles(self, metric: str, dimension: str, qs: Sequence[float] = (0.5, 0.9, 0.99),
+                    days: int = None) -> pd.DataFrame:
+        """Count, mean and quantiles per key, plus an "All" row merging every key"""
+        histograms = self.histograms(metric, dimension, days)
+        if not histograms:
+            return pd.DataFrame()
+        if len(histograms) > 1:
+            histograms["All"] = LogHistogram.merged(histograms.values())
+        rows = []
+        for key, histogram in sorted(histograms.items()):
+            rows.append({dimension.title(): key, "Count": histogram.count, "Mean": histogram.mean,
+                         **{f"p{q * 100:g}": v for q, v in zip(qs, histogram.quantiles(qs))}})
+        return pd.DataFrame(rows)
+
+    def daily_counts(self) -> pd.DataFrame:
+        return self.query("SELECT strftime(day, '%Y-%m-%d') AS Date, CAST(sum(queries) AS BIGINT) AS Queries "
+                          "FROM daily_rollup GROUP BY day ORDER BY day")
+
+    def tool_counts(self) -> pd.DataFrame:
+        return self.query("SELECT tool AS Tool, CAST(sum(uses) AS BIGINT) AS Usage "
+                          "FROM tool_rollup GROUP BY tool ORDER BY tool")
+
+    def recent_times(self, limit: int = 10) -> pd.DataFrame:
+        return self.query("SELECT execution_time AS \"Response Time (s)\" FROM "
+                          "(SELECT ts, execution_time FROM recent_queries ORDER BY ts DESC LIMIT ?) ORDER BY ts",
+                          [limit])
+
+
+# Shared instance; the DuckDB file is opened on first use
+log_store = LogStore()
@@ -1,74 +1,37 @@
 import streamlit as st
-import pandas as pd
-import json
 from pathlib import Path
-from datetime import datetime, timedelta
-from collections import defaultdict, Counter
+
+from config.settings import Settings
+from dashboards.log_store import log_store
+from dashboards.prometheus import start_metrics_server
+from logs.jsonl_writer import get_writer
+from src.warmup import hit_rate_report, load_record
+
+# Percentile tables: label, histogram metric, dimension, display unit scale
+LATENCY_VIEWS = {
+    "Domain": ("query_latency", "domain", 1),
+    "Tool": ("query_latency", "tool", 1),
+    "Pipeline stage (ms)": ("stage_latency", "stage", 1000),
+}
 
 class MetricsDashboard:
     def __init__(self):
         self.feedback_file = Path("feedback/feedback.jsonl")
         self.query_log_file = Path("logs/query_log.jsonl")
+        if Settings.METRICS_PORT:
+            start_metrics_server()
     
-    def load_logs(self):
-        """Load query logs"""
-        if not self.query_log_file.exists():
-            return []
-        
-        logs = []
-        try:
-            with open(self.query_log_file, 'r') as f:
-                for line in f:
-                    logs.append(json.loads(line.strip()))
-        except:
-            pass
-        return logs
-    
-    def load_feedback(self):
-        """Load feedback logs"""
-        if not self.feedback_file.exists():
-            return []
-        
-        feedback = []
-        try:
-            with open(self.feedback_file, 'r') as f:
-                for line in f:
-                    feedback.append(json.loads(line.strip()))
-        except:
-            pass
-        return feedback
+    def _refresh_store(self):
+        """Land log lines appended since the last rerun into the DuckDB log store"""
+        # Entries logged by this process may still be queued for the background writers
+        get_writer(self.query_log_file).flush()
+        get_writer(self.feedback_file).flush()
+        log_store.refresh()
     
     def get_summary_metrics(self):
-        """Get basic metrics"""
-        logs = self.load_logs()
-        feedback = self.load_feedback()
-        
-        total_queries = len(logs)
-        
-        # Calculate averages
-        if logs:
-            avg_response_time = sum(log.get('execution_time', 0) for log in logs) / len(logs)
-            
-            # Today's queries
-            today = datetime.now().date()
-            queries_today = sum(1 for log in logs 
-                              if datetime.fromisoformat(log['timestamp']).date() == today)
-        else:
-            avg_response_time = 0
-            queries_today = 0
-        
-        # Satisfaction rate
-        satisfaction_rate = 0
-        if feedback:
-            positive = sum(1 for f in feedback if f.get('rating', 0) > 0)
-            satisfaction_rate = positive / len(feedback)
-        
-        return {
-            "total_queries": total_queries,
-            "queries_today": queries_today, 
-            "avg_response_time": avg_response_time,
-            "satisfaction_rate": satisfaction_rate
-        }
+        """Get basic metrics from the pre-aggregated rollups"""
+        self._refresh_store()
+        return log_store.summary()
     
     def display_live_dashboard(self):
         """Display simple dashboard in sidebar"""
@@ -78,62 +41,71 @@ class MetricsDashboard:
         col1, col2 = st.sidebar.columns(2)
         with col1:
             st.metric("Total Queries", metrics["total_queries"])
-            st.metric("👍 Positive", len([f for f in self.load_feedback() if f.get('rating', 0) > 0]))
+            st.metric("👍 Positive", metrics["positive_feedback"])
         
         with col2:
-            st.metric("Avg Response", f"{metrics['avg_response_time']:.1f}s")
+            st.metric("p50 Response", f"{metrics['p50_response_time']:.1f}s")
             st.metric("Satisfaction", f"{metrics['satisfaction_rate']:.1%}")
         
+        col1, col2 = st.sidebar.columns(2)
+        col1.metric("p90 Response", f"{metrics['p90_response_time']:.1f}s")
+        col2.metric("p99 Response", f"{metrics['p99_response_time']:.1f}s")
+        
         # Show charts toggle
         if st.sidebar.checkbox("📈 Show Charts"):
             self._display_charts()
     
     def _display_charts(self):
         """Display simple charts"""
-        logs = self.load_logs()
+        df_daily = log_store.daily_counts()
         
-        if not logs:
+        if df_daily.empty:
             st.sidebar.info("No data to chart yet")
             return
         
         # 1. Queries per day
-        daily_counts = defaultdict(int)
-        for log in logs:
-            try:
-                date = datetime.fromisoformat(log['timestamp']).date()
-                daily_counts[date] += 1
-            except:
-                continue
-        
-        if daily_counts:
-            st.sidebar.subheader("📊 Queries per Day")
-            df_daily = pd.DataFrame([
-                {"Date": str(date), "Queries": count} 
-                for date, count in sorted(daily_counts.items())
-            ]).set_index("Date")
-            st.sidebar.line_chart(df_daily)
+        st.sidebar.subheader("📊 Queries per Day")
+        st.sidebar.line_chart(df_daily.set_index("Date"))
         
         # 2. Tool usage frequency
-        tool_counts = Counter()
-        for log in logs:
-            for tool in log.get('tools_used', []):
-                tool_counts[tool] += 1
-        
-        if tool_counts:
+        df_tools = log_store.tool_counts()
+        if not df_tools.empty:
             st.sidebar.subheader("🔧 Tool Usage")
-            df_tools = pd.DataFrame([
-                {"Tool": tool, "Usage": count}
-                for tool, count in tool_counts.items()
-            ]).set_index("Tool")
-            st.sidebar.bar_chart(df_tools)
-        
-        # 3. Response times (last 10 queries)
-        recent_logs = logs[-10:] if len(logs) > 10 else logs
-        response_times = [log.get('execution_time', 0) for log in recent_logs]
-        
-        if response_times:
-            st.sidebar.subheader("⏱️ Response Times")
-            df_times = pd.DataFrame({
-                "Response Time (s)": response_times
-            })
-            st.sidebar.line_chart(df_times)
\ No newline at end of file
+            st.sidebar.bar_chart(df_tools.set_index("Tool"))
+        
+        # 3. Latency percentiles (seconds unless noted)
+        st.sidebar.subheader("⏱️ Latency Percentiles")
+        view = st.sidebar.selectbox("By", list(LATENCY_VIEWS))
+        metric, dimension, scale = LATENCY_VIEWS[view]
+        df_latency = log_store.percentiles(metric, dimension)
+        if df_latency.empty:
+            st.sidebar.info("No traced queries yet")
+        else:
+            columns = ["Mean", "p50", "p90", "p99"]
+            df_latency[columns] = (df_latency[columns] * scale).round(3 if scale == 1 else 1)
+            st.sidebar.dataframe(df_latency.set_index(dimension.title()))
+        
+        # 4. Tokens and cost per query
+        for title, metric, digits in (("🔤 Tokens per Query", "tokens", 0),
+                                      ("💵 Cost per Query (USD)", "cost_usd", 5)):
+            df_dist = log_store.percentiles(metric, "domain")
+            if not df_dist.empty:
+                st.sidebar.subheader(title)
+                st.sidebar.dataframe(df_dist.set_index("Domain").round(digits))
+        
+        # 5. Satisfaction by domain
+        by_domain = log_store.feedback_stats()["by_domain"]
+        if by_domain:
+            st.sidebar.subheader("👍 Satisfaction by Domain")
+            st.sidebar.bar_chart({domain: d["satisfaction_rate"] for domain, d in by_domain.items()})
+        
+        # 6. Latest cache warm-up and the hit rate in the hour after it
+        record = load_record()
+        if record:
+            report = hit_rate_report(log_store, record)
+            st.sidebar.subheader("🔥 Cache Warm-up")
+            col1, col2 = st.sidebar.columns(2)
+            col1.metric("Warm-up Time", f"{record['duration_s']:.1f}s")
+            col2.metric("Queries Warmed", len(record["queries"]))
+            col1.metric("Hit Rate (1h)", f"{report['all']['hit_rate']:.1%}")
+            col2.metric("Warmed Hit Rate", f"{report['warmed']['hit_rate']:.1%}")
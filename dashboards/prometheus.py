@@ -0,0 +1,138 @@
+"""Prometheus text exposition of the log store's histograms and query counters
+
+Serves GET /metrics in the text format (version 0.0.4). Each scrape lands newly logged
+queries first (LogStore.refresh, throttled to its refresh_interval). The dashboard starts
+this server in-process when METRICS_PORT is set. Run standalone while the app is up, it reads
+the logs into a private copy of the store (see LogStore), which lacks the app's in-process
+single-flight counters:
+
+    python dashboards/prometheus.py --port 9464
+"""
+import argparse
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import Settings
+from dashboards.log_store import LogStore, log_store
+from tools.singleflight import flight_stats
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BOUNDS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]
+TOKEN_BOUNDS = [100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+COST_BOUNDS = [0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1]
+
+# (name, help, histogram metric, dimension and label, le bounds)
+FAMILIES = [
+    ("compass_query_duration_seconds", "End-to-end query latency by domain",
+     "query_latency", "domain", LATENCY_BOUNDS),
+    ("compass_tool_query_duration_seconds", "End-to-end latency of queries that used each tool",
+     "query_latency", "tool", LATENCY_BOUNDS),
+    ("compass_stage_duration_seconds", "Pipeline stage latency from query traces",
+     "stage_latency", "stage", LATENCY_BOUNDS),
+    ("compass_query_tokens", "LLM tokens per query by domain", "tokens", "domain", TOKEN_BOUNDS),
+    ("compass_query_cost_usd", "LLM cost per query by domain", "cost_usd", "domain", COST_BOUNDS),
+]
+
+
+def _label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(store: LogStore = log_store) -> str:
+    lines: List[str] = []
+    for name, help_text, metric, dimension, bounds in FAMILIES:
+        histograms = store.histograms(metric, dimension)
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for key, histogram in sorted(histograms.items()):
+            label = f'{dimension}="{_label(key)}"'
+            for bound, count in zip(bounds, histogram.cumulative(bounds)):
+                lines.append(f'{name}_bucket{{{label},le="{_number(bound)}"}} {count}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{label}}} {_number(histogram.total)}")
+            lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+    counts = store.query("SELECT domain, CAST(sum(queries) AS BIGINT) AS queries, "
+                         "CAST(sum(cache_hits) AS BIGINT) AS cache_hits "
+                         "FROM daily_rollup GROUP BY domain ORDER BY domain")
+    for column, help_text in (("queries", "Logged queries by domain"),
+                              ("cache_hits", "Queries answered from the LLM cache by domain")):
+        name = f"compass_{column}_total"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for domain, value in zip(counts["domain"], counts[column]):
+            lines.append(f'{name}{{domain="{_label(domain)}"}} {value}')
+
+    # Coalescing counters of this process (the app's, when the dashboard serves /metrics)
+    flights = flight_stats()
+    for stat, help_text in (("executions", "Executions run by single-flight groups"),
+                            ("coalesced", "Calls that shared another caller's in-flight execution"),
+                            ("timeouts", "Coalesced calls that ran their own execution after the shared one stalled")):
+        name = f"compass_singleflight_{stat}_total"
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for group, stats in sorted(flights.items()):
+            lines.append(f'{name}{{group="{_label(group)}"}} {stats[stat]}')
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    store: LogStore = log_store
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        try:
+            self.store.refresh()
+            body = render(self.store).encode()
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = None, host: str = None) -> ThreadingHTTPServer:
+    """Serve /metrics from a daemon thread; one server per process, later calls return it"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host or Settings.METRICS_HOST, port or Settings.METRICS_PORT),
+                                          MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=Settings.METRICS_HOST)
+    parser.add_argument("--port", type=int, default=Settings.METRICS_PORT or 9464)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), MetricsHandler)
+    print(f"Serving Prometheus metrics on http://{args.host}:{args.port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
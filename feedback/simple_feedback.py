@@ -1,49 +1,43 @@
-import json
 from pathlib import Path
 from datetime import datetime
 
+from dashboards.log_store import log_store
+from logs.jsonl_writer import get_writer
+
 class SimpleFeedback:
     def __init__(self):
         self.feedback_file = Path("feedback/feedback.jsonl")
         self.feedback_file.parent.mkdir(exist_ok=True)
+        self.writer = get_writer(self.feedback_file)
     
-    def log(self, query: str, answer: str, rating: int):
-        """Log feedback: 1 = thumbs up, -1 = thumbs down"""
+    def log(self, query: str, answer: str, rating: int, query_id: str = None, domain: str = None):
+        """Log feedback: 1 = thumbs up, -1 = thumbs down; query_id links it to the query log entry"""
         entry = {
             "timestamp": datetime.now().isoformat(),
             "query": query,
             "answer": answer,
             "rating": rating
         }
+        if query_id:
+            entry["query_id"] = query_id
+        if domain:
+            entry["domain"] = domain
         
-        with open(self.feedback_file, 'a') as f:
-            f.write(json.dumps(entry) + '\n')
+        self.writer.write(entry)
     
     def get_stats(self):
-        """Get feedback statistics"""
-        if not self.feedback_file.exists():
-            return {
-                "total": 0,
-                "positive": 0,
-                "negative": 0,
-                "ready_for_training": False
-            }
-        
-        total = positive = 0
-        with open(self.feedback_file, 'r') as f:
-            for line in f:
-                try:
-                    data = json.loads(line)
-                    total += 1
-                    if data['rating'] > 0:
-                        positive += 1
-                except:
-                    continue
+        """Get feedback statistics from the log store's maintained counters"""
+        # Include feedback still queued for the background writer
+        self.writer.flush()
+        log_store.refresh()
+        counts = log_store.feedback_stats()
+        positive, total = counts["positive"], counts["positive"] + counts["negative"]
         
         return {
             "total": total,
             "positive": positive,
-            "negative": total - positive,
+            "negative": counts["negative"],
             "ready_for_training": positive >= 5,
-            "satisfaction_rate": positive / total if total > 0 else 0
+            "satisfaction_rate": positive / total if total > 0 else 0,
+            "by_domain": counts["by_domain"]
         }
@@ -0,0 +1,196 @@
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process appends only
+    fcntl = None
+
+from config.settings import Settings
+
+
+def log_files(path) -> List[Path]:
+    """Rotated files (oldest first, .gz included) followed by the live file"""
+    path = Path(path)
+    rotated = [p for p in sorted(path.parent.glob(f"{path.stem}.*{path.suffix}*"))
+               if p != path and (p.name.endswith(path.suffix) or p.name.endswith(path.suffix + ".gz"))]
+    # While a rotated file is being compressed both copies exist; read the plain one
+    names = {p.name for p in rotated}
+    rotated = [p for p in rotated if not (p.suffix == ".gz" and p.name[:-3] in names)]
+    return rotated + ([path] if path.exists() else [])
+
+
+def open_log(path: Path):
+    return gzip.open(path, 'rt') if path.suffix == '.gz' else open(path, 'r')
+
+
+class JSONLWriter:
+    """Background JSONL appender: callers enqueue, a worker thread writes batches
+
+    write() never blocks; when the bounded queue is full the entry is dropped and counted.
+    Each batch is one O_APPEND write under an exclusive lock on a sidecar .lock file, so
+    several processes can share a log without interleaving lines. The live file is rotated
+    to <stem>.<timestamp><suffix> (optionally gzipped) once it exceeds max_bytes or its last
+    write falls in an earlier rotate_interval period. Pending entries are flushed at exit."""
+
+    def __init__(self, path, max_queue: int = None, batch_size: int = 256, flush_interval: float = None,
+                 max_bytes: int = None, rotate_interval: float = None, compress: bool = None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.max_queue = max_queue or Settings.LOG_QUEUE_SIZE
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval if flush_interval is not None else Settings.LOG_FLUSH_INTERVAL
+        self.max_bytes = max_bytes if max_bytes is not None else Settings.LOG_MAX_BYTES
+        self.rotate_interval = rotate_interval if rotate_interval is not None else Settings.LOG_ROTATE_INTERVAL
+        self.compress = compress if compress is not None else Settings.LOG_COMPRESS
+        self.stats = {"written": 0, "dropped": 0, "batches": 0, "rotations": 0, "errors": 0}
+        self._start()
+        atexit.register(self.close)
+
+    def _start(self):
+        self.pid = os.getpid()
+        self.queue = queue.Queue(self.max_queue)
+        self.closed = False
+        self.worker = threading.Thread(target=self._run, name=f"jsonl-writer:{self.path.name}", daemon=True)
+        self.worker.start()
+
+    def write(self, entry: Dict) -> bool:
+        """Enqueue one entry; False when it was dropped because the queue is full
+
+        The entry is serialized by the worker, so it must not be mutated afterwards."""
+        if self.pid != os.getpid():
+            # Forked child: the parent's worker thread did not come along
+            self._start()
+        try:
+            self.queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything enqueued so far is on disk"""
+        if self.closed or not self.worker.is_alive():
+            return False
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        if self.closed or self.pid != os.getpid():
+            return
+        self.flush(timeout)
+        self.closed = True
+        self.queue.put(None)
+        self.worker.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+
+            # Gather a batch for up to flush_interval; flush markers and close cut it short
+            batch, markers, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    markers.append(item)
+                else:
+                    batch.append(item)
+                if stop or markers or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_batch(batch)
+            for marker in markers:
+                marker.set()
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[Dict]):
+        lines = []
+        for entry in batch:
+            try:
+                lines.append(json.dumps(entry, default=str) + '\n')
+            except (TypeError, ValueError):
+                self.stats["errors"] += 1
+        data = "".join(lines).encode()
+        try:
+            with open(self.lock_path, 'a') as lock:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                rotated = self._maybe_rotate()
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                finally:
+                    os.close(fd)
+            self.stats["written"] += len(lines)
+            self.stats["batches"] += 1
+        except OSError as e:
+            self.stats["errors"] += len(lines)
+            print(f" Log write failed for {self.path}: {e}")
+            return
+        # Compression happens after the lock is released so other writers are not held up
+        if rotated and self.compress:
+            self._compress(rotated)
+
+    def _maybe_rotate(self) -> Path:
+        """Rename the live file when it is due; called with the lock held"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        too_big = self.max_bytes and st.st_size >= self.max_bytes
+        too_old = self.rotate_interval and st.st_size and \
+            int(st.st_mtime // self.rotate_interval) < int(now // self.rotate_interval)
+        if not (too_big or too_old):
+            return None
+
+        stamp = datetime.fromtimestamp(st.st_mtime if too_old else now).strftime("%Y%m%d-%H%M%S-%f")
+        target = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        os.rename(self.path, target)
+        self.stats["rotations"] += 1
+        return target
+
+    def _compress(self, path: Path):
+        try:
+            partial = path.with_name(path.name + ".gz.tmp")
+            with open(path, 'rb') as src, gzip.open(partial, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.rename(partial, path.with_name(path.name + ".gz"))
+            path.unlink()
+        except OSError as e:
+            print(f" Log compression failed for {path}: {e}")
+
+
+_writers: Dict[Path, JSONLWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(path, **kwargs) -> JSONLWriter:
+    """One shared writer (and worker thread) per log file within a process"""
+    key = Path(path).resolve()
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = JSONLWriter(path, **kwargs)
+        return _writers[key]
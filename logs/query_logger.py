@@ -1,26 +1,58 @@
-import json
+import contextvars
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
 
+from logs.jsonl_writer import get_writer
+from tools.tracing import defer_log
+
+_context_fields = contextvars.ContextVar("query_log_fields", default={})
+
+
+@contextmanager
+def log_context(**fields):
+    """Add fields to every query logged inside the block, in this thread (e.g. warmup=True)"""
+    token = _context_fields.set({**_context_fields.get(), **fields})
+    try:
+        yield
+    finally:
+        _context_fields.reset(token)
+
+
 class QueryLogger:
     def __init__(self):
         self.log_file = Path("logs/query_log.jsonl")
         self.log_file.parent.mkdir(exist_ok=True)
+        # Entries are written in batches by a background thread shared by all loggers
+        self.writer = get_writer(self.log_file)
     
     def log_query(self, query: str, tools_used: list, execution_time: float, 
-                  answer_length: int = 0, tokens_used: int = 0, domain: str = "General"):
-        """Log query execution details with domain"""
+                  answer_length: int = 0, tokens_used: int = 0, domain: str = "General",
+                  query_id: str = None, **extra) -> str:
+        """Log query execution details with domain; extra keyword fields are stored as-is
         
+        Returns the entry's query_id, which feedback on the answer refers to."""
+        query_id = query_id or uuid.uuid4().hex
         log_entry = {
             "timestamp": datetime.now().isoformat(),
+            "query_id": query_id,
             "query": query,
             "domain": domain,
             "tools_used": tools_used,
             "execution_time": execution_time,
             "answer_length": answer_length,
             "tokens_used": tokens_used,
-            "query_length": len(query)
+            "query_length": len(query),
+            **_context_fields.get(),
+            **extra
         }
         
-        with open(self.log_file, 'a') as f:
-            f.write(json.dumps(log_entry) + '\n')
\ No newline at end of file
+        # Inside a trace the entry is written when the trace ends, with its spans attached
+        if not defer_log(log_entry, self.writer.write):
+            self.writer.write(log_entry)
+        return query_id
+    
+    def flush(self):
+        """Wait until every logged query is on disk"""
+        self.writer.flush()
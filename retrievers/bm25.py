@@ -0,0 +1,223 @@
+import json
+import math
+import os
+import re
+import zlib
+import numpy as np
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+# Keeps identifiers like "C013", "PM2.5" and "Factory_E" as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase tokens; compound identifiers also emit their parts"""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if not token.replace(".", "").isdigit() and re.search(r"[._-]", token):
+            tokens.extend(part for part in re.split(r"[._-]", token) if len(part) > 1)
+    return tokens
+
+
+class BM25Index:
+    """Compact BM25 inverted index with array-backed postings memory-mapped from disk"""
+
+    def __init__(self, index_dir="data/index/bm25", k1: float = 1.2, b: float = 0.75):
+        self.index_dir = Path(index_dir)
+        self.k1 = k1
+        self.b = b
+
+        self.doc_ids: List[str] = []
+        self.point_ids: List[int] = []
+        self.doc_crcs: List[int] = []
+        self.vocab: Dict[str, List[int]] = {}
+        self.postings_docs = np.zeros(0, dtype=np.int32)
+        self.postings_tf = np.zeros(0, dtype=np.uint16)
+        self.doc_len = np.zeros(0, dtype=np.int32)
+        self.avgdl = 0.0
+        self._norm = np.zeros(0, dtype=np.float32)
+        self._loaded_mtime = None
+
+        self.load()
+
+    @property
+    def available(self) -> bool:
+        return len(self.doc_ids) > 0
+
+    def load(self) -> bool:
+        """Memory-map a previously built index"""
+        meta_path = self.index_dir / "meta.json"
+        if not meta_path.exists():
+            return False
+
+        try:
+            self._loaded_mtime = meta_path.stat().st_mtime_ns
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            self.doc_ids = meta["doc_ids"]
+            self.point_ids = meta["point_ids"]
+            self.doc_crcs = meta.get("doc_crcs", [])
+            self.vocab = meta["vocab"]
+            self.avgdl = meta["avgdl"]
+            self.postings_docs = np.load(self.index_dir / "postings_docs.npy", mmap_mode='r')
+            self.postings_tf = np.load(self.index_dir / "postings_tf.npy", mmap_mode='r')
+            self.doc_len = np.load(self.index_dir / "doc_len.npy", mmap_mode='r')
+            self._norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len, dtype=np.float32) / max(self.avgdl, 1))
+            return True
+        except Exception as e:
+            print(f" BM25 index load failed: {e}")
+            return False
+
+    def refresh(self) -> bool:
+        """Reload if another process rebuilt the index on disk"""
+        meta_path = self.index_dir / "meta.json"
+        if meta_path.exists() and meta_path.stat().st_mtime_ns != self._loaded_mtime:
+            return self.load()
+        return False
+
+    def update(self, chunks_path="data/unstructured/parsed.jsonl") -> int:
+        """Index chunks not seen before; returns the number of newly indexed chunks
+
+        A chunk whose text changed under the same id (e.g. re-parsed or edited) forces a rebuild."""
+        chunks_path = Path(chunks_path)
+        if not chunks_path.exists():
+            return 0
+
+        with open(chunks_path, 'r') as f:
+            chunks = [json.loads(line) for line in f if line.strip()]
+
+        current = {chunk["id"]: zlib.crc32(chunk.get("text", "").encode()) for chunk in chunks}
+        changed = len(self.doc_crcs) != len(self.doc_ids) or \
+            any(current.get(doc_id) != crc for doc_id, crc in zip(self.doc_ids, self.doc_crcs))
+        if not set(self.doc_ids) <= set(current) or changed:
+            # Chunks were removed, renamed or rewritten; postings cannot be patched in place
+            self.doc_ids, self.point_ids, self.doc_crcs, self.vocab = [], [], [], {}
+            self.postings_docs = np.zeros(0, dtype=np.int32)
+            self.postings_tf = np.zeros(0, dtype=np.uint16)
+            self.doc_len = np.zeros(0, dtype=np.int32)
+
+        # Vector point ids follow line order in parsed.jsonl, so they can shift between ingests
+        positions = {chunk["id"]: i for i, chunk in enumerate(chunks)}
+        point_ids = [positions[doc_id] for doc_id in self.doc_ids]
+        indexed = set(self.doc_ids)
+        new_chunks = [(i, chunk) for i, chunk in enumerate(chunks) if chunk["id"] not in indexed]
+        if not new_chunks:
+            if point_ids != self.point_ids:
+                self.point_ids = point_ids
+                self._save()
+                self.load()
+            return 0
+        self.point_ids = point_ids
+
+        # Tokenize only the new chunks
+        base = len(self.doc_ids)
+        new_postings = defaultdict(list)
+        new_lengths = []
+        for offset, (point_id, chunk) in enumerate(new_chunks):
+            tokens = tokenize(chunk.get("text", ""))
+            new_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                new_postings[term].append((base + offset, min(tf, 65535)))
+            self.doc_ids.append(chunk["id"])
+            self.point_ids.append(point_id)
+            self.doc_crcs.append(current[chunk["id"]])
+
+        self._merge(new_postings, new_lengths)
+        self._save()
+        self.load()
+        return len(new_chunks)
+
+    def _merge(self, new_postings: Dict[str, list], new_lengths: List[int]):
+        """Append new postings after each term's existing slice and rebuild the offsets"""
+        terms = sorted(set(self.vocab) | set(new_postings))
+        docs, tfs, vocab = [], [], {}
+        position = 0
+
+        for term in terms:
+            parts_docs, parts_tf = [], []
+            if term in self.vocab:
+                start, length = self.vocab[term]
+                parts_docs.append(np.asarray(self.postings_docs[start:start + length]))
+                parts_tf.append(np.asarray(self.postings_tf[start:start + length]))
+            if term in new_postings:
+                pairs = np.array(new_postings[term], dtype=np.int64)
+                parts_docs.append(pairs[:, 0].astype(np.int32))
+                parts_tf.append(pairs[:, 1].astype(np.uint16))
+
+            length = sum(len(p) for p in parts_docs)
+            vocab[term] = [position, length]
+            docs.extend(parts_docs)
+            tfs.extend(parts_tf)
+            position += length
+
+        self.vocab = vocab
+        self.postings_docs = np.concatenate(docs) if docs else np.zeros(0, dtype=np.int32)
+        self.postings_tf = np.concatenate(tfs) if tfs else np.zeros(0, dtype=np.uint16)
+        self.doc_len = np.concatenate([np.asarray(self.doc_len), np.array(new_lengths, dtype=np.int32)])
+        self.avgdl = float(self.doc_len.mean()) if len(self.doc_len) else 0.0
+
+    def _save(self):
+        """Write to temp files and rename so readers mapping the old arrays stay valid"""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        arrays = {
+            "postings_docs.npy": self.postings_docs,
+            "postings_tf.npy": self.postings_tf,
+            "doc_len.npy": self.doc_len
+        }
+        for name, array in arrays.items():
+            tmp = self.index_dir / f".{name}.tmp"
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, self.index_dir / name)
+
+        # Meta goes last: it is what readers check before remapping
+        tmp = self.index_dir / ".meta.json.tmp"
+        with open(tmp, 'w') as f:
+            json.dump({
+                "doc_ids": self.doc_ids,
+                "point_ids": self.point_ids,
+                "doc_crcs": self.doc_crcs,
+                "vocab": self.vocab,
+                "avgdl": self.avgdl
+            }, f)
+        os.replace(tmp, self.index_dir / "meta.json")
+
+    def search(self, query: str, top_k: int = 10) -> List[Dict]:
+        """Rank indexed chunks by BM25 score"""
+        if not self.available:
+            return []
+
+        num_docs = len(self.doc_ids)
+        scores = np.zeros(num_docs, dtype=np.float32)
+        norm = self._norm
+
+        for term in set(tokenize(query)):
+            if term not in self.vocab:
+                continue
+            start, length = self.vocab[term]
+            docs = self.postings_docs[start:start + length]
+            tf = self.postings_tf[start:start + length].astype(np.float32)
+            idf = math.log(1 + (num_docs - length + 0.5) / (length + 0.5))
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm[docs])
+
+        hits = np.flatnonzero(scores)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+
+        return [
+            {"id": self.doc_ids[i], "point_id": self.point_ids[i], "score": float(scores[i])}
+            for i in hits
+        ]
+
+
+def reciprocal_rank_fusion(rankings: List[List], k: int = 60) -> List[tuple]:
+    """Fuse ranked id lists; returns (id, fused score) best first"""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, 1):
+            fused[item_id] += 1 / (k + rank)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
@@ -1,10 +1,21 @@
 from neo4j import GraphDatabase
+from retrievers.graph_snapshot import GraphSnapshot
+from src.risk_scores import load_risk_scores
+from tools.tracing import current_span
 
 class GraphRetriever:
-    def __init__(self):
+    def __init__(self, db_path="compass.duckdb"):
         self.driver = GraphDatabase.driver("bolt://localhost:7687", auth=("neo4j", "password"))
+        
+        # Multi-hop risk traversals run on the in-process snapshot, not Neo4j
+        self.snapshot = GraphSnapshot(db_path)
+        self.risk_scores = load_risk_scores(db_path)
         print(" Graph retriever initialized")
     
+    def reload_risk_scores(self):
+        """Pick up scores RiskScorer rewrote after a data change"""
+        self.risk_scores = load_risk_scores(self.snapshot.db_path)
+    
     def search(self, query: str) -> str:
         """Search knowledge graph for relationships"""
         if not self.driver:
@@ -15,6 +26,9 @@ class GraphRetriever:
             
             # Query mapping
             responses = {
+                "exposed": self._risk_data,
+                "exposure": self._risk_data,
+                "propagat": self._risk_data,
                 "compliance": self._compliance_data,
                 "violation": self._compliance_data,
                 "relationship": self._relationship_data,
@@ -27,6 +41,7 @@ class GraphRetriever:
             # Find matching response
             for keyword, data in responses.items():
                 if keyword in q:
+                    current_span().set(handler=data.__name__.lstrip("_"))
                     return data()
             
             return "Available graph queries: compliance violations, customer relationships, facility connections, risk analysis"
@@ -96,6 +111,11 @@ class GraphRetriever:
         return "\n".join(result)
     
     def _risk_data(self) -> str:
+        if self.snapshot.available:
+            if self.snapshot.refresh():
+                self.reload_risk_scores()
+            return self._snapshot_risk_data()
+        
         risks = {
             "High Risk Paths": ["ManufacturingInc → Factory_E → CO2_Violation → Regulatory_Risk"],
             "Medium Risk Paths": [
@@ -120,4 +140,42 @@ class GraphRetriever:
         result.append("Risk Propagation:")
         result.extend(f"• {prop}" for prop in propagation)
         
+        return "\n".join(result)
+    
+    def _snapshot_risk_data(self) -> str:
+        """Risk paths from customers to violations traversed on the graph snapshot"""
+        high, medium, flagged_orders = [], [], 0
+        
+        exposed = self.snapshot.exposed_customers()
+        if self.risk_scores:
+            exposed.sort(key=lambda c: self.risk_scores.get(c, {}).get("propagated_risk", 0), reverse=True)
+        
+        for customer_id in exposed:
+            path = self.snapshot.shortest_risk_path(customer_id, edge_types=["OWNS", "HAS_VIOLATION"])
+            if not path:
+                continue
+            
+            violation = self.snapshot.node(path[-1]["id"])
+            line = " → ".join(node["name"] for node in path)
+            line += f" ({violation['value']:g} {violation['unit']} vs limit {violation['limit']:g})"
+            if customer_id in self.risk_scores:
+                line += f" - propagated risk {self.risk_scores[customer_id]['propagated_risk']:.2f}"
+            
+            (high if violation["ratio"] >= 1.5 else medium).append(line)
+            flagged_orders += len(self.snapshot.neighbourhood(
+                customer_id, edge_types=["PLACED"], node_types=["order"], min_risk=1.0
+            ))
+        
+        result = ["Risk Connection Analysis:\n"]
+        for level, paths in (("High Risk Paths", high), ("Medium Risk Paths", medium)):
+            if paths:
+                result.append(f"{level}:")
+                result.extend(paths)
+                result.append("")
+        
+        result.append("Risk Propagation:")
+        result.append(f"• {len(high) + len(medium)} customers exposed to violations through facilities they own")
+        if flagged_orders:
+            result.append(f"• {flagged_orders} high-risk orders placed by these customers")
+        
         return "\n".join(result)
\ No newline at end of file
@@ -0,0 +1,277 @@
+import time
+import duckdb
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from tools.data_version import get_data_version
+
+NODE_TYPES = ["customer", "facility", "violation", "order"]
+
+# Every relationship is stored in both directions so traversals can walk up or down
+EDGE_TYPES = ["OWNS", "OWNED_BY", "HAS_VIOLATION", "VIOLATION_OF", "PLACED", "PLACED_BY"]
+
+RISK_FLAG_SCORES = {"High": 1.0, "Medium": 0.5, "Low": 0.1}
+
+
+class GraphSnapshot:
+    """In-process CSR snapshot of the enterprise graph built from the DuckDB tables"""
+
+    def __init__(self, db_path="compass.duckdb", refresh_interval: float = 30.0):
+        self.db_path = str(Path(db_path).resolve())
+        self.refresh_interval = refresh_interval
+        self.version = None
+        self._last_check = 0.0
+
+        # Node arrays
+        self.node_ids: List[str] = []
+        self.node_names: List[str] = []
+        self.node_index: Dict[str, int] = {}
+        self.node_type = np.zeros(0, dtype=np.int8)
+        self.node_risk = np.zeros(0, dtype=np.float32)
+        self.node_attrs: List[Dict] = []
+
+        # CSR adjacency: neighbours of node i are indices[indptr[i]:indptr[i + 1]]
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.edge_type = np.zeros(0, dtype=np.int8)
+
+        try:
+            self.refresh(force=True)
+            print(f" Graph snapshot built ({self.num_nodes} nodes, {self.num_edges} edges)")
+        except Exception as e:
+            print(f" Graph snapshot unavailable: {e}")
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    @property
+    def available(self) -> bool:
+        return self.num_nodes > 0
+
+    def refresh(self, force: bool = False) -> bool:
+        """Rebuild the snapshot if the source data version changed"""
+        now = time.monotonic()
+        if not force and now - self._last_check < self.refresh_interval:
+            return False
+        self._last_check = now
+
+        version = get_data_version()
+        if not force and version == self.version:
+            return False
+
+        self._build()
+        self.version = version
+        return True
+
+    def _add_node(self, build: Dict, node_id: str, node_type: str, name: str, risk: float, **attrs):
+        build["index"][node_id] = len(build["ids"])
+        build["ids"].append(node_id)
+        build["names"].append(name)
+        build["types"].append(NODE_TYPES.index(node_type))
+        build["risks"].append(risk)
+        build["attrs"].append(attrs)
+
+    def _add_edge(self, build: Dict, src: str, dst: str, edge_type: str):
+        if src not in build["index"] or dst not in build["index"]:
+            return
+        forward = EDGE_TYPES.index(edge_type)
+        s, d = build["index"][src], build["index"][dst]
+        # Reverse type always follows its forward type in EDGE_TYPES
+        build["edges"].extend([(s, d, forward), (d, s, forward + 1)])
+
+    def _build(self):
+        """Load customers, facilities, violations and orders into CSR arrays"""
+        build = {"ids": [], "names": [], "index": {}, "types": [], "risks": [], "attrs": [], "edges": []}
+
+        with duckdb.connect(self.db_path) as db:
+            customers = db.execute(
+                "SELECT customer_id, company_name, domain, risk_score, violations_count FROM customer"
+            ).fetchall()
+            facilities = db.execute(
+                "SELECT facility_id, customer_id, facility_name, emission_type, emission_value, "
+                "compliance_limit, unit, violation_status FROM emissions ORDER BY facility_id, measurement_date"
+            ).fetchall()
+            orders = db.execute(
+                "SELECT order_id, customer_id, product_service, risk_flag FROM orders"
+            ).fetchall()
+
+        for cid, name, domain, risk_score, violations in customers:
+            self._add_node(build, cid, "customer", name, (risk_score or 0) / 10,
+                           domain=domain, violations_count=violations)
+
+        # emissions has a row per facility, emission type and measurement: each facility becomes one
+        # node at its worst ratio, with one violation node per emission type at that type's worst
+        by_facility = {}
+        for fid, cid, name, emission, value, limit, unit, status in facilities:
+            ratio = value / limit if limit else 0.0
+            facility = by_facility.setdefault(fid, {"customer_id": cid, "name": name,
+                                                    "ratio": 0.0, "violations": {}})
+            facility["ratio"] = max(facility["ratio"], ratio)
+            worst = facility["violations"].get(emission)
+            if status == "Violation" and (worst is None or ratio > worst["ratio"]):
+                facility["violations"][emission] = {"value": value, "limit": limit, "unit": unit, "ratio": ratio}
+
+        for fid, facility in by_facility.items():
+            self._add_node(build, fid, "facility", facility["name"], min(facility["ratio"], 1.0),
+                           customer_id=facility["customer_id"])
+            self._add_edge(build, facility["customer_id"], fid, "OWNS")
+
+            for emission, violation in facility["violations"].items():
+                vid = f"{fid}:{emission}"
+                self._add_node(build, vid, "violation", f"{emission} violation",
+                               max(min(violation["ratio"] - 1, 1.0), 0.0), emission_type=emission, **violation)
+                self._add_edge(build, fid, vid, "HAS_VIOLATION")
+
+        for oid, cid, product, flag in orders:
+            self._add_node(build, oid, "order", product, RISK_FLAG_SCORES.get(flag, 0.0), risk_flag=flag)
+            self._add_edge(build, cid, oid, "PLACED")
+
+        num_nodes = len(build["ids"])
+        edges = np.array(build["edges"], dtype=np.int64).reshape(-1, 3)
+        edges = edges[np.argsort(edges[:, 0], kind="stable")]
+
+        indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(edges[:, 0], minlength=num_nodes), out=indptr[1:])
+
+        # Swap everything in at once so concurrent readers never see a half-built snapshot
+        (self.node_ids, self.node_names, self.node_index, self.node_attrs,
+         self.node_type, self.node_risk, self.indptr, self.indices, self.edge_type) = (
+            build["ids"], build["names"], build["index"], build["attrs"],
+            np.array(build["types"], dtype=np.int8), np.array(build["risks"], dtype=np.float32),
+            indptr, edges[:, 1].astype(np.int32), edges[:, 2].astype(np.int8)
+        )
+
+    def _edge_mask(self, edge_types: Optional[Sequence[str]]) -> Optional[np.ndarray]:
+        if not edge_types:
+            return None
+        mask = np.zeros(len(EDGE_TYPES), dtype=bool)
+        mask[[EDGE_TYPES.index(t) for t in edge_types]] = True
+        return mask
+
+    def _expand(self, frontier: np.ndarray, edge_mask: Optional[np.ndarray]):
+        """Gather all outgoing edges of the frontier nodes as (source, target, position) arrays"""
+        starts, ends = self.indptr[frontier], self.indptr[frontier + 1]
+        lengths = ends - starts
+        total = int(lengths.sum())
+        if total == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+
+        # Edge positions for every frontier node laid out back to back
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions = offsets + np.arange(total)
+        sources = np.repeat(frontier, lengths)
+
+        if edge_mask is not None:
+            keep = edge_mask[self.edge_type[positions]]
+            positions, sources = positions[keep], sources[keep]
+
+        return sources, self.indices[positions].astype(np.int64), positions
+
+    def node(self, node_id: str) -> Dict:
+        """Attributes of a single node"""
+        i = self.node_index[node_id]
+        return {"id": node_id, "name": self.node_names[i], "type": NODE_TYPES[self.node_type[i]],
+                "risk": float(self.node_risk[i]), **self.node_attrs[i]}
+
+    def _ids_to_index(self, node_ids: Sequence[str]) -> np.ndarray:
+        return np.array([self.node_index[n] for n in node_ids if n in self.node_index], dtype=np.int64)
+
+    def k_hop(self, seeds: Sequence[str], k: int = 2, edge_types: Optional[Sequence[str]] = None) -> Dict[str, int]:
+        """Return every node within k hops of the seeds with its hop distance"""
+        dist = self.k_hop_distances(self._ids_to_index(seeds), k, edge_types)
+        reached = np.flatnonzero(dist >= 0)
+        return {self.node_ids[i]: int(dist[i]) for i in reached}
+
+    def k_hop_distances(self, seeds: np.ndarray, k: int, edge_types: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Vectorised BFS; returns hop distance per node (-1 when unreached)"""
+        dist = np.full(self.num_nodes, -1, dtype=np.int32)
+        if len(seeds) == 0:
+            return dist
+        dist[seeds] = 0
+        frontier = np.unique(seeds)
+        edge_mask = self._edge_mask(edge_types)
+
+        for hop in range(1, k + 1):
+            _, targets, _ = self._expand(frontier, edge_mask)
+            targets = np.unique(targets[dist[targets] < 0])
+            if len(targets) == 0:
+                break
+            dist[targets] = hop
+            frontier = targets
+
+        return dist
+
+    def shortest_risk_path(self, source: str, max_hops: int = 4,
+                           target_types: Sequence[str] = ("violation",),
+                           edge_types: Optional[Sequence[str]] = None) -> List[Dict]:
+        """Shortest path from source to the riskiest reachable node of the target types"""
+        if source not in self.node_index:
+            return []
+
+        src = self.node_index[source]
+        parent = np.full(self.num_nodes, -1, dtype=np.int64)
+        via = np.full(self.num_nodes, -1, dtype=np.int64)
+        seen = np.zeros(self.num_nodes, dtype=bool)
+        seen[src] = True
+        target_mask = np.isin(self.node_type, [NODE_TYPES.index(t) for t in target_types])
+        edge_mask = self._edge_mask(edge_types)
+        frontier = np.array([src], dtype=np.int64)
+
+        for _ in range(max_hops):
+            sources, targets, positions = self._expand(frontier, edge_mask)
+            fresh = ~seen[targets]
+            sources, targets, positions = sources[fresh], targets[fresh], positions[fresh]
+            if len(targets) == 0:
+                return []
+
+            # First discovered edge wins when several frontier nodes reach the same target
+            targets, first = np.unique(targets, return_index=True)
+            parent[targets] = sources[first]
+            via[targets] = positions[first]
+            seen[targets] = True
+
+            hits = targets[target_mask[targets]]
+            if len(hits):
+                return self._trace(hits[np.argmax(self.node_risk[hits])], parent, via)
+            frontier = targets
+
+        return []
+
+    def _trace(self, node: int, parent: np.ndarray, via: np.ndarray) -> List[Dict]:
+        path = []
+        while node >= 0:
+            edge = EDGE_TYPES[self.edge_type[via[node]]] if via[node] >= 0 else None
+            path.append({"id": self.node_ids[node], "name": self.node_names[node],
+                         "type": NODE_TYPES[self.node_type[node]], "edge": edge})
+            node = parent[node]
+        return path[::-1]
+
+    def neighbourhood(self, node_id: str, k: int = 1, edge_types: Optional[Sequence[str]] = None,
+                      node_types: Optional[Sequence[str]] = None, min_risk: float = 0.0) -> List[Dict]:
+        """Nodes within k hops filtered by node type and minimum risk, riskiest first"""
+        if node_id not in self.node_index:
+            return []
+
+        dist = self.k_hop_distances(np.array([self.node_index[node_id]]), k, edge_types)
+        mask = (dist > 0) & (self.node_risk >= min_risk)
+        if node_types:
+            mask &= np.isin(self.node_type, [NODE_TYPES.index(t) for t in node_types])
+
+        hits = np.flatnonzero(mask)
+        hits = hits[np.argsort(-self.node_risk[hits], kind="stable")]
+        return [{**self.node(self.node_ids[i]), "hops": int(dist[i])} for i in hits]
+
+    def exposed_customers(self, max_hops: int = 2) -> List[str]:
+        """Customers connected to a violation through the facilities they own"""
+        violations = np.flatnonzero(self.node_type == NODE_TYPES.index("violation"))
+        dist = self.k_hop_distances(violations, max_hops, edge_types=["VIOLATION_OF", "OWNED_BY"])
+        customers = np.flatnonzero((dist > 0) & (self.node_type == NODE_TYPES.index("customer")))
+        customers = customers[np.argsort(-self.node_risk[customers], kind="stable")]
+        return [self.node_ids[i] for i in customers]
@@ -1,10 +1,22 @@
 import pathlib
 import os
+import re
 from sqlalchemy import create_engine, text
-from langchain_community.chat_models import ChatOpenAI
 from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits.sql.base import create_sql_agent
 from langchain.agents import AgentType
+from src.risk_scores import load_risk_scores
+from config.settings import Settings
+from tools.llm_cache import langchain_cache, response_cache
+from tools.llm_client import llm_client
+from tools.singleflight import coalesced
+from tools.tracing import current_span
+
+# Questions answered from the materialized entity_risk table without the SQL agent
+ENTITY_ID = re.compile(r'\b[CF]\d{3}\b', re.IGNORECASE)
+RISK_RANKING = re.compile(r'\b(?:riskiest|risky|safest|(?:high|higher|highest|low|lower|lowest|most|least)[- ]risk|'
+                          r'rank(?:ed|ing)?\b.*\brisk|risk\b.*\brank)', re.IGNORECASE)
+ASCENDING = re.compile(r'\b(?:safest|low|lower|lowest|least)\b', re.IGNORECASE)
 
 class SQLRetriever:
     def __init__(self, db_path="compass.duckdb"):
@@ -19,15 +31,21 @@ class SQLRetriever:
         # Create SQL Database wrapper
         self.sql_db = SQLDatabase(self.engine)
         
+        # Materialized propagated risk scores keyed by entity id
+        self.risk_scores = load_risk_scores(self.db_path)
+        
         # Create LLM and agent
         try:
             # Get API key from environment or session
             api_key = os.getenv("OPENAI_API_KEY")
 
-            self.llm = ChatOpenAI(
+            # Identical agent steps (same prompt and scratchpad) are answered from the shared cache
+            cache = langchain_cache(response_cache, "sql_agent") if Settings.LLM_CACHE_ENABLED else None
+            self.llm = llm_client.chat_model(
                     model="gpt-4o-mini",
                     temperature=0,
-                    openai_api_key=api_key
+                    openai_api_key=api_key,
+                    cache=cache
             )
                 
                 # Create SQL agent
@@ -44,9 +62,54 @@ class SQLRetriever:
             self.llm = None
             self.agent = None
     
+    def reload_risk_scores(self):
+        """Pick up scores RiskScorer rewrote after a data change"""
+        self.risk_scores = load_risk_scores(self.db_path)
+    
+    def get_risk(self, entity_id: str) -> dict:
+        """Precomputed risk breakdown for a customer or facility"""
+        return self.risk_scores.get(entity_id, {})
+    
+    def _risk_line(self, r: dict) -> str:
+        return (f"{r['name']} ({r['entity_id']}) - propagated risk {r['propagated_risk']:.2f} "
+                f"[base {r['base_risk']:.2f}, emissions {r['exceedance_risk']:.2f}, "
+                f"graph {r['graph_risk']:.2f}, documents {r['document_risk']:.2f}]")
+    
+    def _risk_ranking(self, limit: int = 5, ascending: bool = False) -> str:
+        """Customers by propagated risk, highest first unless ascending, straight from the materialized table"""
+        customers = [r for r in self.risk_scores.values() if r["entity_type"] == "customer"]
+        customers.sort(key=lambda r: r["propagated_risk"], reverse=not ascending)
+        
+        order = "lowest" if ascending else "highest"
+        result = [f"Customers ranked by propagated risk score, {order} first:\n"]
+        for i, r in enumerate(customers[:limit], 1):
+            result.append(f"{i}. {self._risk_line(r)}")
+        return "\n".join(result)
+    
+    def _entity_risk(self, entity_ids: list) -> str:
+        """Risk breakdown of the customers and facilities a query names"""
+        result = ["Propagated risk scores:\n"]
+        for entity_id in entity_ids:
+            r = self.get_risk(entity_id)
+            result.append(f"- {self._risk_line(r)}" if r else f"- {entity_id}: no risk score recorded")
+        return "\n".join(result)
+    
+    @coalesced("sql")
     def search(self, query: str) -> str:
-        """Search using LangChain SQL agent"""
-
+        """Search using LangChain SQL agent; identical concurrent queries share one agent run
+        
+        Risk questions naming C###/F### ids, and risk rankings, are answered from the materialized
+        scores; anything else about risk goes to the agent, which can query entity_risk itself."""
+        if self.risk_scores and "risk" in query.lower():
+            entity_ids = list(dict.fromkeys(i.upper() for i in ENTITY_ID.findall(query)))
+            if any(self.get_risk(i) for i in entity_ids):
+                current_span().set(path="risk_table")
+                return self._entity_risk(entity_ids)
+            if not entity_ids and RISK_RANKING.search(query):
+                current_span().set(path="risk_table")
+                return self._risk_ranking(ascending=bool(ASCENDING.search(query)))
+        
+        current_span().set(path="sql_agent")
         result = self.agent.invoke({"input": query})
             
             # Extract the output
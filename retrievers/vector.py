@@ -1,10 +1,118 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
-from typing import List, Dict
+from typing import List, Dict, Optional
+from config.settings import Settings
+from retrievers.bm25 import BM25Index, reciprocal_rank_fusion
+from tools.singleflight import coalesced
+from tools.text_store import TextStore
+from tools.tracing import current_span, span
+
+# Payload fields searches can filter on before scoring
+PAYLOAD_INDEXES = {
+    "domain": models.PayloadSchemaType.KEYWORD,
+    "type": models.PayloadSchemaType.KEYWORD,
+    "source": models.PayloadSchemaType.KEYWORD,
+    "doc_id": models.PayloadSchemaType.KEYWORD,
+    "customer_ids": models.PayloadSchemaType.KEYWORD,
+    "date": models.PayloadSchemaType.DATETIME,
+    "risk.overall": models.PayloadSchemaType.FLOAT,
+    "risk_categories": models.PayloadSchemaType.KEYWORD
+}
+
+# Payload fields needed to render a hit; text comes from the text store
+DISPLAY_FIELDS = ["id", "doc_id", "source", "type", "domain", "risk"]
+
+PREVIEW_CHARS = 400
+
+# Queries asking for risky material get chunks ranked by their ingest-time risk score as well
+RISK_QUERY = re.compile(r'\b(?:high[- ]risk|risky|riskiest|compliance risks?|red flags?)\b', re.IGNORECASE)
+
+
+def quantization_config(mode: str):
+    """Qdrant quantization settings for a VECTOR_QUANTIZATION mode"""
+    if mode == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if mode == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def search_params(mode: str, oversampling: float = None) -> Optional[models.SearchParams]:
+    """Oversample quantized candidates and rescore them on the original vectors"""
+    if quantization_config(mode) is None:
+        return None
+    return models.SearchParams(quantization=models.QuantizationSearchParams(
+        rescore=True, oversampling=oversampling or Settings.VECTOR_OVERSAMPLING
+    ))
+
+
+def ensure_collection(client: QdrantClient, collection_name: str, quantization: str = None) -> bool:
+    """Create the collection and its payload indexes if missing; returns True when created"""
+    quantization = quantization or Settings.VECTOR_QUANTIZATION
+    config = quantization_config(quantization)
+    collections = [c.name for c in client.get_collections().collections]
+    created = collection_name not in collections
+    
+    if created:
+        # Quantized codes stay in RAM; full-precision originals are memory-mapped from disk
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE, on_disk=config is not None),
+            quantization_config=config
+        )
+    else:
+        current = client.get_collection(collection_name).config.quantization_config
+        if type(current) is not type(config):
+            client.update_collection(
+                collection_name,
+                vectors_config={"": models.VectorParamsDiff(on_disk=config is not None)},
+                quantization_config=config or models.Disabled.DISABLED
+            )
+            print(f" Switched '{collection_name}' vector storage to {quantization}")
+    
+    # Collections from older ingests may predate the payload indexes
+    indexed = client.get_collection(collection_name).payload_schema or {}
+    for field, schema in PAYLOAD_INDEXES.items():
+        if field not in indexed:
+            client.create_payload_index(collection_name, field_name=field, field_schema=schema)
+    return created
+
+
+def build_filter(domain: str = None, doc_type: str = None, source: str = None,
+                 customer_ids: List[str] = None, date_from: str = None, min_risk: float = None,
+                 risk_categories: List[str] = None) -> Optional[models.Filter]:
+    """Translate search filters into a Qdrant payload filter"""
+    conditions = []
+    for key, value in (("domain", domain), ("type", doc_type), ("source", source)):
+        if value:
+            conditions.append(models.FieldCondition(key=key, match=models.MatchValue(value=value)))
+    if customer_ids:
+        conditions.append(models.FieldCondition(key="customer_ids", match=models.MatchAny(any=list(customer_ids))))
+    if date_from:
+        conditions.append(models.FieldCondition(key="date", range=models.DatetimeRange(gte=date_from)))
+    if min_risk is not None:
+        conditions.append(models.FieldCondition(key="risk.overall", range=models.Range(gte=min_risk)))
+    if risk_categories:
+        conditions.append(models.FieldCondition(key="risk_categories", match=models.MatchAny(any=list(risk_categories))))
+    
+    return models.Filter(must=conditions) if conditions else None
+
 
 class VectorRetriever:
-    def __init__(self, collection_name: str = "documents"):
+    def __init__(self, collection_name: str = "documents", candidates: int = 20, quantization: str = None):
         self.collection_name = collection_name
+        self.candidates = candidates
+        self.quantization = quantization or Settings.VECTOR_QUANTIZATION
+        
+        # Sparse side of hybrid search, queried alongside the dense search
+        self.bm25 = BM25Index()
+        self.text_store = TextStore()
+        self._pool = ThreadPoolExecutor(max_workers=2)
         
         # Initialize embedder
         from tools.embeddings import embedding_engine
@@ -13,13 +121,8 @@ class VectorRetriever:
         # Initialize client
         try:
             self.client = QdrantClient("localhost", port=6333)
-            collections = [c.name for c in self.client.get_collections().collections]
             
-            if collection_name not in collections:
-                self.client.create_collection(
-                    collection_name=collection_name,
-                    vectors_config=models.VectorParams(size=384, distance=models.Distance.COSINE)
-                )
+            if ensure_collection(self.client, collection_name, self.quantization):
                 print(f" Created vector collection '{collection_name}'")
             else:
                 print(f" Connected to vector collection '{collection_name}'")
@@ -28,15 +131,89 @@ class VectorRetriever:
             print(f" Vector retriever unavailable: {e}")
             self.client = None
     
-    def search(self, query: str, top_k: int = 3) -> str:
-        """Search for similar documents"""
-        try:
+    def _dense_search(self, query: str, limit: int, query_filter: models.Filter = None) -> list:
+        if not (self.client and self.embedder):
+            return []
+        with span("vector.dense", filtered=query_filter is not None) as s:
             query_vector = self.embedder.encode_single(query)
-            results = self.client.search(
+            hits = self.client.search(
                 collection_name=self.collection_name,
                 query_vector=query_vector.tolist(),
-                limit=top_k
+                query_filter=query_filter,
+                search_params=search_params(self.quantization),
+                with_payload=DISPLAY_FIELDS,
+                limit=limit
             )
+            s.set(hits=len(hits))
+        return hits
+    
+    def _sparse_search(self, query: str, limit: int) -> list:
+        with span("vector.bm25") as s:
+            self.bm25.refresh()
+            hits = self.bm25.search(query, top_k=limit)
+            s.set(hits=len(hits))
+        return hits
+    
+    def _sparse_payloads(self, point_ids: list, query_filter: models.Filter = None) -> Dict:
+        """Payloads for keyword hits, dropping those outside the filter"""
+        if not (point_ids and self.client):
+            return {}
+        if query_filter is None:
+            points = self.client.retrieve(self.collection_name, ids=point_ids, with_payload=DISPLAY_FIELDS)
+        else:
+            scoped = models.Filter(must=[models.HasIdCondition(has_id=point_ids), *query_filter.must])
+            points, _ = self.client.scroll(self.collection_name, scroll_filter=scoped,
+                                           limit=len(point_ids), with_payload=DISPLAY_FIELDS)
+        return {point.id: point.payload for point in points}
+    
+    def hybrid_search(self, query: str, top_k: int = 3, query_filter: models.Filter = None,
+                      risk_boost: bool = False) -> List[tuple]:
+        """Dense and BM25 search in parallel, fused with reciprocal rank fusion
+        
+        With risk_boost the fused candidates are fused again with their order by stored risk score."""
+        # Each worker runs in a copy of this context so its spans nest under the caller's
+        dense_future = self._pool.submit(copy_context().run, self._dense_search, query, self.candidates, query_filter)
+        sparse_future = self._pool.submit(copy_context().run, self._sparse_search, query, self.candidates)
+        dense_hits, sparse_hits = dense_future.result(), sparse_future.result()
+        
+        payloads = {hit.id: hit.payload for hit in dense_hits}
+        sparse_ids = [hit["point_id"] for hit in sparse_hits]
+        
+        # The keyword index has no payloads, so filtering happens when they are fetched
+        if query_filter is not None:
+            payloads.update(self._sparse_payloads([i for i in sparse_ids if i not in payloads], query_filter))
+            sparse_ids = [i for i in sparse_ids if i in payloads]
+        
+        # Boosting re-ranks the full candidate list, so keep all of it until then
+        limit = self.candidates if risk_boost else top_k
+        fused = reciprocal_rank_fusion([[hit.id for hit in dense_hits], sparse_ids])[:limit]
+        
+        # Keyword-only hits still need their payloads
+        missing = [point_id for point_id, _ in fused if point_id not in payloads]
+        payloads.update(self._sparse_payloads(missing))
+        
+        if risk_boost:
+            ranked = [point_id for point_id, _ in fused if point_id in payloads]
+            risky = sorted((i for i in ranked if self._risk(payloads[i]) > 0), key=lambda i: -self._risk(payloads[i]))
+            fused = reciprocal_rank_fusion([ranked, risky])[:top_k]
+        
+        current_span().set(fused_hits=len(fused), risk_boost=risk_boost)
+        return [(payloads[point_id], score) for point_id, score in fused if point_id in payloads]
+    
+    def _risk(self, payload: Dict) -> float:
+        return (payload.get('risk') or {}).get('overall', 0.0)
+    
+    @coalesced("vector")
+    def search(self, query: str, top_k: int = 3, domain: str = None, doc_type: str = None,
+               source: str = None, customer_ids: List[str] = None, min_risk: float = None) -> str:
+        """Search for similar documents, optionally narrowed by payload filters
+        
+        min_risk keeps only chunks whose ingest-time risk score reaches it; risk-seeking
+        queries ("high risk", "red flags") boost risky chunks without a hard filter.
+        Identical concurrent searches share one execution."""
+        try:
+            query_filter = build_filter(domain, doc_type, source, customer_ids, min_risk=min_risk)
+            results = self.hybrid_search(query, top_k, query_filter, risk_boost=bool(RISK_QUERY.search(query)))
             
             if not results:
                 return "No relevant documents found."
@@ -44,15 +221,18 @@ class VectorRetriever:
             # Format results compactly
             formatted = [f"**Found {len(results)} relevant documents:**\n"]
             
-            for i, hit in enumerate(results, 1):
-                source = hit.payload.get('source', 'Unknown')
-                doc_type = hit.payload.get('type', 'doc')
-                text = hit.payload.get('text', '')[:400]
-                score = hit.score
+            # Only the top-k texts are read, and only as far as the preview needs
+            texts = self.text_store.get_many([p.get('id') for p, _ in results if p.get('id')], PREVIEW_CHARS + 1)
+            
+            for i, (payload, score) in enumerate(results, 1):
+                source = payload.get('source', payload.get('doc_id', 'Unknown'))
+                doc_type = payload.get('type', 'doc')
+                text = texts.get(payload.get('id')) or payload.get('text', '')
+                risk = f", Risk: {self._risk(payload):.2f}" if self._risk(payload) > 0 else ""
                 
                 formatted.extend([
-                    f" **{i}. {source}** [{doc_type}] (Score: {score:.3f})",
-                    f"   {text}{'...' if len(hit.payload.get('text', '')) > 400 else ''}\n"
+                    f" **{i}. {source}** [{doc_type}] (Score: {score:.3f}{risk})",
+                    f"   {text[:PREVIEW_CHARS]}{'...' if len(text) > PREVIEW_CHARS else ''}\n"
                 ])
             
             return "\n".join(formatted)
@@ -67,14 +247,17 @@ class VectorRetriever:
         
         try:
             points = []
+            texts = {}
             for idx, doc in enumerate(documents):
                 if text := doc.get('text'):
                     embedding = self.embedder.encode_single(text)
+                    text_id = doc.get('id', f"{doc.get('source', 'doc')}_{idx}")
+                    texts[text_id] = text
                     points.append(models.PointStruct(
                         id=idx,
                         vector=embedding.tolist(),
                         payload={
-                            'text': text,
+                            'id': text_id,
                             'source': doc.get('source', 'unknown'),
                             'type': doc.get('type', 'document'),
                             'metadata': doc.get('metadata', {})
@@ -82,6 +265,7 @@ class VectorRetriever:
                     ))
             
             if points:
+                self.text_store.put_many(texts)
                 self.client.upsert(collection_name=self.collection_name, points=points)
                 print(f" Added {len(points)} documents to vector store")
                 return True
@@ -1,12 +1,28 @@
+import json
 import re
-from typing import Dict, List, Set
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from config.settings import Settings
+
+# Words and single punctuation marks; whitespace only separates tokens
+TOKEN = re.compile(r'\w+|[^\w\s]')
+
 
 class ComplianceTagger:
-    def __init__(self):
+    """Compliance risk terms matched in one pass by a word-level Aho-Corasick automaton
+    
+    Terms and text are split into the same tokens, so a term only matches on whole-word
+    boundaries and the cost of a scan depends on the text length, not the vocabulary size."""
+    
+    def __init__(self, risk_terms: Dict[str, List[str]] = None, terms_path: str = None):
         # High risk compliance terms by category
         self.risk_terms = {
             'financial_risk': [
-                'restatement', 'earnings risk', 'material weakness', 
+                'restatement', 'earnings risk', 'material weakness',
                 'accounting irregularity', 'audit failure', 'misstatement',
                 'revenue recognition', 'financial fraud', 'sec investigation'
             ],
@@ -27,49 +43,138 @@ class ComplianceTagger:
             ]
         }
         
-        # Compile patterns for case-insensitive matching
-        self.patterns = {}
-        for category, terms in self.risk_terms.items():
-            self.patterns[category] = re.compile(
-                r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\b',
-                re.IGNORECASE
-            )
+        # A configured term list replaces the built-in vocabulary
+        terms_path = terms_path or Settings.COMPLIANCE_TERMS_PATH
+        if risk_terms is None and terms_path:
+            with open(terms_path, 'r') as f:
+                risk_terms = json.load(f)
+        if risk_terms is not None:
+            self.risk_terms = risk_terms
+        
+        self.categories = list(self.risk_terms)
+        self._build()
     
-    def tag_risks(self, text: str) -> Dict[str, List[str]]:
-        """Find all risk terms in text by category"""
-        results = {}
+    def _build(self):
+        """Token trie with failure links; each node's outputs include those of its suffix nodes"""
+        self.goto: List[Dict[str, int]] = [{}]
+        self.outputs: List[List[Tuple[int, int]]] = [[]]
         
-        for category, pattern in self.patterns.items():
-            matches = pattern.findall(text)
-            if matches:
-                # Unique matches, preserve original case
-                results[category] = list(set(matches))
+        for c, category in enumerate(self.categories):
+            for term in self.risk_terms[category]:
+                tokens = TOKEN.findall(term.lower())
+                if not tokens:
+                    continue
+                node = 0
+                for token in tokens:
+                    if token not in self.goto[node]:
+                        self.goto.append({})
+                        self.outputs.append([])
+                        self.goto[node][token] = len(self.goto) - 1
+                    node = self.goto[node][token]
+                if (c, len(tokens)) not in self.outputs[node]:
+                    self.outputs[node].append((c, len(tokens)))
         
-        return results
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and token not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(token, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
     
-    def get_risk_score(self, text: str) -> Dict[str, float]:
-        """Calculate risk score based on term frequency"""
-        scores = {}
-        text_length = len(text.split())
+    def _matches(self, text: str) -> List[List[Tuple[int, int]]]:
+        """Character spans of term matches per category, non-overlapping within a category"""
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Keep offsets aligned with the original text for the few characters that expand
+            lowered = "".join(ch.lower()[0] for ch in text)
         
-        for category, pattern in self.patterns.items():
-            matches = pattern.findall(text)
-            if matches:
-                # Score based on frequency and text length
-                scores[category] = min(len(matches) / max(text_length / 100, 1), 1.0)
+        goto, fail, outputs = self.goto, self.fail, self.outputs
+        spans = [m.span() for m in TOKEN.finditer(lowered)]
+        found = [[] for _ in self.categories]
+        node = 0
+        for i, (start, end) in enumerate(spans):
+            token = lowered[start:end]
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            for c, length in outputs[node]:
+                found[c].append((i - length + 1, i))
         
-        # Overall risk score
-        if scores:
-            scores['overall'] = min(sum(scores.values()) / len(scores), 1.0)
-        else:
-            scores['overall'] = 0.0
+        # Like a regex scan: leftmost match first, longest at the same start, no overlaps
+        matches = []
+        for hits in found:
+            kept, last = [], -1
+            for first, final in sorted(hits, key=lambda h: (h[0], -h[1])):
+                if first > last:
+                    kept.append((spans[first][0], spans[final][1]))
+                    last = final
+            matches.append(kept)
+        return matches
+    
+    def _scores(self, counts: Dict[str, int], text_length: int) -> Dict[str, float]:
+        # Score based on frequency and text length
+        scores = {category: min(count / max(text_length / 100, 1), 1.0) for category, count in counts.items()}
         
+        # Overall risk score
+        scores['overall'] = min(sum(scores.values()) / len(scores), 1.0) if scores else 0.0
         return scores
     
+    def analyze(self, text: str, threshold: float = 0.1) -> Dict:
+        """Tags, counts, scores and the high-risk flag from a single scan of the text"""
+        tags, counts = {}, {}
+        for category, spans in zip(self.categories, self._matches(text)):
+            if spans:
+                # Unique matches, preserve original case
+                tags[category] = list(dict.fromkeys(text[start:end] for start, end in spans))
+                counts[category] = len(spans)
+        scores = self._scores(counts, len(text.split()))
+        return {
+            "tags": tags,
+            "counts": counts,
+            "scores": scores,
+            "high_risk": scores['overall'] >= threshold
+        }
+    
+    def count_matches(self, text: str) -> int:
+        """Total term matches across categories"""
+        return sum(len(spans) for spans in self._matches(text))
+    
+    def count_batch(self, texts: Iterable[str]) -> np.ndarray:
+        """Match counts as a (texts x categories) matrix, columns in self.categories order"""
+        return np.array([[len(spans) for spans in self._matches(text)] for text in texts],
+                        dtype=np.int32).reshape(-1, len(self.categories))
+    
+    def score_batch(self, texts: List[str], counts: np.ndarray = None) -> pd.DataFrame:
+        """Per-category and overall scores for a corpus, computed on the count matrix at once
+        
+        Pass counts from count_batch to avoid a second scan. Categories with no matches
+        score 0 here rather than being absent."""
+        if counts is None:
+            counts = self.count_batch(texts)
+        words = np.array([len(text.split()) for text in texts], dtype=np.float64)
+        scores = np.minimum(counts / np.maximum(words / 100, 1)[:, None], 1.0)
+        matched = (counts > 0).sum(axis=1)
+        overall = np.where(matched > 0, scores.sum(axis=1) / np.maximum(matched, 1), 0.0)
+        frame = pd.DataFrame(scores, columns=self.categories)
+        frame['overall'] = np.minimum(overall, 1.0)
+        return frame
+    
+    def tag_risks(self, text: str) -> Dict[str, List[str]]:
+        """Find all risk terms in text by category"""
+        return self.analyze(text)["tags"]
+    
+    def get_risk_score(self, text: str) -> Dict[str, float]:
+        """Calculate risk score based on term frequency"""
+        return self.analyze(text)["scores"]
+    
     def flag_high_risk(self, text: str, threshold: float = 0.1) -> bool:
         """Quick check if text is high risk"""
-        scores = self.get_risk_score(text)
-        return scores.get('overall', 0) >= threshold
+        return self.analyze(text, threshold)["high_risk"]
     
     def summarize_risks(self, text: str) -> str:
         """Generate a brief risk summary"""
@@ -81,4 +186,4 @@ class ComplianceTagger:
         for category, terms in risks.items():
             summary_parts.append(f"{category.replace('_', ' ').title()}: {', '.join(terms[:3])}")
         
-        return " | ".join(summary_parts)
\ No newline at end of file
+        return " | ".join(summary_parts)
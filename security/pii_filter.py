@@ -1,5 +1,5 @@
 import re
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 class PIIFilter:
     def __init__(self):
@@ -8,45 +8,109 @@ class PIIFilter:
             'email': r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b',
             'phone': r'\b(?:\+1[-.\s]?)?\(?\d{3}\)?[-.\s]?\d{3}[-.\s]?\d{4}\b'
         }
+        self.compiled = {pii_type: re.compile(pattern) for pii_type, pattern in self.patterns.items()}
+        # One alternation in masking priority order; the named group tells which type matched
+        self.combined = re.compile("|".join(f"(?P<{pii_type}>{pattern})" for pii_type, pattern in self.patterns.items()))
+        # What mask_pii leaves behind, to count PII in text that was masked earlier
+        self.masked_patterns = {
+            'ssn': re.compile(r'XXX-XX-\d{4}'),
+            'email': re.compile(r'\*\*\*@\*\*\*\.\*\*\*'),
+            'phone': re.compile(r'\(XXX\) XXX-XXXX')
+        }
+    
+    def _replacement(self, pii_type: str, value: str) -> str:
+        if pii_type == 'ssn':
+            return f"XXX-XX-{value[-4:]}"
+        if pii_type == 'email':
+            return f"{value.split('@')[0][:2]}***@***.***"
+        return "(XXX) XXX-XXXX"
     
     def detect_pii(self, text: str) -> Dict[str, List[str]]:
         """Detect PII in text and return matches by type"""
         results = {}
-        for pii_type, pattern in self.patterns.items():
-            matches = re.findall(pattern, text)
+        for pii_type, pattern in self.compiled.items():
+            matches = pattern.findall(text)
             if matches:
                 results[pii_type] = matches
         return results
     
     def mask_pii(self, text: str) -> Tuple[str, Dict[str, int]]:
-        """Mask PII in text and return masked text with counts"""
-        masked_text = text
-        pii_counts = {}
-        
-        # Replace SSNs
-        ssn_matches = re.findall(self.patterns['ssn'], text)
-        for ssn in ssn_matches:
-            masked_text = masked_text.replace(ssn, f"XXX-XX-{ssn[-4:]}")
-        pii_counts['ssn'] = len(ssn_matches)
-        
-        # Replace emails
-        email_matches = re.findall(self.patterns['email'], text)
-        for email in email_matches:
-            user = email.split('@')[0]
-            masked_text = masked_text.replace(email, f"{user[:2]}***@***.***")
-        pii_counts['email'] = len(email_matches)
+        """Mask PII in text and return masked text with counts, in one pass over the text"""
+        pii_counts = {pii_type: 0 for pii_type in self.patterns}
         
-        # Replace phones
-        phone_matches = re.findall(self.patterns['phone'], text)
-        for phone in phone_matches:
-            masked_text = masked_text.replace(phone, "(XXX) XXX-XXXX")
-        pii_counts['phone'] = len(phone_matches)
+        def replace(match):
+            pii_type = match.lastgroup
+            pii_counts[pii_type] += 1
+            return self._replacement(pii_type, match.group())
         
-        return masked_text, pii_counts
+        return self.combined.sub(replace, text), pii_counts
+    
+    def mask_batch(self, texts: Iterable[str]) -> Tuple[List[str], Dict[str, int]]:
+        """Mask many strings (e.g. retrieved chunks); returns masked texts and summed counts"""
+        masked, totals = [], {pii_type: 0 for pii_type in self.patterns}
+        for text in texts:
+            text, counts = self.mask_pii(text)
+            masked.append(text)
+            for pii_type, count in counts.items():
+                totals[pii_type] += count
+        return masked, totals
+    
+    def mask_stream(self, chunks: Iterable[str], lookahead: int = 24) -> Iterator[str]:
+        """Mask chunked text lazily; see StreamingPIIMasker for how matches across chunks are kept whole"""
+        masker = StreamingPIIMasker(self, lookahead)
+        for chunk in chunks:
+            text = masker.feed(chunk)
+            if text:
+                yield text
+        tail = masker.flush()
+        if tail:
+            yield tail
+    
+    def count_masked(self, text: str) -> Dict[str, int]:
+        """Counts of PII placeholders in already-masked text"""
+        return {pii_type: len(pattern.findall(text)) for pii_type, pattern in self.masked_patterns.items()}
     
     def contains_pii(self, text: str) -> bool:
         """Quick check if text contains any PII"""
-        for pattern in self.patterns.values():
-            if re.search(pattern, text):
-                return True
-        return False
\ No newline at end of file
+        return self.combined.search(text) is not None
+
+
+class StreamingPIIMasker:
+    """Mask PII in a token stream, holding back a short tail so no match is emitted half-masked"""
+    
+    def __init__(self, pii_filter: PIIFilter, lookahead: int = 24):
+        # The lookahead must cover the longest PII that can contain whitespace (phones)
+        self.pii_filter = pii_filter
+        self.lookahead = lookahead
+        self.buffer = ""
+        self.pii_counts: Dict[str, int] = {}
+    
+    def _emit(self, cut: int) -> str:
+        segment, self.buffer = self.buffer[:cut], self.buffer[cut:]
+        if not segment:
+            return ""
+        masked, counts = self.pii_filter.mask_pii(segment)
+        for pii_type, count in counts.items():
+            self.pii_counts[pii_type] = self.pii_counts.get(pii_type, 0) + count
+        return masked
+    
+    def feed(self, text: str) -> str:
+        """Add streamed text and return the masked part that is safe to show"""
+        self.buffer += text
+        limit = len(self.buffer) - self.lookahead
+        if limit <= 0:
+            return ""
+        
+        # SSNs and emails never contain whitespace, so cutting after whitespace cannot split them
+        cut = max(self.buffer.rfind(ch, 0, limit) for ch in " \t\n") + 1
+        # Phones can contain spaces; move the cut before any match it would split. Such a match
+        # is shorter than the lookahead, so only a window around the cut needs scanning
+        window = max(cut - self.lookahead, 0)
+        for match in self.pii_filter.combined.finditer(self.buffer, window, cut + self.lookahead):
+            if match.start() < cut < match.end():
+                cut = match.start()
+        return self._emit(cut)
+    
+    def flush(self) -> str:
+        """Mask and return whatever is still held back at the end of the stream"""
+        return self._emit(len(self.buffer))
@@ -1,5 +1,9 @@
-from security.pii_filter import PIIFilter
+import time
+from typing import Dict, Iterator
+
+from security.pii_filter import PIIFilter, StreamingPIIMasker
 from security.compliance_tagger import ComplianceTagger
+from tools.tracing import isolated, span, start_trace
 
 class SecureQueryWrapper:
     def __init__(self, agent):
@@ -7,30 +11,75 @@ class SecureQueryWrapper:
         self.pii_filter = PIIFilter()
         self.compliance_tagger = ComplianceTagger()
     
-    def execute(self, query: str):
-        """Secure wrapper for agent.execute()"""
-        # Pre-process: Check and mask PII in query
-        if self.pii_filter.contains_pii(query):
-            query, _ = self.pii_filter.mask_pii(query)
-        
-        # Check compliance risk
-        risk_score = self.compliance_tagger.get_risk_score(query)
-        
-        # Execute original query
-        result = self.agent.execute(query)
-        
-        # Post-process: Mask PII in answer and context
+    def _secure_query(self, query: str) -> tuple:
+        """Pre-process: Check and mask PII in query, then score its compliance risk"""
+        with span("security.pre") as s:
+            pii_found = self.pii_filter.contains_pii(query)
+            if pii_found:
+                query, _ = self.pii_filter.mask_pii(query)
+            # Check compliance risk (scores and high-risk flag from one scan)
+            risk = self.compliance_tagger.analyze(query)
+            s.set(pii_found=pii_found, high_risk=risk['high_risk'])
+        return query, risk
+    
+    def _secure_result(self, result: Dict, risk: Dict) -> Dict:
+        """Post-process: Mask PII in answer and context, attach security metadata"""
+        with span("security.post") as s:
+            result = self._mask_result(result, risk)
+            s.set(context_scan_skipped=result['security_metadata']['context_scan_skipped'],
+                  pii_masked=sum(result.get('pii_masked', {}).values()))
+        return result
+    
+    def _mask_result(self, result: Dict, risk: Dict) -> Dict:
+        start = time.process_time()
         if 'answer' in result:
             result['answer'], pii_counts = self.pii_filter.mask_pii(result['answer'])
             result['pii_masked'] = pii_counts
-            
-        if 'context' in result:
+        
+        # Context built only from data masked at ingestion needs no second scan
+        skip_context = bool(result.get('context_premasked'))
+        if 'context' in result and not skip_context:
             result['context'], _ = self.pii_filter.mask_pii(result['context'])
         
         # Add security metadata
         result['security_metadata'] = {
-            'compliance_risk': risk_score,
-            'high_risk': self.compliance_tagger.flag_high_risk(query)
+            'compliance_risk': risk['scores'],
+            'high_risk': risk['high_risk'],
+            'context_scan_skipped': skip_context,
+            'context_chars_skipped': len(result.get('context', '')) if skip_context else 0,
+            'pii_scan_cpu_ms': (time.process_time() - start) * 1000
         }
         
-        return result
\ No newline at end of file
+        return result
+    
+    def execute(self, query: str):
+        """Secure wrapper for agent.execute()"""
+        with start_trace("query", streaming=False):
+            query, risk = self._secure_query(query)
+            
+            # Execute original query
+            result = self.agent.execute(query)
+            
+            return self._secure_result(result, risk)
+    
+    @isolated
+    def execute_stream(self, query: str) -> Iterator[Dict]:
+        """Secure wrapper for agent.execute_stream(); tokens are masked before they are yielded"""
+        result = None
+        # The trace (and the log entry it holds) ends before the result is handed over
+        with start_trace("query", streaming=True):
+            query, risk = self._secure_query(query)
+            masker = StreamingPIIMasker(self.pii_filter)
+            
+            for event in self.agent.execute_stream(query):
+                if event["type"] == "token":
+                    text = masker.feed(event["text"])
+                    if text:
+                        yield {"type": "token", "text": text}
+                elif event["type"] == "result":
+                    tail = masker.flush()
+                    if tail:
+                        yield {"type": "token", "text": tail}
+                    result = self._secure_result(event["result"], risk)
+        if result is not None:
+            yield {"type": "result", "result": result}
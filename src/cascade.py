@@ -0,0 +1,137 @@
+import math
+import re
+from typing import Dict, List, Optional
+
+from retrievers.bm25 import tokenize
+
+SECTION_HEADER = re.compile(r'^\*\*([^*]+):\*\*$')
+LIST_ITEM = re.compile(r'^\s*(?:\d+\.|[-•●])\s+(.+)$')
+LOOKUP_QUERY = re.compile(r'^(?:which|what are|who|list|show|top|find|get)\b', re.IGNORECASE)
+ANALYTIC_QUERY = re.compile(r'\b(?:why|how|explain|trend|compare|impact|analy|summar|recommend|assess|overview)', re.IGNORECASE)
+REFUSAL = re.compile(r"\b(?:i don't know|i do not know|not (?:provided|available|mentioned) in the context|"
+                     r"no (?:relevant )?information|cannot (?:determine|answer)|unable to)\b", re.IGNORECASE)
+FACT = re.compile(r'\b(?:[A-Z]\d{3}|\d[\d,]*(?:\.\d+)?)\b')
+
+STOPWORDS = {"which", "what", "who", "are", "is", "the", "a", "an", "of", "by", "for", "in", "on", "to", "and",
+             "or", "me", "our", "show", "list", "find", "get", "with", "have", "has", "all", "any", "do"}
+# A list cannot answer a negated question ("customers that are not high risk") by quoting items
+NEGATIONS = {"not", "no", "non", "without", "except", "excluding", "never", "none"}
+# Sort direction a query asks for, and the words that state it in a section's header
+DESCENDING = {"top", "high", "highest", "most", "largest", "biggest", "greatest", "maximum", "max", "worst",
+              "riskiest", "descending", "ranked"}
+ASCENDING = {"low", "lowest", "least", "smallest", "fewest", "minimum", "min", "bottom", "safest", "ascending"}
+ENTITY_ID = re.compile(r'\b[CF]\d{3}\b', re.IGNORECASE)
+
+
+def _stem(token: str) -> str:
+    """Plural/singular tolerant form ("facilities" -> "facility", "customers" -> "customer")"""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _direction(words) -> Optional[str]:
+    if words & ASCENDING:
+        return "ascending"
+    if words & DESCENDING:
+        return "descending"
+    return None
+
+
+def _sections(context: str) -> List[Dict]:
+    """Split packed context into titled sections with their list items"""
+    sections, current = [], {"title": "", "lines": [], "items": []}
+    for line in context.split("\n"):
+        header = SECTION_HEADER.match(line.strip())
+        if header:
+            if current["lines"]:
+                sections.append(current)
+            current = {"title": header.group(1), "lines": [], "items": []}
+            continue
+        current["lines"].append(line)
+        item = LIST_ITEM.match(line)
+        # Only items carrying a value or an id are facts worth quoting
+        if item and FACT.search(item.group(1)):
+            current["items"].append(item.group(1).strip())
+    if current["lines"]:
+        sections.append(current)
+    return sections
+
+
+def extractive_answer(query: str, context: str, max_items: int = 10) -> Optional[Dict]:
+    """Template answer listing the structured result that answers a simple lookup query
+
+    A section qualifies only when it answers the question asked: every entity id the query names
+    appears among its items, the sort direction asked for ("lowest", "top") is the one its header
+    states, and each remaining query term is either in the header (the measure the section lists)
+    or singles out some of its items (a filter such as "methane"). Confidence is the share of
+    terms covered that way; negated queries are never answered extractively."""
+    if not LOOKUP_QUERY.match(query.strip()) or ANALYTIC_QUERY.search(query):
+        return None
+    tokens = set(tokenize(query))
+    if tokens & NEGATIONS:
+        return None
+    wanted_direction = _direction(tokens)
+    ids = {i.upper() for i in ENTITY_ID.findall(query)}
+    terms = {_stem(t) for t in tokens if t not in STOPWORDS and len(t) > 2
+             and t not in DESCENDING and t not in ASCENDING and t.upper() not in ids}
+    if not terms and not ids:
+        return None
+
+    best, best_coverage, best_items = None, 0.0, []
+    for section in _sections(context):
+        if not section["items"]:
+            continue
+        if any(not any(i in item for item in section["items"]) for i in ids):
+            continue
+        # Header: the section title plus the lines that introduce its list
+        header = {_stem(t) for line in [section["title"]] + [l for l in section["lines"] if not LIST_ITEM.match(l)]
+                  for t in tokenize(line)}
+        if wanted_direction and _direction(header) != wanted_direction:
+            continue
+        item_words = [{_stem(t) for t in tokenize(item)} for item in section["items"]]
+        selective = {t for t in terms - header if 0 < sum(1 for w in item_words if t in w) < len(item_words)}
+        coverage = len(terms & header | selective) / len(terms) if terms else 1.0
+        if coverage > best_coverage:
+            # Ids and filter terms narrow the list to the items they single out
+            items = [item for item, w in zip(section["items"], item_words)
+                     if all(i in item for i in ids) and (not selective or selective & w)]
+            best, best_coverage, best_items = section, coverage, items
+    if best is None or not best_items:
+        return None
+
+    intro = next((l.strip() for l in best["lines"] if l.strip() and not LIST_ITEM.match(l)), best["title"])
+    answer = f"**{intro.rstrip(':')}:**\n" + "\n".join(f"- {item}" for item in best_items[:max_items])
+    return {"answer": answer, "confidence": best_coverage}
+
+
+def grounding_score(answer: str, context: str) -> float:
+    """Share of ids and numbers in the answer that also appear in the context"""
+    facts = set(FACT.findall(answer))
+    if not facts:
+        return 1.0
+    return sum(1 for fact in facts if fact in context) / len(facts)
+
+
+def logprob_confidence(choice) -> Optional[float]:
+    """Geometric-mean token probability of a completion choice requested with logprobs"""
+    content = getattr(getattr(choice, "logprobs", None), "content", None)
+    if not content:
+        return None
+    return math.exp(sum(token.logprob for token in content) / len(content))
+
+
+def validate(answer: str, context: str, confidence: Optional[float], min_confidence: float,
+             min_grounding: float) -> Optional[str]:
+    """Reason to escalate a model answer, or None when it passes every check"""
+    if not answer or not answer.strip():
+        return "empty"
+    if REFUSAL.search(answer):
+        return "refusal"
+    if grounding_score(answer, context) < min_grounding:
+        return "ungrounded"
+    if confidence is not None and confidence < min_confidence:
+        return "low_confidence"
+    return None
@@ -0,0 +1,192 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from retrievers.bm25 import tokenize
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+HEADER_PATTERN = re.compile(r'^\*\*[^*]+:\*\*$')
+# Tool outputs whose rows only mean something under their title line (the agent's SQL and graph
+# headers); each is packed whole and ahead of document passages, which alone are ranked and dropped
+STRUCTURED_HEADERS = {"**Database Results:**", "**Knowledge Graph:**"}
+
+
+class ContextPacker:
+    """Deduplicate, rank and pack retrieved context into a token budget"""
+
+    def __init__(self, model: str = "gpt-4o-mini", token_budget: int = 1500,
+                 shingle_size: int = 5, duplicate_threshold: float = 0.8, min_words: int = 8):
+        self.token_budget = token_budget
+        self.shingle_size = shingle_size
+        self.duplicate_threshold = duplicate_threshold
+        self.min_words = min_words
+        self.encoding = self._load_encoding(model)
+
+    def _load_encoding(self, model: str):
+        """Tokenizer of the target model; fine-tuned names resolve to their base model"""
+        try:
+            import tiktoken
+            base = model.split(":")[1] if model.startswith("ft:") else model
+            try:
+                return tiktoken.encoding_for_model(base)
+            except KeyError:
+                return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            print(f" Tokenizer unavailable, estimating tokens from length: {e}")
+            return None
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            return math.ceil(len(text) / 4)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def _truncate(self, text: str, tokens: int) -> str:
+        if self.encoding is None:
+            return text[:tokens * 4]
+        return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:tokens])
+
+    def _shingles(self, text: str) -> set:
+        words = re.findall(r'\w+', text.lower())
+        if len(words) < self.shingle_size:
+            return {tuple(words)} if words else set()
+        return {tuple(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def _split(self, parts: List[str]) -> List[Dict]:
+        """Break each source into blank-line separated passages, keeping its header
+
+        Structured tool output stays one passage, so its title line and rows are kept together."""
+        passages = []
+        for source_index, part in enumerate(parts):
+            lines = part.strip().split("\n")
+            header = lines[0] if lines and HEADER_PATTERN.match(lines[0].strip()) else ""
+            body = "\n".join(lines[1:] if header else lines)
+            if header.strip() in STRUCTURED_HEADERS:
+                if body.strip():
+                    passages.append({"source": source_index, "header": header, "text": body.strip(),
+                                     "structured": True})
+                continue
+            for block in re.split(r'\n\s*\n', body):
+                if block.strip():
+                    passages.append({"source": source_index, "header": header, "text": block.strip(),
+                                     "structured": False})
+        return passages
+
+    def _dedupe(self, passages: List[Dict]) -> int:
+        """Drop sentences whose shingles were already seen, e.g. the overlap between adjacent chunks"""
+        seen, removed = set(), 0
+        for passage in passages:
+            if passage["structured"]:
+                continue
+            lines, has_content = [], False
+            for line in passage["text"].split("\n"):
+                # Bold labels such as hit titles are structure, not content
+                if line.strip().startswith("**"):
+                    lines.append(line)
+                    continue
+                kept = []
+                for sentence in SENTENCE_SPLIT.split(line.strip()):
+                    shingles = self._shingles(sentence)
+                    # Punctuation-only sentences (e.g. a markdown table rule) have no shingles
+                    if shingles and len(sentence.split()) >= self.min_words and \
+                            len(shingles & seen) / len(shingles) >= self.duplicate_threshold:
+                        removed += 1
+                        continue
+                    seen |= shingles
+                    kept.append(sentence)
+                if kept:
+                    indent = line[:len(line) - len(line.lstrip())]
+                    lines.append(indent + " ".join(kept))
+                    has_content = True
+            passage["text"] = "\n".join(lines).strip() if has_content else ""
+        return removed
+
+    def _fit_lines(self, text: str, tokens: int) -> str:
+        """Leading whole lines of text within tokens (a result's title and its first rows)"""
+        kept, used = [], 0
+        for line in text.split("\n"):
+            cost = self.count_tokens(line) + 1
+            if used + cost > tokens:
+                break
+            kept.append(line)
+            used += cost
+        return "\n".join(kept).strip()
+
+    def _rank(self, query: str, passages: List[Dict]):
+        """Score passages by BM25-style overlap with the query terms"""
+        terms = set(tokenize(query))
+        docs = [Counter(tokenize(p["text"])) for p in passages]
+        avg_len = sum(sum(d.values()) for d in docs) / max(len(docs), 1)
+
+        for passage, doc in zip(passages, docs):
+            length = sum(doc.values())
+            score = 0.0
+            for term in terms & doc.keys():
+                df = sum(1 for d in docs if term in d)
+                idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * doc[term] * 2.2 / (doc[term] + 1.2 * (0.25 + 0.75 * length / max(avg_len, 1)))
+            passage["score"] = score
+
+    def pack(self, query: str, parts: List[str]) -> Tuple[str, Dict]:
+        """Return packed context and token statistics for the given source outputs"""
+        original = "\n\n".join(parts)
+        tokens_before = self.count_tokens(original)
+
+        passages = self._split(parts)
+        duplicates = self._dedupe(passages)
+        passages = [p for p in passages if p["text"]]
+        self._rank(query, passages)
+
+        # A header costs budget only once a passage under it is selected
+        remaining, selected, used_headers = self.token_budget, [], set()
+
+        def header_cost(passage: Dict) -> int:
+            header = passage["header"]
+            return self.count_tokens(header) + 1 if header and header not in used_headers else 0
+
+        def take(index: int):
+            nonlocal remaining
+            passage = passages[index]
+            remaining -= header_cost(passage) + self.count_tokens(passage["text"]) + 1
+            used_headers.add(passage["header"])
+            selected.append(index)
+
+        # Structured results go in whole, in source order; only an oversized one loses trailing rows
+        for index, passage in enumerate(passages):
+            if not passage["structured"]:
+                continue
+            room = remaining - header_cost(passage) - 1
+            if self.count_tokens(passage["text"]) > room:
+                passage["text"] = self._fit_lines(passage["text"], room)
+            if passage["text"]:
+                take(index)
+
+        # Fill what is left with document passages best-first, then restore source order for readability
+        documents = [i for i, p in enumerate(passages) if not p["structured"]]
+        for index in sorted(documents, key=lambda i: (-passages[i]["score"], i)):
+            passage = passages[index]
+            room = remaining - header_cost(passage) - 1
+            if self.count_tokens(passage["text"]) <= room:
+                take(index)
+            elif not selected and room > 0:
+                # Nothing fits whole: keep the head of the best passage rather than an empty context
+                passage["text"] = self._truncate(passage["text"], room)
+                take(index)
+
+        sections = {}
+        for index in sorted(selected):
+            passage = passages[index]
+            sections.setdefault((passage["source"], passage["header"]), []).append(passage["text"])
+
+        packed = "\n\n".join(
+            "\n".join(([header] if header else []) + ["\n\n".join(texts)])
+            for (_, header), texts in sorted(sections.items())
+        )
+        tokens_after = self.count_tokens(packed)
+
+        return packed, {
+            "context_tokens": tokens_after,
+            "context_tokens_saved": max(tokens_before - tokens_after, 0),
+            "duplicate_sentences": duplicates,
+            "passages_dropped": len(passages) - len(selected)
+        }
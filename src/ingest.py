@@ -3,10 +3,45 @@ import duckdb
 from pathlib import Path
 from qdrant_client import QdrantClient
 import json
-from qdrant_client.models import Distance, VectorParams, PointStruct
+import re
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Set
+from qdrant_client.models import PointStruct
 from tools.document_parser import DocumentParser
+from retrievers.bm25 import BM25Index
+from retrievers.vector import ensure_collection
+from tools.text_store import TextStore
+from security.pii_filter import PIIFilter
+from security.compliance_tagger import ComplianceTagger
+
+# Which sources were PII-masked at ingestion, with per-table/column counts
+PII_TABLE = "pii_scan"
+
+# Columns never masked: keys that joins and entity lookups match on (customer_id, facility_id, ...)
+KEY_COLUMN = re.compile(r'(^|_)id$', re.IGNORECASE)
+
+# Compliance risk per chunk, and aggregated per document (keyed by doc_id)
+CHUNK_RISK_TABLE = "chunk_risk"
+DOCUMENT_RISK_TABLE = "document_risk"
+
+
+def load_premasked_sources(db_path="compass.duckdb") -> Set[str]:
+    """'structured' and/or 'unstructured' when that data was masked before it was stored"""
+    try:
+        with duckdb.connect(str(db_path)) as db:
+            return {row[0] for row in db.execute(f"SELECT DISTINCT source FROM {PII_TABLE}").fetchall()}
+    except Exception:
+        return set()
 
 class DataIngester:
+    # Keywords used to assign each document to one of the agent's domains
+    domain_keywords = {
+        "Finance": ["financial", "finance", "investment", "banking", "trading", "credit", "portfolio", "capital"],
+        "Biotech": ["clinical", "trial", "molecule", "laboratory", "biotech", "pharma", "adverse", "fda", "patient"],
+        "Energy": ["emission", "energy", "co2", "power", "gas", "epa", "pipeline", "facility"]
+    }
+    
     def __init__(self, db_path="compass.duckdb"):
         self.db_path = str(Path(db_path).resolve())
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
@@ -15,30 +50,69 @@ class DataIngester:
         self.embedder = embedding_engine if getattr(embedding_engine, 'available', False) else None
 
         self.vector_client = QdrantClient("localhost", port=6333)
+        self.pii_filter = PIIFilter()
+        self.compliance_tagger = ComplianceTagger()
 
     
     def get_db_path(self):
         return self.db_path
     
+    def _record_pii_scan(self, db, source: str, table_name: str, column_counts: Dict[str, Dict[str, int]]):
+        db.execute(f"""CREATE TABLE IF NOT EXISTS {PII_TABLE} (
+            source VARCHAR, table_name VARCHAR, column_name VARCHAR,
+            ssn INTEGER, email INTEGER, phone INTEGER, scanned_at TIMESTAMP)""")
+        db.execute(f"DELETE FROM {PII_TABLE} WHERE table_name = ?", [table_name])
+        now = datetime.now()
+        for column, counts in (column_counts or {"*": {}}).items():
+            db.execute(f"INSERT INTO {PII_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       [source, table_name, column, counts.get("ssn", 0), counts.get("email", 0),
+                        counts.get("phone", 0), now])
+    
+    def _text_columns(self, df: pd.DataFrame) -> list:
+        """String columns that hold free text: not keys, and not dates stored as strings"""
+        columns = []
+        for column in df.select_dtypes(include="object").columns:
+            if KEY_COLUMN.search(column):
+                continue
+            values = df[column].dropna()
+            if len(values) and pd.to_datetime(values, errors="coerce", format="ISO8601").notna().all():
+                continue
+            columns.append(column)
+        return columns
+    
+    def _mask_dataframe(self, df: pd.DataFrame) -> Dict[str, Dict[str, int]]:
+        """Mask PII in free-text columns in place; returns counts per column"""
+        column_counts = {}
+        for column in self._text_columns(df):
+            is_text = df[column].map(lambda v: isinstance(v, str))
+            masked, counts = self.pii_filter.mask_batch(df.loc[is_text, column].tolist())
+            df.loc[is_text, column] = masked
+            column_counts[column] = counts
+        return column_counts
+    
     def ingest_structured(self, data_path="data/structured"):
-        """Load CSV files into DuckDB"""
+        """Load CSV files into DuckDB, masking PII in free-text columns"""
         data_path = Path(data_path)
         data_path.mkdir(parents=True, exist_ok=True)
         
         with duckdb.connect(self.db_path) as db:
             existing = {row[0] for row in db.execute("SHOW TABLES").fetchall()} if self._safe_execute(db, "SHOW TABLES") else set()
+            scanned = {row[0] for row in self._safe_execute(db, f"SELECT table_name FROM {PII_TABLE}") or []}
             
             for csv_file in data_path.glob("*.csv"):
                 table_name = csv_file.stem
                 
-                # Skip if already has data
-                if table_name in existing and self._table_has_data(db, table_name):
+                # Skip if already has data; tables loaded before masking existed are reloaded
+                if table_name in existing and table_name in scanned and self._table_has_data(db, table_name):
                     continue
                 
                 try:
                     df = pd.read_csv(csv_file)
+                    column_counts = self._mask_dataframe(df)
                     db.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df")
-                    print(f" Loaded {len(df)} rows into {table_name}")
+                    self._record_pii_scan(db, "structured", table_name, column_counts)
+                    masked = sum(sum(c.values()) for c in column_counts.values())
+                    print(f" Loaded {len(df)} rows into {table_name} ({masked} PII values masked)")
                 except Exception as e:
                     print(f" Error loading {csv_file}: {e}")
     
@@ -58,37 +132,132 @@ class DataIngester:
             pass
         return False
     
+    def _load_customers(self) -> dict:
+        """Customer id -> company name, used to tag chunks with the customers they mention"""
+        try:
+            with duckdb.connect(self.db_path) as db:
+                return dict(db.execute("SELECT customer_id, company_name FROM customer").fetchall())
+        except Exception:
+            return {}
+    
+    def _detect_domain(self, text: str) -> str:
+        text = text.lower()
+        counts = Counter({domain: sum(text.count(k) for k in keywords)
+                          for domain, keywords in self.domain_keywords.items()})
+        domain, hits = counts.most_common(1)[0]
+        return domain if hits else "General"
+    
+    def _score_chunks(self, chunks: list) -> pd.DataFrame:
+        """Compliance risk per chunk: match counts and scores per category plus overall"""
+        texts = [chunk["text"] for chunk in chunks]
+        counts = self.compliance_tagger.count_batch(texts)
+        scores = self.compliance_tagger.score_batch(texts, counts)
+        scores.insert(0, "chunk_id", [chunk["id"] for chunk in chunks])
+        scores.insert(1, "doc_id", [chunk["doc_id"] for chunk in chunks])
+        scores["matches"] = counts.sum(axis=1)
+        scores["words"] = [len(text.split()) for text in texts]
+        return scores
+    
+    def _store_chunk_risk(self, risk: pd.DataFrame):
+        """Replace chunk_risk and the per-document rollup, indexed for doc_id lookups"""
+        categories = self.compliance_tagger.categories
+        per_category = ", ".join(f'max("{c}") AS "{c}"' for c in categories)
+        with duckdb.connect(self.db_path) as db:
+            db.execute(f"CREATE OR REPLACE TABLE {CHUNK_RISK_TABLE} AS SELECT * FROM risk")
+            db.execute(f"CREATE INDEX {CHUNK_RISK_TABLE}_doc ON {CHUNK_RISK_TABLE}(doc_id)")
+            # Document risk is that of its riskiest chunk; density spreads matches over all its words
+            db.execute(f"""CREATE OR REPLACE TABLE {DOCUMENT_RISK_TABLE} AS
+                SELECT doc_id, count(*) AS chunks, {per_category}, max(overall) AS overall,
+                       avg(overall) AS mean_overall, sum(matches) AS matches,
+                       sum(matches) * 100.0 / greatest(sum(words), 1) AS matches_per_100_words
+                FROM {CHUNK_RISK_TABLE} GROUP BY doc_id""")
+            db.execute(f"CREATE UNIQUE INDEX {DOCUMENT_RISK_TABLE}_doc ON {DOCUMENT_RISK_TABLE}(doc_id)")
+    
+    def _chunk_payloads(self, documents: list, chunks: list, risk: pd.DataFrame = None) -> list:
+        """Attach domain, document type, source, date, customer ids and risk scores to every chunk"""
+        customers = self._load_customers()
+        names = {name.lower(): cid for cid, name in customers.items()}
+        docs = {doc["id"]: doc for doc in documents}
+        domains = {doc_id: self._detect_domain(doc["content"]) for doc_id, doc in docs.items()}
+        
+        categories = self.compliance_tagger.categories
+        risk_rows = risk.to_dict("records") if risk is not None else [None] * len(chunks)
+        
+        payloads = []
+        for chunk, risk_row in zip(chunks, risk_rows):
+            doc = docs.get(chunk["doc_id"], {})
+            text = chunk["text"]
+            mentioned = set(re.findall(r'\bC\d{3}\b', text)) & set(customers)
+            mentioned |= {cid for name, cid in names.items() if name in text.lower()}
+            
+            # Text lives in the text store; the payload keeps ids and filterable fields only
+            payloads.append({
+                **{k: v for k, v in chunk.items() if k != "text"},
+                "source": doc.get("source", "unknown"),
+                "type": doc.get("type", "document"),
+                "domain": domains.get(chunk["doc_id"], "General"),
+                "date": doc.get("metadata", {}).get("date"),
+                "customer_ids": sorted(mentioned),
+                **self._risk_payload(risk_row, categories)
+            })
+        return payloads
+    
+    def _risk_payload(self, risk_row: Dict, categories: list) -> Dict:
+        """Filterable risk fields: scores by category and the categories that matched"""
+        if risk_row is None:
+            return {}
+        return {
+            "risk": {key: round(float(risk_row[key]), 4) for key in [*categories, "overall"]},
+            "risk_categories": [c for c in categories if risk_row[c] > 0]
+        }
+    
     def ingest_unstructured(self, data_path="data/unstructured"):
 
         """Parse documents and create embeddings"""
         data_path = Path(data_path)
         data_path.mkdir(parents=True, exist_ok=True)
         
-        # Initialize document parser
-        parser = DocumentParser(chunk_size=1000, chunk_overlap=200)
+        # Initialize document parser; documents are PII-masked before chunking
+        parser = DocumentParser(chunk_size=1000, chunk_overlap=200, pii_filter=self.pii_filter)
         
         # Parse all documents and save to JSONL
         output_path = data_path / "parsed.jsonl"
         documents, chunks = parser.parse_directory(data_path, output_path)
         
+        with duckdb.connect(self.db_path) as db:
+            self._record_pii_scan(db, "unstructured", "documents",
+                                  {doc["id"]: doc["metadata"].get("pii_counts", {}) for doc in documents})
+        masked = sum(sum(doc["metadata"].get("pii_counts", {}).values()) for doc in documents)
+        print(f" Masked {masked} PII values across {len(documents)} documents")
+        
+        # Compliance terms are tagged once here instead of scanning retrieved text per query
+        risk = self._score_chunks(chunks)
+        self._store_chunk_risk(risk)
+        print(f" Risk-tagged {len(chunks)} chunks ({int((risk['overall'] > 0).sum())} with compliance terms)")
+        
+        # Chunk text is stored out of line from the vector payloads
+        written = TextStore().put_many({chunk["id"]: chunk["text"] for chunk in chunks})
+        print(f" Text store updated ({written} chunks written)")
+        
+        # Keyword index only tokenizes chunks it has not seen
+        added = BM25Index().update(output_path)
+        print(f" BM25 index updated ({added} new chunks)")
         
         # Vector storage using chunks
         if self.embedder and self.vector_client:
             try:
-                # Setup collection (ignore if exists)
-                try:
-                    self.vector_client.create_collection("documents", vectors_config=VectorParams(size=384, distance=Distance.COSINE))
-                except:
-                    pass
+                # Setup collection and payload indexes (ignore if exists)
+                ensure_collection(self.vector_client, "documents")
                 
                 # Store chunks with embeddings
                 texts = [chunk["text"] for chunk in chunks]
                 embeddings = self.embedder.encode(texts)
+                payloads = self._chunk_payloads(documents, chunks, risk)
                 points = [
                     PointStruct(
                         id=i, 
                         vector=embeddings[i].tolist(), 
-                        payload=chunks[i]
+                        payload=payloads[i]
                     ) for i in range(len(chunks))
                 ]
                 
@@ -0,0 +1,163 @@
+from typing import Dict, List, Optional
+
+from src.router import KeywordMatcher
+
+# Bump whenever any static block below changes; logged with every query
+PROMPT_VERSION = "3"
+
+SYSTEM_ROLE = "You are AllyIn Compass, an enterprise AI assistant. Provide clear, structured answers with key insights highlighted."
+
+RULES = """Use the context in the user message to answer the question comprehensively.
+Rules:
+- Give specific names, numbers, and facts from the data
+- Don't add explanations or business advice
+- If asked for "which customers", list the exact customer names
+- If asked for numbers, give the exact values
+- Keep answers short and factual
+- Use bullet points for lists
+
+Provide a clear, structured answer with key insights."""
+
+DOMAIN_FOCUS = {
+    "Finance": "Focus on financial metrics, revenue, risk analysis, and regulatory compliance.",
+    "Biotech": "Emphasize research findings, clinical data, safety protocols, and lab compliance.",
+    "Energy": "Highlight environmental impact, emissions data, facility operations, and sustainability."
+}
+
+# Few-shot examples for response formatting
+FEW_SHOT_TEMPLATES = {
+    "high_risk_query": {
+        "keywords": ["high risk", "risky customer", "risk customer"],
+        "template": """### High-Risk Customers Identified
+
+**1. High-Risk Customers:**
+   - **[Customer Name 1]**
+   - **[Customer Name 2]**
+
+### Key Insights
+
+**A. Risk Analysis:**
+   - [Risk categorization details based on operational practices and violations]
+
+**B. Risk Connection Analysis:**
+   - **[Customer 1]:**
+     - Associated with **[Risk Type]** due to [specific reasons]
+   - **[Customer 2]:**
+     - Linked to **[Risk Type]** stemming from [specific issues]
+
+**C. Risk Propagation Effects:**
+   - **[Risk Category 1]:**
+     - [Impact description and long-term implications]
+   - **[Risk Category 2]:**
+     - [Relationship effects and consequences]
+
+### Conclusion
+[Summary of identified high-risk customers and monitoring recommendations]"""
+    },
+    "financial_analysis": {
+        "keywords": ["revenue", "profit", "financial performance", "top customers"],
+        "template": """### Financial Analysis Results
+
+**1. Key Financial Metrics:**
+   - **Total Revenue:** [Amount]
+   - **Top Performers:** [List]
+
+### Detailed Breakdown
+
+**A. Performance Analysis:**
+   - [Financial metrics and trends]
+
+**B. Customer Segmentation:**
+   - **High-Value Customers:** [Details]
+   - **Growth Opportunities:** [Analysis]
+
+### Summary
+[Key financial insights and recommendations]"""
+    }
+}
+
+# USD per million input tokens: (uncached, cached); longest matching prefix wins
+INPUT_PRICING = {
+    "gpt-4o-mini": (0.15, 0.075),
+    "gpt-4o": (2.50, 1.25),
+    "ft:gpt-4o-mini": (0.30, 0.15),
+    "ft:gpt-4o": (3.75, 1.875)
+}
+
+# USD per million output tokens, same prefix matching
+OUTPUT_PRICING = {
+    "gpt-4o-mini": 0.60,
+    "gpt-4o": 10.00,
+    "ft:gpt-4o-mini": 1.20,
+    "ft:gpt-4o": 15.00
+}
+
+
+# Shared by every request. It is far below the provider's 1024-token caching minimum, so
+# hits come from requests repeating domain, format and context; carrying every domain focus
+# and format here would add their tokens to each call without making the prefix cacheable
+STATIC_PREFIX = f"{SYSTEM_ROLE}\n\n{RULES}"
+
+
+TEMPLATE_MATCHER = KeywordMatcher({key: example["keywords"] for key, example in FEW_SHOT_TEMPLATES.items()})
+
+
+def select_template(query: str) -> Optional[str]:
+    """Name of the few-shot format whose keywords appear in the query"""
+    return TEMPLATE_MATCHER.first(query)
+
+
+def request_blocks(domain: str = None, template: str = None) -> List[str]:
+    """Domain focus and response format a request selects, placed before its context"""
+    blocks = []
+    if domain in DOMAIN_FOCUS:
+        blocks.append(f"Domain focus ({domain}): {DOMAIN_FOCUS[domain]}")
+    if template in FEW_SHOT_TEMPLATES:
+        blocks.append("Response format (fill with actual data from the context):\n"
+                      f"{FEW_SHOT_TEMPLATES[template]['template']}")
+    return blocks
+
+
+def build_messages(query: str, context: str, domain: str = None, template: str = None) -> List[Dict]:
+    """Static system prefix first so providers can reuse its cached KV; per-request content last"""
+    blocks = request_blocks(domain, template) + [f"Context:\n{context}", f"Question: {query}"]
+    return [
+        {"role": "system", "content": STATIC_PREFIX},
+        {"role": "user", "content": "\n\n".join(blocks)}
+    ]
+
+
+def _pricing(model: str, table: Dict = INPUT_PRICING):
+    matches = [prefix for prefix in table if model.startswith(prefix)]
+    return table[max(matches, key=len)] if matches else None
+
+
+def request_cost(model: str, usage) -> float:
+    """USD cost of one completion from its usage, cached prompt tokens at the discounted rate"""
+    if usage is None:
+        return 0.0
+    input_price, output_price = _pricing(model), _pricing(model, OUTPUT_PRICING)
+    if input_price is None or output_price is None:
+        return 0.0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    uncached = (getattr(usage, "prompt_tokens", 0) or 0) - cached
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    return (uncached * input_price[0] + cached * input_price[1] + completion * output_price) / 1_000_000
+
+
+def prompt_cache_stats(model: str, usage) -> Dict:
+    """Cached-token share of the prompt and the input cost it saved, from an OpenAI usage object"""
+    if usage is None:
+        return {}
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    pricing = _pricing(model)
+    saved = cached_tokens * (pricing[0] - pricing[1]) / 1_000_000 if pricing else 0.0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached_tokens,
+        "prompt_cache_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+        "prompt_cache_savings_usd": round(saved, 8)
+    }
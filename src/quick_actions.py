@@ -0,0 +1,31 @@
+# One-click prompts per domain: (button label, query). The UI shows them and src/warmup.py
+# pre-executes them so the first click is answered from warm caches.
+QUICK_ACTIONS = {
+    "Finance": [
+        ("📊 Revenue Analytics", "Show me top customers by revenue"),
+        ("🎯 Risk Analysis", "Which customers are high risk?"),
+        ("💰 Profit Margins", "Show profit margins by customer")
+    ],
+    "Biotech": [
+        ("🧪 Lab Compliance", "Which labs have safety violations?"),
+        ("⚗️ Clinical Trials", "Show clinical trial compliance status"),
+        ("🔬 Research Issues", "Find research protocol deviations")
+    ],
+    "Energy": [
+        ("⚠️ Emissions Violations", "Find CO2 emissions violations"),
+        ("🏭 Facility Status", "Show facility emission levels"),
+        ("🌱 Green Compliance", "Environmental compliance status")
+    ]
+}
+
+# Further examples listed under "More queries"
+SAMPLE_QUERIES = {
+    "Finance": ["What's our total revenue by sector?", "Find financial performance trends"],
+    "Biotech": ["Find adverse outcomes for molecule X", "Patient data privacy compliance"],
+    "Energy": ["Renewable energy adoption rates", "Carbon footprint by facility"]
+}
+
+
+def domain_query(domain: str, query: str) -> str:
+    """Query as the UI submits it, tagged with the selected domain for the agent"""
+    return f"[Domain: {domain}] {query}"
@@ -1,9 +1,19 @@
-import openai
-from typing import Dict
+import time
+from typing import Dict, Iterator, List, Optional
+
+from config.settings import Settings
+from src.cascade import extractive_answer, logprob_confidence, validate
+from src.prompts import PROMPT_VERSION, build_messages, prompt_cache_stats, request_cost
+from tools.llm_cache import request_key, response_cache
+from tools.llm_client import llm_client
+from tools.tracing import span
+
+# Sampling parameters are part of the cache key alongside model and messages
+GENERATION_PARAMS = {"max_tokens": 400, "temperature": 0.1}
 
 class RAGPipeline:
     def __init__(self, api_key: str):
-        self.client = openai.OpenAI(api_key=api_key) if api_key else None
+        self.client = llm_client.openai(api_key) if api_key else None
         
         # Try to load fine-tuned model
         try:
@@ -12,49 +22,167 @@ class RAGPipeline:
             print(f" Using fine-tuned model: {self.model}")
         except:
             self.model = "gpt-4o-mini"
-            
+        
+        # Cascade tiers: extractive template, then the small model, then self.model
+        self.cascade = Settings.CASCADE_ENABLED
+        self.small_model = Settings.CASCADE_SMALL_MODEL if Settings.CASCADE_SMALL_MODEL != self.model else None
+        
+        # Answers cached under a previous model are dropped once model.txt points elsewhere
+        self.cache = response_cache if Settings.LLM_CACHE_ENABLED else None
+        if self.cache:
+            self.cache.retain_model("rag", self.model)
     
-    def generate_answer(self, query: str, context: str) -> Dict:
-        """Generate answer using context"""
-        if not self.client:
-            return {
-                "answer": f"Based on available data:\n\n{context[:300]}...",
-                "tokens_used": 0
+    def _cached_answer(self, key: str) -> Optional[Dict]:
+        entry = self.cache.get(key) if self.cache else None
+        if entry is None:
+            return None
+        return {"answer": entry["response"], "tokens_used": 0, "cached": True, "tokens_saved": entry["tokens"]}
+    
+    def _cache_answer(self, key: str, answer: str, tokens_used: int):
+        if self.cache and answer:
+            self.cache.put(key, "rag", self.model, answer, tokens_used)
+    
+    def _complete(self, model: str, messages: List[Dict], logprobs: bool = False) -> Dict:
+        with span("llm.completion", model=model) as s:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                logprobs=logprobs,
+                **GENERATION_PARAMS
+            )
+            choice = response.choices[0]
+            result = {
+                "answer": choice.message.content,
+                "tokens_used": response.usage.total_tokens,
+                "confidence": logprob_confidence(choice) if logprobs else None,
+                "cost_usd": request_cost(model, response.usage),
+                **prompt_cache_stats(model, response.usage)
             }
+            s.set(tokens=result["tokens_used"], cached_prompt_tokens=result.get("cached_prompt_tokens"))
+        return result
+    
+    def _early_tiers(self, query: str, context: str, messages: List[Dict], key: str, cascade: Dict) -> Optional[Dict]:
+        """Extractive answer, response cache, then the small model; None means the full model is needed"""
+        if self.cascade:
+            start = time.perf_counter()
+            with span("llm.extractive") as s:
+                extracted = extractive_answer(query, context)
+                s.set(confidence=extracted["confidence"] if extracted else None)
+            cascade["tiers_tried"].append("extractive")
+            cascade["tier_latency"]["extractive"] = time.perf_counter() - start
+            if extracted and extracted["confidence"] >= Settings.CASCADE_EXTRACTIVE_MIN_CONFIDENCE:
+                cascade["tier"] = "extractive"
+                return {"answer": extracted["answer"], "tokens_used": 0}
+            cascade["escalation_reason"] = "no_structured_match" if extracted is None else "low_coverage"
+        
+        cached = self._cached_answer(key)
+        if cached:
+            cascade["tier"] = "cache"
+            return cached
+        
+        if self.cascade and self.small_model and self.client:
+            start = time.perf_counter()
+            cascade["tiers_tried"].append("small")
+            try:
+                result = self._complete(self.small_model, messages, logprobs=True)
+            except Exception:
+                # Timeouts, provider errors or logprobs not supported: the full model still answers
+                cascade["tier_latency"]["small"] = time.perf_counter() - start
+                cascade["escalation_reason"] = "small_error"
+                return None
+            cascade["tier_latency"]["small"] = time.perf_counter() - start
+            cascade["cost_usd"] += result["cost_usd"]
+            reason = validate(result["answer"], context, result["confidence"],
+                              Settings.CASCADE_MIN_CONFIDENCE, Settings.CASCADE_MIN_GROUNDING)
+            if reason is None:
+                cascade["tier"] = "small"
+                self._cache_answer(key, result["answer"], result["tokens_used"])
+                return result
+            cascade["escalation_reason"] = reason
+        return None
+    
+    def _with_cascade(self, result: Dict, cascade: Dict) -> Dict:
+        result = {**result, **cascade, "cost_usd": round(cascade["cost_usd"], 8), "prompt_version": PROMPT_VERSION}
+        result.pop("confidence", None)
+        return result
+    
+    def generate_answer(self, query: str, context: str, domain: str = None, template: str = None) -> Dict:
+        """Generate answer using context; domain and template select the focus and format blocks of the prompt"""
+        cascade = {"tier": None, "tiers_tried": [], "tier_latency": {}, "escalation_reason": None, "cost_usd": 0.0}
+        messages = build_messages(query, context, domain, template)
+        key = request_key("rag", self.model, messages, GENERATION_PARAMS)
         
-        prompt = f"""Use the following context to answer the question comprehensively.
-
-Context:
-{context}
-
-Question: {query}
-Rules:
-- Give specific names, numbers, and facts from the data
-- Don't add explanations or business advice
-- If asked for "which customers", list the exact customer names
-- If asked for numbers, give the exact values
-- Keep answers short and factual
-- Use bullet points for lists
-
-Provide a clear, structured answer with key insights:"""
-
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are AllyIn Compass, an enterprise AI assistant. Provide clear, structured answers with key insights highlighted."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=400,
-                temperature=0.1
-            )
+            early = self._early_tiers(query, context, messages, key, cascade)
+            if early:
+                return self._with_cascade(early, cascade)
             
-            return {
-                "answer": response.choices[0].message.content,
-                "tokens_used": response.usage.total_tokens
-            }
+            if not self.client:
+                return {
+                    "answer": f"Based on available data:\n\n{context[:300]}...",
+                    "tokens_used": 0
+                }
+            
+            start = time.perf_counter()
+            result = self._complete(self.model, messages)
+            cascade["tiers_tried"].append("full")
+            cascade["tier_latency"]["full"] = time.perf_counter() - start
+            cascade["cost_usd"] += result["cost_usd"]
+            cascade["tier"] = "full"
+            self._cache_answer(key, result["answer"], result["tokens_used"])
+            return self._with_cascade(result, cascade)
         except Exception as e:
             return {
                 "answer": f"Based on available data:\n\n{context[:300]}...\n\nNote: {str(e)}",
                 "tokens_used": 0
-            }
\ No newline at end of file
+            }
+    
+    def stream_answer(self, query: str, context: str, domain: str = None, template: str = None) -> Iterator[Dict]:
+        """Stream the answer as token events, followed by a done event with tokens_used
+        
+        Early tiers are validated before anything is shown, so their answer arrives as one event;
+        only the full model streams token by token."""
+        cascade = {"tier": None, "tiers_tried": [], "tier_latency": {}, "escalation_reason": None, "cost_usd": 0.0}
+        messages = build_messages(query, context, domain, template)
+        key = request_key("rag", self.model, messages, GENERATION_PARAMS)
+        
+        tokens_used, pieces, cache_stats = 0, [], {}
+        try:
+            early = self._early_tiers(query, context, messages, key, cascade)
+            if early:
+                early = self._with_cascade(early, cascade)
+                yield {"type": "token", "text": early.pop("answer")}
+                yield {"type": "done", **early}
+                return
+            
+            if not self.client:
+                yield {"type": "token", "text": f"Based on available data:\n\n{context[:300]}..."}
+                yield {"type": "done", "tokens_used": 0}
+                return
+            
+            start = time.perf_counter()
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                **GENERATION_PARAMS,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                # The final chunk carries usage and no choices
+                if chunk.usage:
+                    tokens_used = chunk.usage.total_tokens
+                    cache_stats = prompt_cache_stats(self.model, chunk.usage)
+                    cascade["cost_usd"] += request_cost(self.model, chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    pieces.append(chunk.choices[0].delta.content)
+                    yield {"type": "token", "text": chunk.choices[0].delta.content}
+            cascade["tiers_tried"].append("full")
+            cascade["tier_latency"]["full"] = time.perf_counter() - start
+            cascade["tier"] = "full"
+            self._cache_answer(key, "".join(pieces), tokens_used)
+        except Exception as e:
+            fallback = f"\n\nNote: {str(e)}" if pieces else f"Based on available data:\n\n{context[:300]}...\n\nNote: {str(e)}"
+            yield {"type": "token", "text": fallback}
+        
+        yield {"type": "done", **self._with_cascade({"tokens_used": tokens_used, **cache_stats}, cascade)}
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import re
+import sys
+import duckdb
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from retrievers.graph_snapshot import GraphSnapshot, EDGE_TYPES, NODE_TYPES
+from security.compliance_tagger import ComplianceTagger
+from tools.data_version import get_data_version
+
+RISK_TABLE = "entity_risk"
+META_TABLE = "entity_risk_meta"
+
+
+class RiskScorer:
+    """Batch job materializing propagated risk scores per customer and facility
+
+    A run recomputes every entity: propagation normalises over the whole graph, so a change
+    anywhere can move any score. Only the writes are incremental, limited to entities whose
+    inputs hash differently."""
+
+    # Contribution of each signal to the propagated score
+    weights = {
+        "base_risk": 0.35,
+        "exceedance_risk": 0.25,
+        "graph_risk": 0.25,
+        "document_risk": 0.15
+    }
+
+    def __init__(self, db_path="compass.duckdb", parsed_path="data/unstructured/parsed.jsonl",
+                 damping: float = 0.85, iterations: int = 30):
+        self.db_path = str(Path(db_path).resolve())
+        self.parsed_path = Path(parsed_path)
+        self.damping = damping
+        self.iterations = iterations
+        self.tagger = ComplianceTagger()
+
+    def _stored_version(self, db) -> str:
+        try:
+            row = db.execute(f"SELECT input_version FROM {META_TABLE}").fetchone()
+            return row[0] if row else None
+        except duckdb.Error:
+            return None
+
+    def _input_version(self) -> str:
+        """Source data version plus what document risk also reads: parsed chunks and the term list"""
+        digest = hashlib.sha1(get_data_version().encode())
+        if self.parsed_path.exists():
+            stat = self.parsed_path.stat()
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns};".encode())
+        digest.update(json.dumps(self.tagger.risk_terms, sort_keys=True).encode())
+        return digest.hexdigest()[:16]
+
+    def run(self, force: bool = False) -> int:
+        """Recompute scores when inputs changed; returns the number of rows written"""
+        version = self._input_version()
+        with duckdb.connect(self.db_path) as db:
+            if not force and self._stored_version(db) == version:
+                print(" Risk scores up to date")
+                return 0
+
+        snapshot = GraphSnapshot(self.db_path)
+        if not snapshot.available:
+            return 0
+
+        scores = self._compute(snapshot)
+        written = self._store(scores, version)
+        print(f" Risk scores refreshed ({written} of {len(scores)} entities changed)")
+        return written
+
+    def _propagate(self, snapshot: GraphSnapshot) -> np.ndarray:
+        """Personalised PageRank seeded with each node's own risk over ownership/violation edges"""
+        spread_types = ["OWNS", "OWNED_BY", "HAS_VIOLATION", "VIOLATION_OF"]
+        keep = np.isin(snapshot.edge_type, [EDGE_TYPES.index(t) for t in spread_types])
+
+        sources = np.repeat(np.arange(snapshot.num_nodes), np.diff(snapshot.indptr))[keep]
+        targets = snapshot.indices[keep]
+        out_degree = np.bincount(sources, minlength=snapshot.num_nodes).astype(np.float64)
+
+        seed = snapshot.node_risk.astype(np.float64)
+        seed = seed / seed.sum() if seed.sum() > 0 else np.full(snapshot.num_nodes, 1 / snapshot.num_nodes)
+        rank = seed.copy()
+
+        for _ in range(self.iterations):
+            share = np.divide(rank, out_degree, out=np.zeros_like(rank), where=out_degree > 0)
+            spread = np.bincount(targets, weights=share[sources], minlength=snapshot.num_nodes)
+            rank = (1 - self.damping) * seed + self.damping * spread
+
+        return rank / rank.max() if rank.max() > 0 else rank
+
+    def _document_density(self, entities: Dict[str, List[str]]) -> Dict[str, float]:
+        """Compliance-term matches per 100 words across chunks mentioning each entity"""
+        if not self.parsed_path.exists():
+            return {}
+
+        matches = {entity_id: 0 for entity_id in entities}
+        words = {entity_id: 0 for entity_id in entities}
+        aliases = {
+            entity_id: re.compile(r'\b(' + '|'.join(re.escape(a) for a in names) + r')\b', re.IGNORECASE)
+            for entity_id, names in entities.items()
+        }
+
+        texts, mentions = [], []
+        with open(self.parsed_path, 'r') as f:
+            for line in f:
+                try:
+                    text = json.loads(line)["text"]
+                except (ValueError, KeyError):
+                    continue
+                mentioned = [entity_id for entity_id, pattern in aliases.items() if pattern.search(text)]
+                if mentioned:
+                    texts.append(text)
+                    mentions.append(mentioned)
+
+        # One automaton pass per chunk, all categories at once
+        hits = self.tagger.count_batch(texts).sum(axis=1)
+        for text, mentioned, count in zip(texts, mentions, hits):
+            for entity_id in mentioned:
+                matches[entity_id] += int(count)
+                words[entity_id] += len(text.split())
+
+        return {
+            entity_id: min(matches[entity_id] / max(words[entity_id] / 100, 1), 1.0)
+            for entity_id in entities if words[entity_id]
+        }
+
+    def _compute(self, snapshot: GraphSnapshot) -> pd.DataFrame:
+        graph_risk = self._propagate(snapshot)
+        customer_type, facility_type = NODE_TYPES.index("customer"), NODE_TYPES.index("facility")
+
+        rows = []
+        for i, entity_id in enumerate(snapshot.node_ids):
+            if snapshot.node_type[i] not in (customer_type, facility_type):
+                continue
+            attrs = snapshot.node_attrs[i]
+            is_customer = snapshot.node_type[i] == customer_type
+
+            # Exceedance ratio of the entity itself (facility) or of everything it owns (customer)
+            violations = snapshot.neighbourhood(entity_id, k=2 if is_customer else 1, node_types=["violation"])
+            exceedance = max((min(v["ratio"] - 1, 1.0) for v in violations), default=0.0)
+
+            owner = entity_id if is_customer else attrs.get("customer_id")
+            base = float(snapshot.node_risk[snapshot.node_index[owner]]) if owner in snapshot.node_index else 0.0
+
+            rows.append({
+                "entity_id": entity_id,
+                "entity_type": NODE_TYPES[snapshot.node_type[i]],
+                "name": snapshot.node_names[i],
+                "customer_id": owner,
+                "base_risk": base,
+                "exceedance_risk": exceedance,
+                "graph_risk": float(graph_risk[i])
+            })
+
+        if not rows:
+            return pd.DataFrame(columns=["entity_id", "input_hash"])
+
+        df = pd.DataFrame(rows)
+        density = self._document_density({row["entity_id"]: [row["entity_id"], row["name"]] for row in rows})
+        df["document_risk"] = df["entity_id"].map(density).fillna(0.0)
+        df["propagated_risk"] = sum(df[col] * w for col, w in self.weights.items()).round(4)
+
+        # Per-entity input hash drives incremental upserts
+        df["input_hash"] = df.apply(
+            lambda r: hashlib.sha1(
+                json.dumps([r["name"], r["customer_id"]] + [round(r[c], 4) for c in self.weights]).encode()
+            ).hexdigest()[:16], axis=1
+        )
+        return df
+
+    def _store(self, df: pd.DataFrame, version: str) -> int:
+        with duckdb.connect(self.db_path) as db:
+            db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {RISK_TABLE} (
+                    entity_id VARCHAR PRIMARY KEY,
+                    entity_type VARCHAR,
+                    name VARCHAR,
+                    customer_id VARCHAR,
+                    base_risk DOUBLE,
+                    exceedance_risk DOUBLE,
+                    graph_risk DOUBLE,
+                    document_risk DOUBLE,
+                    propagated_risk DOUBLE,
+                    input_hash VARCHAR,
+                    updated_at TIMESTAMP
+                )
+            """)
+            existing = dict(db.execute(f"SELECT entity_id, input_hash FROM {RISK_TABLE}").fetchall())
+
+            changed = df[df["entity_id"].map(existing) != df["input_hash"]].copy()
+            changed["updated_at"] = datetime.now()
+            removed = [entity_id for entity_id in existing if entity_id not in set(df["entity_id"])]
+
+            if removed:
+                db.execute(f"DELETE FROM {RISK_TABLE} WHERE entity_id IN (SELECT unnest(?))", [removed])
+            if len(changed):
+                db.execute(f"INSERT OR REPLACE INTO {RISK_TABLE} BY NAME SELECT * FROM changed")
+
+            db.execute(f"CREATE OR REPLACE TABLE {META_TABLE} AS SELECT ? AS input_version, now() AS computed_at",
+                       [version])
+
+        return len(changed)
+
+
+def load_risk_scores(db_path="compass.duckdb") -> Dict[str, Dict]:
+    """Load materialized scores keyed by entity id for constant-time lookups"""
+    try:
+        with duckdb.connect(str(Path(db_path).resolve())) as db:
+            df = db.execute(f"SELECT * FROM {RISK_TABLE}").fetchdf()
+    except duckdb.Error:
+        return {}
+    return {row["entity_id"]: row for row in df.to_dict("records")}
+
+
+if __name__ == "__main__":
+    RiskScorer().run(force="--force" in sys.argv)
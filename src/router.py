@@ -0,0 +1,429 @@
+"""Tool routing: a compiled keyword matcher plus a query-embedding classifier
+
+The classifier predicts, per tool, the probability that the tool returns something the
+answer can use. It is trained offline from query log spans (each tool span records whether
+its result contributed) and, with --run-tools, by running every tool on logged queries:
+
+    python src/router.py --run-tools
+
+Thresholds are picked on cross-validated probabilities so that each tool keeps at least
+ROUTER_MIN_RECALL of the queries it contributes to; the calibration report is printed and
+written next to the model.
+"""
+import argparse
+import json
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import Settings
+
+TOOLS = ["sql", "vector", "graph"]
+DOMAINS = ["Finance", "Biotech", "Energy", "General"]
+
+# Domain-specific tool priorities
+DOMAIN_TOOLS = {
+    "Finance": ["sql", "vector", "graph"],
+    "Biotech": ["vector", "graph", "sql"],
+    "Energy": ["graph", "vector", "sql"]
+}
+
+# Words that name a tool's data; "comprehensive" queries fan out to every tool.
+# A bare "risk" is deliberately absent: it appears in queries for all three sources.
+ROUTE_KEYWORDS = {
+    "sql": ["customer", "revenue", "financial", "profit", "top", "metric", "risk score", "riskiest", "risky"],
+    "vector": ["report", "document", "audit", "compliance", "research", "finding"],
+    "graph": ["violation", "emission", "facility", "relationship", "connected", "exposed", "exposure", "propagat"],
+    "comprehensive": ["high risk", "analysis", "overview", "assessment", "status"],
+}
+
+# Tool outputs that carry no data for the answer
+NO_DATA = re.compile(r'^(?:No relevant documents found|Graph database unavailable|Available graph queries|'
+                     r'\w+ search error|Agent stopped|I don\'t know)', re.IGNORECASE)
+
+
+class KeywordMatcher:
+    """Keyword groups compiled into one alternation, matched on word boundaries in one scan
+
+    Terms match at the start of a word and may take a plural ending ("violation" matches
+    "violations"); a term ending in a partial stem ("propagat") matches any word it starts."""
+
+    def __init__(self, groups: Dict[str, Iterable[str]], stems: Iterable[str] = ()):
+        self.groups = list(groups)
+        self.term_group = {}
+        for group, terms in groups.items():
+            for term in terms:
+                self.term_group.setdefault(term.lower(), group)
+        stems = set(stems)
+        # Longest first, so "high risk" wins over a shorter term at the same position
+        alternatives = []
+        for term in sorted(self.term_group, key=len, reverse=True):
+            suffix = r'\w*' if term in stems else r'(?:s|es)?\b'
+            alternatives.append(re.escape(term) + suffix)
+        self.pattern = re.compile(r'\b(?:' + "|".join(f"({a})" for a in alternatives) + r')', re.IGNORECASE)
+        self.order = sorted(self.term_group, key=len, reverse=True)
+
+    def match(self, text: str) -> Dict[str, List[str]]:
+        """Matched terms by group"""
+        found: Dict[str, List[str]] = {}
+        for m in self.pattern.finditer(text):
+            term = self.order[m.lastindex - 1]
+            found.setdefault(self.term_group[term], []).append(term)
+        return found
+
+    def first(self, text: str) -> Optional[str]:
+        """Group of the earliest group (in definition order) with a match"""
+        found = self.match(text)
+        return next((group for group in self.groups if group in found), None)
+
+
+ROUTE_MATCHER = KeywordMatcher(ROUTE_KEYWORDS, stems=["propagat"])
+
+
+def query_cluster(query: str) -> str:
+    """Coarse query cluster for the routing policy: the keyword groups the query matches"""
+    return "+".join(sorted(ROUTE_MATCHER.match(query))) or "other"
+
+
+def contributes(result: str) -> bool:
+    """Whether a tool result carries data (not an empty, unavailable or error message)"""
+    text = (result or "").strip()
+    return bool(text) and not NO_DATA.match(text)
+
+
+def _features(embeddings: np.ndarray, domains: Sequence[str]) -> np.ndarray:
+    """Unit-length query embeddings with a domain one-hot appended"""
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    onehot = np.array([[d == domain for domain in DOMAINS] for d in domains], dtype=np.float64)
+    return np.hstack([embeddings / np.maximum(norms, 1e-12), onehot])
+
+
+class ToolClassifier:
+    """One L2-regularised logistic regression per tool over query features"""
+
+    def __init__(self, weights: np.ndarray = None, bias: np.ndarray = None, thresholds: Dict[str, float] = None,
+                 embedding_model: str = None):
+        self.weights = weights
+        self.bias = bias
+        self.thresholds = thresholds or {tool: 0.5 for tool in TOOLS}
+        self.embedding_model = embedding_model or Settings.EMBEDDING_MODEL
+
+    @staticmethod
+    def _fit_one(X: np.ndarray, y: np.ndarray, l2: float, iterations: int, lr: float) -> tuple:
+        w, b = np.zeros(X.shape[1]), 0.0
+        for _ in range(iterations):
+            p = 1 / (1 + np.exp(-(X @ w + b)))
+            w -= lr * (X.T @ (p - y) / len(y) + l2 * w)
+            b -= lr * float(np.mean(p - y))
+        return w, b
+
+    def fit(self, X: np.ndarray, labels: np.ndarray, l2: float = 1e-3, iterations: int = 500,
+            lr: float = 1.0) -> "ToolClassifier":
+        """labels is (queries x tools) with 1/0, or nan where a tool's outcome is unknown"""
+        self.weights = np.zeros((len(TOOLS), X.shape[1]))
+        self.bias = np.zeros(len(TOOLS))
+        for t in range(len(TOOLS)):
+            known = ~np.isnan(labels[:, t])
+            if known.any():
+                self.weights[t], self.bias[t] = self._fit_one(X[known], labels[known, t], l2, iterations, lr)
+        return self
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return 1 / (1 + np.exp(-(np.atleast_2d(X) @ self.weights.T + self.bias)))
+
+    def save(self, path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez(path, weights=self.weights, bias=self.bias, tools=np.array(TOOLS),
+                 thresholds=np.array([self.thresholds[t] for t in TOOLS]),
+                 embedding_model=np.array(self.embedding_model))
+
+    @classmethod
+    def load(cls, path) -> Optional["ToolClassifier"]:
+        if not path or not Path(path).exists():
+            return None
+        data = np.load(path)
+        # Weights only fit the tool set and embedding space they were trained on
+        if list(data["tools"]) != TOOLS or str(data["embedding_model"]) != Settings.EMBEDDING_MODEL:
+            return None
+        return cls(data["weights"], data["bias"], dict(zip(TOOLS, data["thresholds"].tolist())),
+                   str(data["embedding_model"]))
+
+
+class RoutingPolicy:
+    """Tools to skip per domain and query cluster, learned offline by src/routing_policy.py"""
+
+    def __init__(self, rules: Dict[str, Dict[str, Dict]] = None):
+        self.rules = rules or {}
+
+    def skipped(self, domain: str, query: str) -> List[str]:
+        return self.rules.get(domain, {}).get(query_cluster(query), {}).get("skip", [])
+
+    @classmethod
+    def load(cls, path) -> Optional["RoutingPolicy"]:
+        if not path or not Path(path).exists():
+            return None
+        with open(path, 'r') as f:
+            return cls(json.load(f).get("rules", {}))
+
+
+class QueryRouter:
+    """Tools to invoke for a query, in domain priority order
+
+    Without a trained classifier this is keyword routing. With one, a tool runs when its
+    contribution probability reaches the tool's threshold; a keyword naming the tool keeps
+    it unless the probability is below ROUTER_VETO_PROBABILITY. A routing policy then drops
+    the tools it marks as low value for the query's domain and cluster, never all of them."""
+
+    def __init__(self, domain_tools: Dict[str, List[str]] = None, model_path: str = None, embedder=None,
+                 policy_path: str = None):
+        self.domain_tools = domain_tools or DOMAIN_TOOLS
+        # model_path="" routes by keywords only; policy_path="" applies no policy
+        self.classifier = ToolClassifier.load(Settings.ROUTER_MODEL_PATH if model_path is None else model_path)
+        self.policy = RoutingPolicy.load(Settings.ROUTING_POLICY_PATH if policy_path is None else policy_path)
+        self._embedder = embedder
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from tools.embeddings import embedding_engine
+            self._embedder = embedding_engine
+        return self._embedder
+
+    def keyword_tools(self, domain: str, query: str) -> List[str]:
+        priority = self.domain_tools.get(domain, TOOLS)
+        found = ROUTE_MATCHER.match(query)
+        # For comprehensive queries, use all tools in domain priority order
+        if "comprehensive" in found:
+            return list(priority)
+        tools = [tool for tool in priority if tool in found]
+        # If no specific keywords, use top 2 domain tools
+        return tools or list(priority[:2])
+
+    def probabilities(self, domain: str, query: str) -> Optional[Dict[str, float]]:
+        if self.classifier is None or not getattr(self.embedder, "available", False):
+            return None
+        embedding = self.embedder.encode_single(query)
+        if not len(embedding):
+            return None
+        probs = self.classifier.predict_proba(_features(embedding[None, :], [domain]))[0]
+        return dict(zip(TOOLS, probs.tolist()))
+
+    def route(self, domain: str, query: str) -> Dict:
+        """{"tools": [...], "source": "classifier" | "keywords", "probabilities": {...} or None,
+        "skipped": tools the routing policy removed}"""
+        priority = self.domain_tools.get(domain, TOOLS)
+        probs = self.probabilities(domain, query)
+        if probs is None:
+            route = {"tools": self.keyword_tools(domain, query), "source": "keywords", "probabilities": None}
+        else:
+            chosen = choose_tools(probs, self.classifier.thresholds, set(ROUTE_MATCHER.match(query)))
+            route = {"tools": [tool for tool in priority if tool in chosen], "source": "classifier",
+                     "probabilities": {tool: round(p, 3) for tool, p in probs.items()}}
+
+        skip = self.policy.skipped(domain, query) if self.policy else []
+        kept = [tool for tool in route["tools"] if tool not in skip]
+        route["skipped"] = [tool for tool in route["tools"] if tool in skip] if kept else []
+        route["tools"] = kept or route["tools"]
+        return route
+
+
+def choose_tools(probs: Dict[str, float], thresholds: Dict[str, float], named: set) -> set:
+    """Tools at or above their threshold, plus keyword-named ones not vetoed; never none"""
+    chosen = {tool for tool in TOOLS if probs[tool] >= thresholds[tool]
+              or (tool in named and probs[tool] >= Settings.ROUTER_VETO_PROBABILITY)}
+    return chosen or {max(probs, key=probs.get)}
+
+
+def load_examples(store) -> List[Dict]:
+    """Distinct logged queries with per-tool contribution labels taken from their tool spans"""
+    rows = store.query("""
+        SELECT query, domain, substr(name, 6) AS tool, arg_max(contributed, ts) AS contributed
+        FROM (SELECT ts, query, domain, json_extract_string(span, '$.name') AS name,
+                     TRY_CAST(json_extract_string(span, '$.attrs.contributed') AS BOOLEAN) AS contributed
+              FROM (SELECT ts, query, domain, unnest(coalesce(TRY_CAST(entry->'spans' AS JSON[]), [])) AS span
+                    FROM queries))
+        WHERE name LIKE 'tool.%' AND contributed IS NOT NULL
+        GROUP BY ALL
+        UNION ALL
+        SELECT DISTINCT query, domain, NULL, NULL FROM queries""")
+    examples: Dict[tuple, Dict] = {}
+    for row in rows.itertuples(index=False):
+        example = examples.setdefault((row.query, row.domain), {"query": row.query, "domain": row.domain,
+                                                                  "labels": {}})
+        if row.tool in TOOLS:
+            example["labels"][row.tool] = bool(row.contributed)
+    return list(examples.values())
+
+
+def label_missing(examples: List[Dict], run_tool: Callable[[str, str, str], str]) -> int:
+    """Run each tool whose outcome a query has no label for; returns the number of tool calls"""
+    calls = 0
+    for example in examples:
+        for tool in TOOLS:
+            if tool not in example["labels"]:
+                try:
+                    result = run_tool(tool, example["query"], example["domain"])
+                except Exception:
+                    result = ""
+                example["labels"][tool] = contributes(result)
+                calls += 1
+    return calls
+
+
+def cross_val_probabilities(X: np.ndarray, labels: np.ndarray, folds: int = 5, seed: int = 0) -> np.ndarray:
+    """Out-of-fold probabilities, so calibration and thresholds are judged on unseen queries"""
+    order = np.random.default_rng(seed).permutation(len(X))
+    probs = np.full(labels.shape, np.nan)
+    for fold in np.array_split(order, min(folds, len(X))):
+        train = np.setdiff1d(order, fold)
+        probs[fold] = ToolClassifier().fit(X[train], labels[train]).predict_proba(X[fold])
+    return probs
+
+
+def choose_threshold(probs: np.ndarray, labels: np.ndarray, min_recall: float) -> float:
+    """Highest threshold keeping at least min_recall of the queries the tool contributes to"""
+    positives = np.sort(probs[labels == 1])
+    if not len(positives):
+        return 1.0
+    keep = int(np.ceil(min_recall * len(positives)))
+    return float(positives[len(positives) - keep])
+
+
+def calibration(probs: np.ndarray, labels: np.ndarray, bins: int = 10) -> Dict:
+    """Brier score, expected calibration error and the reliability table"""
+    edges = np.linspace(0, 1, bins + 1)
+    which = np.clip(np.digitize(probs, edges[1:-1]), 0, bins - 1)
+    table, ece = [], 0.0
+    for b in range(bins):
+        in_bin = which == b
+        if in_bin.any():
+            predicted, observed = float(probs[in_bin].mean()), float(labels[in_bin].mean())
+            ece += in_bin.mean() * abs(predicted - observed)
+            table.append({"bin": f"{edges[b]:.1f}-{edges[b + 1]:.1f}", "queries": int(in_bin.sum()),
+                          "predicted": round(predicted, 3), "observed": round(observed, 3)})
+    return {"brier": round(float(np.mean((probs - labels) ** 2)), 4), "ece": round(float(ece), 4),
+            "reliability": table}
+
+
+def train(examples: List[Dict], embedder, min_recall: float = None, tool_latency: Dict[str, float] = None) -> tuple:
+    """Fit the classifier on labelled examples; returns (classifier, calibration report)"""
+    min_recall = min_recall if min_recall is not None else Settings.ROUTER_MIN_RECALL
+    X = _features(embedder.encode([e["query"] for e in examples]), [e["domain"] for e in examples])
+    labels = np.array([[float(e["labels"][t]) if t in e["labels"] else np.nan for t in TOOLS] for e in examples])
+    oof = cross_val_probabilities(X, labels)
+
+    classifier = ToolClassifier().fit(X, labels)
+    report = {"trained_at": datetime.now().isoformat(), "queries": len(examples), "min_recall": min_recall,
+              "tools": {}}
+    for t, tool in enumerate(TOOLS):
+        known = ~np.isnan(labels[:, t])
+        y, p = labels[known, t], oof[known, t]
+        threshold = choose_threshold(p, y, min_recall)
+        classifier.thresholds[tool] = threshold
+        chosen = p >= threshold
+        report["tools"][tool] = {
+            "labelled": int(known.sum()),
+            "contribution_rate": round(float(y.mean()), 3) if len(y) else None,
+            "threshold": round(threshold, 4),
+            "recall": round(float(chosen[y == 1].mean()), 3) if (y == 1).any() else None,
+            "precision": round(float(y[chosen].mean()), 3) if chosen.any() else None,
+            "invocation_rate": round(float(chosen.mean()), 3) if len(y) else None,
+            **(calibration(p, y) if len(y) else {})
+        }
+
+    # Invocations against keyword routing on the same queries (fully labelled ones only)
+    complete = ~np.isnan(labels).any(axis=1)
+    if complete.any():
+        router = QueryRouter(model_path="")
+        keyword = np.array([[tool in router.keyword_tools(e["domain"], e["query"]) for tool in TOOLS]
+                            for e in examples])[complete]
+        # Same decision rule as routing, on out-of-fold probabilities
+        learned = np.array([[tool in choose_tools(dict(zip(TOOLS, probs)), classifier.thresholds,
+                                                  set(ROUTE_MATCHER.match(e["query"]))) for tool in TOOLS]
+                            for e, probs in zip(examples, oof)])[complete]
+        useful = labels[complete] == 1
+        latency = np.array([(tool_latency or {}).get(tool, 0.0) for tool in TOOLS])
+        report["replay"] = {
+            "queries": int(complete.sum()),
+            "keyword_calls_per_query": round(float(keyword.sum(axis=1).mean()), 3),
+            "classifier_calls_per_query": round(float(learned.sum(axis=1).mean()), 3),
+            "keyword_missed_contributions": int((useful & ~keyword).sum()),
+            "classifier_missed_contributions": int((useful & ~learned).sum()),
+            "keyword_wasted_calls": int((~useful & keyword).sum()),
+            "classifier_wasted_calls": int((~useful & learned).sum()),
+            "tool_latency_s": dict(zip(TOOLS, latency.round(4).tolist())),
+            "latency_saved_per_query_s": round(float(((keyword.astype(float) - learned) @ latency).mean()), 4)
+        }
+    return classifier, report
+
+
+def print_report(report: Dict):
+    print(f"Router calibration: {report['queries']} queries, target recall {report['min_recall']:.2f}")
+    print(f"{'tool':8} {'labelled':>8} {'contrib':>8} {'thresh':>7} {'recall':>7} {'prec':>6} "
+          f"{'invoke':>7} {'brier':>6} {'ece':>6}")
+    for tool, r in report["tools"].items():
+        fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+        print(f"{tool:8} {r['labelled']:>8} {fmt(r['contribution_rate'], '>8.3f')} {r['threshold']:>7.3f} "
+              f"{fmt(r['recall'], '>7.3f')} {fmt(r['precision'], '>6.3f')} {fmt(r['invocation_rate'], '>7.3f')} "
+              f"{fmt(r.get('brier'), '>6.3f')} {fmt(r.get('ece'), '>6.3f')}")
+    for tool, r in report["tools"].items():
+        print(f"\n{tool} reliability (predicted vs observed contribution):")
+        for row in r.get("reliability", []):
+            print(f"  {row['bin']:>8}  n={row['queries']:<5} predicted {row['predicted']:.3f}  "
+                  f"observed {row['observed']:.3f}")
+    replay = report.get("replay")
+    if replay:
+        print(f"\nReplay on {replay['queries']} fully labelled queries:")
+        print(f"  tool calls/query   keywords {replay['keyword_calls_per_query']:.2f}  "
+              f"classifier {replay['classifier_calls_per_query']:.2f}")
+        print(f"  wasted calls       keywords {replay['keyword_wasted_calls']}  "
+              f"classifier {replay['classifier_wasted_calls']}")
+        print(f"  missed tools       keywords {replay['keyword_missed_contributions']}  "
+              f"classifier {replay['classifier_missed_contributions']}")
+        print(f"  tool latency saved per query: {replay['latency_saved_per_query_s'] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--run-tools", action="store_true",
+                        help="Label tools the logs have no outcome for by running them on each query")
+    parser.add_argument("--min-recall", type=float, default=Settings.ROUTER_MIN_RECALL)
+    parser.add_argument("--output", default=Settings.ROUTER_MODEL_PATH)
+    args = parser.parse_args()
+
+    from dashboards.log_store import log_store
+    from tools.embeddings import embedding_engine
+
+    log_store.refresh(force=True)
+    examples = load_examples(log_store)
+    if args.run_tools:
+        from agents.multi_tool_agent import MultiToolAgent
+        from retrievers.graph import GraphRetriever
+        from retrievers.sql import SQLRetriever
+        from retrievers.vector import VectorRetriever
+        agent = MultiToolAgent(SQLRetriever(), VectorRetriever(), GraphRetriever(), None)
+        print(f"Ran {label_missing(examples, agent.run_tool)} tool calls to label logged queries")
+    examples = [e for e in examples if e["labels"]]
+    if len(examples) < 10 or not embedding_engine.available:
+        print(f"Not enough labelled queries ({len(examples)}) or no embedding model; router not trained")
+        return
+
+    stages = log_store.histograms("stage_latency", "stage")
+    latency = {tool: stages[f"tool.{tool}"].mean for tool in TOOLS if f"tool.{tool}" in stages}
+    classifier, report = train(examples, embedding_engine, args.min_recall, latency)
+    classifier.save(args.output)
+    report_path = Path(args.output).with_suffix(".report.json")
+    report_path.write_text(json.dumps(report, indent=2))
+    print_report(report)
+    print(f"\nSaved {args.output} and {report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Offline job learning which tools to skip per domain and query cluster
+
+Reads logged queries (tool spans give each tool's latency and whether its result contributed)
+joined by query_id to their feedback ratings, and for every domain and query cluster
+(src.router.query_cluster) measures each tool's cost and value:
+
+- latency: mean duration of the tool's span
+- contribution: share of its calls whose result carried data
+- uplift: positive-rating rate of answers that used the tool minus that of answers that did
+  not, both smoothed toward the domain's positive rate
+
+A tool is skipped when it is slow (POLICY_MIN_LATENCY) and either rarely contributes or
+rated answers are no better with it. The policy is replayed on the most recent traffic it
+was not learned from to report the latency it would have saved, then relearned on all
+traffic and written to ROUTING_POLICY_PATH, which the agent's router loads at start.
+
+    python src/routing_policy.py --holdout 0.2
+"""
+import argparse
+import json
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import Settings
+from src.router import TOOLS, RoutingPolicy, query_cluster
+
+# Rated answers needed on each side (with and without the tool) before uplift counts
+MIN_RATED = 5
+# Pseudo-count pulling a cell's positive rate toward its domain's rate
+PRIOR_STRENGTH = 5
+
+
+def load_traffic(store) -> List[Dict]:
+    """Logged queries in time order with per-tool latency and contribution and the mean rating"""
+    rows = store.query("""
+        SELECT q.ts, q.query, q.domain, q.tools, q.execution_time, q.entry->'spans' AS spans, f.rating
+        FROM queries q
+        LEFT JOIN (SELECT query_id, avg(rating) AS rating FROM feedback
+                   WHERE query_id IS NOT NULL GROUP BY query_id) f ON f.query_id = q.query_id
+        ORDER BY q.ts""")
+    traffic = []
+    for row in rows.itertuples(index=False):
+        latency, contributed = {}, {}
+        for span in json.loads(row.spans) if isinstance(row.spans, str) else []:
+            tool = span.get("name", "")[5:] if span.get("name", "").startswith("tool.") else None
+            if tool in TOOLS:
+                latency[tool] = span.get("duration_ms", 0) / 1000
+                if "contributed" in span.get("attrs", {}):
+                    contributed[tool] = bool(span["attrs"]["contributed"])
+        traffic.append({
+            "query": row.query, "domain": row.domain, "tools": [t for t in row.tools if t in TOOLS],
+            "execution_time": row.execution_time, "latency": latency, "contributed": contributed,
+            "rating": None if row.rating is None or row.rating != row.rating else float(row.rating)
+        })
+    return traffic
+
+
+def _rate(positive: int, total: int, prior: float) -> float:
+    return (positive + PRIOR_STRENGTH * prior) / (total + PRIOR_STRENGTH)
+
+
+def learn_policy(traffic: List[Dict], min_latency: float = None, min_contribution: float = None,
+                 min_support: int = None) -> Dict:
+    """Policy document: per domain and cluster, the tools to skip and every tool's statistics"""
+    min_latency = min_latency if min_latency is not None else Settings.POLICY_MIN_LATENCY
+    min_contribution = min_contribution if min_contribution is not None else Settings.POLICY_MIN_CONTRIBUTION
+    min_support = min_support if min_support is not None else Settings.POLICY_MIN_SUPPORT
+
+    cells = defaultdict(list)
+    domain_rated = defaultdict(lambda: [0, 0])
+    tool_latency = defaultdict(list)
+    for q in traffic:
+        q["cluster"] = query_cluster(q["query"])
+        cells[(q["domain"], q["cluster"])].append(q)
+        if q["rating"] is not None:
+            domain_rated[q["domain"]][0] += q["rating"] > 0
+            domain_rated[q["domain"]][1] += 1
+        for tool, seconds in q["latency"].items():
+            tool_latency[tool].append(seconds)
+    # Calls logged without spans are costed at the tool's mean over all traffic
+    overall_latency = {tool: sum(v) / len(v) for tool, v in tool_latency.items() if v}
+
+    rules: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+    for (domain, cluster), queries in sorted(cells.items()):
+        positive, rated = domain_rated[domain]
+        prior = positive / rated if rated else 0.5
+        stats = {}
+        for tool in TOOLS:
+            used = [q for q in queries if tool in q["tools"]]
+            if not used:
+                continue
+            seconds = [q["latency"][tool] for q in used if tool in q["latency"]]
+            known = [q["contributed"][tool] for q in used if tool in q["contributed"]]
+            with_tool = [q["rating"] > 0 for q in used if q["rating"] is not None]
+            without = [q["rating"] > 0 for q in queries if tool not in q["tools"] and q["rating"] is not None]
+            stats[tool] = {
+                "calls": len(used),
+                "latency_s": round(sum(seconds) / len(seconds) if seconds else overall_latency.get(tool, 0.0), 4),
+                # Laplace-smoothed, so a handful of calls cannot claim zero contribution
+                "contribution": round((sum(known) + 1) / (len(known) + 2), 3) if known else None,
+                "rated_with": len(with_tool),
+                "rated_without": len(without),
+                "uplift": round(_rate(sum(with_tool), len(with_tool), prior) -
+                                _rate(sum(without), len(without), prior), 3)
+            }
+
+        skip, reasons = [], {}
+        for tool, s in stats.items():
+            if s["calls"] < min_support or s["latency_s"] < min_latency:
+                continue
+            if s["contribution"] is not None and s["contribution"] < min_contribution:
+                reasons[tool] = f"contributes to {s['contribution']:.0%} of calls"
+            elif s["rated_with"] >= MIN_RATED and s["rated_without"] >= MIN_RATED and s["uplift"] <= 0:
+                reasons[tool] = f"rated answers no better with it (uplift {s['uplift']:+.2f})"
+            else:
+                continue
+            skip.append(tool)
+        # Never leave a cell without tools: keep the most valuable of those it uses
+        if skip and set(skip) >= set(stats):
+            best = max(stats, key=lambda t: (stats[t]["contribution"] or 0, stats[t]["uplift"]))
+            skip.remove(best)
+            reasons.pop(best)
+        rules[domain][cluster] = {"queries": len(queries), "skip": skip, "reasons": reasons, "tools": stats}
+
+    return {
+        "trained_at": datetime.now().isoformat(),
+        "queries": len(traffic),
+        "settings": {"min_latency": min_latency, "min_contribution": min_contribution, "min_support": min_support},
+        "rules": rules
+    }
+
+
+def replay(policy: RoutingPolicy, traffic: List[Dict]) -> Dict:
+    """Latency the policy would have saved on logged queries, skipping tools as the router does"""
+    tool_means = defaultdict(list)
+    for q in traffic:
+        for tool, seconds in q["latency"].items():
+            tool_means[tool].append(seconds)
+    tool_means = {tool: sum(v) / len(v) for tool, v in tool_means.items()}
+
+    affected = skipped_calls = at_risk = 0
+    saved = before = 0.0
+    by_tool = defaultdict(float)
+    for q in traffic:
+        before += q["execution_time"]
+        skip = [t for t in q["tools"] if t in policy.skipped(q["domain"], q["query"])]
+        if not skip or len(skip) == len(q["tools"]):
+            continue
+        affected += 1
+        skipped_calls += len(skip)
+        for tool in skip:
+            seconds = q["latency"].get(tool, tool_means.get(tool, 0.0))
+            saved += seconds
+            by_tool[tool] += seconds
+        # Positively rated answers that drew on a skipped tool might have come out worse
+        if q["rating"] is not None and q["rating"] > 0 and any(q["contributed"].get(t) for t in skip):
+            at_risk += 1
+
+    n = len(traffic)
+    return {
+        "queries": n,
+        "affected_queries": affected,
+        "skipped_calls": skipped_calls,
+        "latency_saved_s": round(saved, 3),
+        "latency_saved_per_query_s": round(saved / n, 4) if n else 0.0,
+        "mean_latency_before_s": round(before / n, 4) if n else 0.0,
+        "mean_latency_after_s": round((before - saved) / n, 4) if n else 0.0,
+        "saved_by_tool_s": {tool: round(v, 3) for tool, v in by_tool.items()},
+        "positive_answers_at_risk": at_risk
+    }
+
+
+def print_report(document: Dict, replayed: Dict, holdout: float):
+    print(f"Routing policy from {document['queries']} logged queries")
+    print(f"{'domain':9} {'cluster':28} {'tool':7} {'calls':>6} {'latency':>8} {'contrib':>8} {'uplift':>7}  decision")
+    for domain, clusters in document["rules"].items():
+        for cluster, rule in clusters.items():
+            for tool, s in rule["tools"].items():
+                contribution = f"{s['contribution']:.2f}" if s["contribution"] is not None else "-"
+                decision = f"skip: {rule['reasons'][tool]}" if tool in rule["skip"] else "keep"
+                print(f"{domain:9} {cluster[:28]:28} {tool:7} {s['calls']:>6} {s['latency_s']:>7.2f}s "
+                      f"{contribution:>8} {s['uplift']:>+7.2f}  {decision}")
+
+    scope = f"latest {holdout:.0%} of traffic (policy learned on the rest)" if holdout else "all traffic"
+    print(f"\nReplay on {replayed['queries']} queries, {scope}:")
+    print(f"  queries with a skipped tool: {replayed['affected_queries']} ({replayed['skipped_calls']} tool calls)")
+    print(f"  mean latency: {replayed['mean_latency_before_s']:.3f}s -> {replayed['mean_latency_after_s']:.3f}s "
+          f"(saved {replayed['latency_saved_per_query_s'] * 1000:.0f} ms/query, "
+          f"{replayed['latency_saved_s']:.1f}s total)")
+    for tool, seconds in replayed["saved_by_tool_s"].items():
+        print(f"    {tool}: {seconds:.1f}s")
+    print(f"  positively rated answers that used a skipped, contributing tool: "
+          f"{replayed['positive_answers_at_risk']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--holdout", type=float, default=0.2,
+                        help="Share of the most recent traffic replayed with a policy learned on the rest")
+    parser.add_argument("--min-latency", type=float, default=Settings.POLICY_MIN_LATENCY)
+    parser.add_argument("--min-contribution", type=float, default=Settings.POLICY_MIN_CONTRIBUTION)
+    parser.add_argument("--min-support", type=int, default=Settings.POLICY_MIN_SUPPORT)
+    parser.add_argument("--output", default=Settings.ROUTING_POLICY_PATH)
+    args = parser.parse_args()
+
+    from dashboards.log_store import log_store
+
+    log_store.refresh(force=True)
+    traffic = load_traffic(log_store)
+    if not traffic:
+        print("No logged queries; policy not written")
+        return
+    thresholds = (args.min_latency, args.min_contribution, args.min_support)
+
+    split = int(len(traffic) * (1 - args.holdout)) if 0 < args.holdout < 1 else len(traffic)
+    learned = learn_policy(traffic[:split], *thresholds)
+    replayed = replay(RoutingPolicy(learned["rules"]), traffic[split:] or traffic)
+
+    document = learn_policy(traffic, *thresholds)
+    document["replay"] = replayed
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(document, f, indent=2)
+    print_report(document, replayed, args.holdout if split < len(traffic) else 0)
+    print(f"\nSaved {args.output}")
+
+
+if __name__ == "__main__":
+    main()
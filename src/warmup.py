@@ -0,0 +1,300 @@
+"""Cache warm-up: pre-execute the quick actions and the most frequent logged queries
+
+Without this, the first user to click each quick action after a restart or a data change pays
+full cold latency. Running these queries through the agent ahead of time fills the caches a
+later identical query reads: the persistent LLM response cache (RAG answers and SQL agent
+steps, cleared when the data version changes), the query embedding cache and the graph
+snapshot. Warm-up entries are logged with warmup=True; the log store keeps them out of the
+traffic rollups, and the report measures the cache hit rate of user queries in the hour after
+the latest warm-up finished.
+
+The app starts a CacheWarmer after ingestion; it runs in a daemon thread and, on every change of
+the source data version, recomputes the risk scores and (with WARMUP_ENABLED) warms again. To warm once, or to see the report:
+
+    python src/warmup.py
+    python src/warmup.py --report
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config.settings import Settings
+from logs.query_logger import log_context
+from src.quick_actions import QUICK_ACTIONS, domain_query
+from tools.data_version import get_data_version
+from tools.llm_cache import response_cache
+from tools.singleflight import normalize
+
+# Logged queries asked fewer times than this are not worth warming
+MIN_OCCURRENCES = 2
+# Window after a warm-up in which user queries are measured
+REPORT_WINDOW = timedelta(hours=1)
+
+
+def warmup_queries(store=None, top_n: int = None) -> List[Dict]:
+    """Quick actions of every domain, then the most frequent logged user queries not among them"""
+    top_n = top_n if top_n is not None else Settings.WARMUP_TOP_QUERIES
+    queries, seen = [], set()
+
+    def add(domain: str, query: str, source: str):
+        key = (domain, normalize(query))
+        if key not in seen:
+            seen.add(key)
+            queries.append({"domain": domain, "query": query, "source": source})
+
+    for domain, actions in QUICK_ACTIONS.items():
+        for _, query in actions:
+            add(domain, query, "quick_action")
+
+    if store is not None and top_n > 0:
+        store.refresh(force=True)
+        frequent = store.query(r"""
+            SELECT domain, mode(query) AS query, count(*) AS asked FROM queries
+            WHERE query IS NOT NULL AND query != '' AND json_extract_string(entry, '$.warmup') IS NULL
+            GROUP BY domain, lower(trim(regexp_replace(query, '\s+', ' ', 'g')))
+            HAVING count(*) >= ?
+            ORDER BY asked DESC, domain LIMIT ?""", [MIN_OCCURRENCES, top_n + len(queries)])
+        added = 0
+        for domain, query in zip(frequent["domain"], frequent["query"]):
+            if added == top_n:
+                break
+            before = len(queries)
+            add(domain, query, "history")
+            added += len(queries) - before
+    return queries
+
+
+def _lower_priority():
+    """Nice the calling thread (Linux applies nice per thread) so live queries get the CPU first"""
+    if Settings.WARMUP_NICE and hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), Settings.WARMUP_NICE)
+        except OSError:
+            pass
+
+
+def warm(agent, queries: List[Dict], concurrency: int = None) -> Dict:
+    """Execute the queries through the agent, at most `concurrency` at a time; returns the run's record"""
+    concurrency = max(1, concurrency or Settings.WARMUP_CONCURRENCY)
+    # Entries from before a data change must be gone before the cache is refilled
+    if Settings.LLM_CACHE_ENABLED:
+        response_cache.check_version()
+
+    def run(item: Dict) -> Dict:
+        start = time.perf_counter()
+        try:
+            with log_context(warmup=True):
+                result = agent.execute(domain_query(item["domain"], item["query"]))
+            return {**item, "execution_time": round(time.perf_counter() - start, 3),
+                    "cache_hit": bool(result.get("cache_hit")), "tier": result.get("tier")}
+        except Exception as e:
+            return {**item, "execution_time": round(time.perf_counter() - start, 3), "error": str(e)}
+
+    started = datetime.now()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="warmup",
+                            initializer=_lower_priority) as pool:
+        results = list(pool.map(run, queries))
+    return {
+        "data_version": get_data_version(),
+        "started_at": started.isoformat(),
+        "finished_at": datetime.now().isoformat(),
+        "duration_s": round(time.perf_counter() - start, 3),
+        "concurrency": concurrency,
+        "queries": results
+    }
+
+
+def save_record(record: Dict, path: str = None):
+    path = Path(path or Settings.WARMUP_REPORT_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(record, f, indent=2)
+
+
+def load_record(path: str = None) -> Dict:
+    """The latest warm-up run, or None before the first"""
+    path = Path(path or Settings.WARMUP_REPORT_PATH)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def hit_rate_report(store, record: Dict, window: timedelta = REPORT_WINDOW) -> Dict:
+    """Cache hit rate and latency of user queries in the window after the warm-up finished
+
+    Warmed queries are those matching a warmed domain and normalised text; the rest show the
+    hit rate the warm-up did not influence."""
+    window_start = datetime.fromisoformat(record["finished_at"])
+    window_end = window_start + window
+    store.refresh(force=True)
+    rows = store.query("""SELECT domain, query, cache_hit, execution_time FROM queries
+                          WHERE ts >= ? AND ts < ? AND json_extract_string(entry, '$.warmup') IS NULL""",
+                       [window_start, window_end])
+    warmed = {(q["domain"], normalize(q["query"])) for q in record["queries"] if "error" not in q}
+
+    groups = {"all": [], "warmed": [], "other": []}
+    for domain, query, cache_hit, seconds in zip(rows["domain"], rows["query"], rows["cache_hit"],
+                                                 rows["execution_time"]):
+        sample = (bool(cache_hit), seconds)
+        groups["all"].append(sample)
+        groups["warmed" if (domain, normalize(query or "")) in warmed else "other"].append(sample)
+
+    report = {
+        "window_start": window_start.isoformat(),
+        "window_end": window_end.isoformat(),
+        "window_complete": datetime.now() >= window_end
+    }
+    for name, samples in groups.items():
+        report[name] = {
+            "queries": len(samples),
+            "cache_hits": sum(hit for hit, _ in samples),
+            "hit_rate": round(sum(hit for hit, _ in samples) / len(samples), 4) if samples else 0.0,
+            "mean_latency_s": round(sum(s for _, s in samples) / len(samples), 4) if samples else 0.0
+        }
+    return report
+
+
+def print_report(record: Dict, report: Dict = None):
+    failed = [q for q in record["queries"] if "error" in q]
+    already = sum(q.get("cache_hit", False) for q in record["queries"])
+    print(f"Warm-up at {record['started_at']} (data version {record['data_version']}): "
+          f"{len(record['queries'])} queries in {record['duration_s']:.1f}s, concurrency {record['concurrency']}")
+    print(f"  already cached: {already}, failed: {len(failed)}")
+    for q in failed:
+        print(f"    [{q['domain']}] {q['query']}: {q['error']}")
+    if report is None:
+        return
+
+    state = "" if report["window_complete"] else " (window still open)"
+    print(f"\nUser queries {report['window_start']} .. {report['window_end']}{state}:")
+    print(f"  {'':8} {'queries':>8} {'hits':>6} {'hit rate':>9} {'mean latency':>13}")
+    for name in ("all", "warmed", "other"):
+        g = report[name]
+        print(f"  {name:8} {g['queries']:>8} {g['cache_hits']:>6} {g['hit_rate']:>9.1%} {g['mean_latency_s']:>12.3f}s")
+
+
+class CacheWarmer:
+    """Warms the caches in a daemon thread at start and again whenever the source data version changes
+
+    on_data_change runs first after each change (not at start, which follows ingestion) to rebuild
+    derived data such as the risk scores; it runs even when WARMUP_ENABLED turns warming off."""
+
+    def __init__(self, agent, store=None, top_n: int = None, concurrency: int = None,
+                 check_interval: float = None, path: str = None, on_data_change: Callable[[], None] = None):
+        if store is None:
+            from dashboards.log_store import log_store as store
+        self.agent = agent
+        self.store = store
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.check_interval = check_interval if check_interval is not None else Settings.WARMUP_CHECK_INTERVAL
+        self.path = path
+        self.on_data_change = on_data_change
+        self.last_record = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self) -> Dict:
+        """One warm-up now, recorded at WARMUP_REPORT_PATH"""
+        record = warm(self.agent, warmup_queries(self.store, self.top_n), self.concurrency)
+        save_record(record, self.path)
+        self.last_record = record
+        return record
+
+    def _loop(self):
+        _lower_priority()
+        version = None
+        while not self._stop.is_set():
+            current = get_data_version()
+            if current != version:
+                changed, version = version is not None, current
+                try:
+                    if changed and self.on_data_change:
+                        self.on_data_change()
+                    if Settings.WARMUP_ENABLED:
+                        self.run()
+                    self.last_error = None
+                except Exception as e:
+                    self.last_error = str(e)
+            self._stop.wait(self.check_interval)
+
+    def start(self) -> "CacheWarmer":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="cache-warmer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def start_warmup(agent, **kwargs) -> CacheWarmer:
+    """Start the process's warmer; later calls (e.g. from other app sessions) return the running one"""
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = CacheWarmer(agent, **kwargs).start()
+        return _warmer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--report", action="store_true",
+                        help="Report the latest warm-up and the hit rate after it instead of warming")
+    parser.add_argument("--top", type=int, default=Settings.WARMUP_TOP_QUERIES,
+                        help="Most frequent logged queries warmed besides the quick actions")
+    parser.add_argument("--concurrency", type=int, default=Settings.WARMUP_CONCURRENCY)
+    parser.add_argument("--list", action="store_true", help="Print the queries that would be warmed and exit")
+    args = parser.parse_args()
+
+    from dashboards.log_store import log_store
+
+    if args.report:
+        record = load_record()
+        if record is None:
+            print(f"No warm-up recorded at {Settings.WARMUP_REPORT_PATH}")
+            return
+        print_report(record, hit_rate_report(log_store, record))
+        return
+
+    queries = warmup_queries(log_store, args.top)
+    if args.list:
+        for q in queries:
+            print(f"{q['source']:12} [{q['domain']}] {q['query']}")
+        return
+
+    from agents.multi_tool_agent import MultiToolAgent
+    from retrievers.graph import GraphRetriever
+    from retrievers.sql import SQLRetriever
+    from retrievers.vector import VectorRetriever
+    from security.security_wrapper import SecureQueryWrapper
+    from src.rag import RAGPipeline
+
+    agent = SecureQueryWrapper(MultiToolAgent(SQLRetriever(), VectorRetriever(), GraphRetriever(),
+                                              RAGPipeline(os.getenv("OPENAI_API_KEY"))))
+    record = warm(agent, queries, args.concurrency)
+    save_record(record)
+    # Entries are written by a background thread; make sure they are on disk before exiting
+    agent.agent.logger.flush()
+    print_report(record)
+    print(f"\nSaved {Settings.WARMUP_REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
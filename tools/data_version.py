@@ -0,0 +1,25 @@
+import hashlib
+from pathlib import Path
+from typing import Iterable
+
+from config.settings import Settings
+
+# Only raw inputs count; derived files (parsed.jsonl, indexes) are rewritten on every ingest
+SOURCE_PATTERNS = ("*.csv", "*.pdf", "*.eml")
+
+
+def get_data_version(paths: Iterable[str] = None) -> str:
+    """Fingerprint source data files so derived snapshots and caches know when to rebuild"""
+    paths = paths or (Settings.DATA_STRUCTURED, Settings.DATA_UNSTRUCTURED)
+    digest = hashlib.sha1()
+
+    for base in paths:
+        base = Path(base)
+        if not base.exists():
+            continue
+        files = sorted(f for pattern in SOURCE_PATTERNS for f in base.glob(pattern))
+        for f in files:
+            stat = f.stat()
+            digest.update(f"{f.name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+
+    return digest.hexdigest()[:16]
@@ -2,6 +2,8 @@ import json
 import fitz  # PyMuPDF
 import email
 from email import policy
+from email.utils import parsedate_to_datetime
+from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Any
 import re
@@ -11,10 +13,32 @@ import multiprocessing
 warnings.filterwarnings('ignore', category=UserWarning, message='resource_tracker: There appear to be')
 
 class DocumentParser:
-    def __init__(self, chunk_size=1000, chunk_overlap=200, min_chunk_size=100):
+    def __init__(self, chunk_size=1000, chunk_overlap=200, min_chunk_size=100, pii_filter=None):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.min_chunk_size = min_chunk_size
+        # When set, documents are masked before chunking so no PII reaches any store
+        self.pii_filter = pii_filter
+    
+    def _mask_document(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Mask content and free-text metadata (email subject/sender) in place"""
+        if not self.pii_filter:
+            return doc
+        doc["content"], counts = self.pii_filter.mask_pii(doc["content"])
+        for field in ("subject", "sender"):
+            if isinstance(doc["metadata"].get(field), str):
+                doc["metadata"][field], _ = self.pii_filter.mask_pii(doc["metadata"][field])
+        doc["metadata"]["pii_counts"] = counts
+        return doc
+    
+    def _tag_chunks(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Per-chunk PII flags, counted from the placeholders left by masking"""
+        if self.pii_filter:
+            for chunk in chunks:
+                chunk["pii_masked"] = True
+                chunk["pii_counts"] = self.pii_filter.count_masked(chunk["text"])
+                chunk["has_pii"] = any(chunk["pii_counts"].values())
+        return chunks
     
     def parse_pdf(self, pdf_path: Path) -> Dict[str, Any]:
         """Extract text from PDF"""
@@ -23,16 +47,26 @@ class DocumentParser:
         with fitz.open(pdf_path) as doc:
             page_count = len(doc)
             text = "".join([page.get_text() for page in doc])
+            created = (doc.metadata or {}).get("creationDate", "")
         
         return {
             "source": pdf_path.name,
             "type": "pdf",
             "content": text.strip(),
             "metadata": {
-                "pages": page_count
+                "pages": page_count,
+                "date": self._pdf_date(created, pdf_path.stem)
             }
         }
     
+    def _pdf_date(self, created: str, stem: str) -> str:
+        """ISO date from PDF creation metadata, falling back to a year in the file name"""
+        if match := re.match(r'D:(\d{8})', created or ""):
+            return datetime.strptime(match.group(1), "%Y%m%d").isoformat()
+        if match := re.search(r'(20\d{2})', stem):
+            return f"{match.group(1)}-01-01T00:00:00"
+        return None
+    
     def parse_eml(self, eml_path: Path) -> Dict[str, Any]:
         """Extract subject and body from email"""
         with open(eml_path, 'rb') as f:
@@ -59,10 +93,16 @@ class DocumentParser:
             "metadata": {
                 "subject": subject,
                 "sender": sender,
-                "date": date
+                "date": self._email_date(date)
             }
         }
     
+    def _email_date(self, date: str) -> str:
+        try:
+            return parsedate_to_datetime(date).isoformat()
+        except (TypeError, ValueError):
+            return None
+    
     def chunk_text(self, text: str, doc_id: str) -> List[Dict[str, Any]]:
         """Split text into overlapping chunks without duplicates"""
         # Clean text
@@ -127,13 +167,13 @@ class DocumentParser:
         # Parse PDFs
         for pdf_path in data_path.glob("*.pdf"):
             try:
-                doc = self.parse_pdf(pdf_path)
+                doc = self._mask_document(self.parse_pdf(pdf_path))
                 doc_id = f"pdf_{pdf_path.stem}"
                 doc["id"] = doc_id
                 documents.append(doc)
                 
                 # Create chunks
-                chunks = self.chunk_text(doc["content"], doc_id)
+                chunks = self._tag_chunks(self.chunk_text(doc["content"], doc_id))
                 all_chunks.extend(chunks)
                 print(f"✓ Parsed {pdf_path.name}: {len(chunks)} chunks")
             except Exception as e:
@@ -142,13 +182,13 @@ class DocumentParser:
         # Parse emails
         for eml_path in data_path.glob("*.eml"):
             try:
-                doc = self.parse_eml(eml_path)
+                doc = self._mask_document(self.parse_eml(eml_path))
                 doc_id = f"eml_{eml_path.stem}"
                 doc["id"] = doc_id
                 documents.append(doc)
                 
                 # Create chunks
-                chunks = self.chunk_text(doc["content"], doc_id)
+                chunks = self._tag_chunks(self.chunk_text(doc["content"], doc_id))
                 all_chunks.extend(chunks)
                 print(f"✓ Parsed {eml_path.name}: {len(chunks)} chunks")
             except Exception as e:
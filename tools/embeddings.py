@@ -1,13 +1,20 @@
+import threading
+from collections import OrderedDict
 from sentence_transformers import SentenceTransformer
 import numpy as np
 from typing import List
 
+# Recent single-text embeddings kept, so the router and the vector retriever embed a query once
+SINGLE_CACHE_SIZE = 256
+
 
 class EmbeddingEngine:
     """Centralized embedding functionality for the entire system"""
     
     _instance = None
     _model = None
+    _single_cache = OrderedDict()
+    _cache_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
@@ -41,10 +48,21 @@ class EmbeddingEngine:
             return np.array([])
     
     def encode_single(self, text: str) -> np.ndarray:
-        """Create embedding for single text"""
+        """Create embedding for single text (cached; do not modify the returned array)"""
         if not self._model:
             return np.array([])
-        return self.encode([text])[0]
+        with self._cache_lock:
+            if text in self._single_cache:
+                self._single_cache.move_to_end(text)
+                return self._single_cache[text]
+        embeddings = self.encode([text])
+        if not len(embeddings):
+            return np.array([])
+        with self._cache_lock:
+            self._single_cache[text] = embeddings[0]
+            if len(self._single_cache) > SINGLE_CACHE_SIZE:
+                self._single_cache.popitem(last=False)
+        return embeddings[0]
     
     def similarity(self, text1: str, text2: str) -> float:
         """Calculate similarity between two texts"""
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config.settings import Settings
+from tools.data_version import get_data_version
+
+
+def request_key(namespace: str, model: str, messages: List[Dict], params: Dict = None) -> str:
+    """Hash of the full request; any byte of difference in prompt or parameters is a different entry"""
+    payload = json.dumps({"namespace": namespace, "model": model, "messages": messages, "params": params or {}},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    """Persistent exact-match LLM response cache with LRU size bound, TTL and tokens-saved accounting
+
+    Entries are dropped wholesale when the source data version changes, and per namespace when
+    the model serving that namespace changes (see retain_model)."""
+
+    def __init__(self, path: str = None, max_entries: int = None, ttl: float = None,
+                 refresh_interval: float = 30.0):
+        self.path = Path(path or Settings.LLM_CACHE_PATH)
+        self.max_entries = max_entries or Settings.LLM_CACHE_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else Settings.LLM_CACHE_TTL
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self._db = None
+        self._version_checked = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, namespace TEXT, model TEXT, response TEXT,
+                tokens INTEGER, created REAL, accessed REAL, hits INTEGER DEFAULT 0)""")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            self._db = db
+        self._check_version()
+        return self._db
+
+    def _check_version(self):
+        """Clear every entry once the underlying data changes (checked at most every refresh_interval)"""
+        now = time.monotonic()
+        if self._version_checked and now - self._version_checked < self.refresh_interval:
+            return
+        self._version_checked = now
+
+        version = get_data_version()
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'data_version'").fetchone()
+        if row is None or row[0] != version:
+            self._db.execute("DELETE FROM responses")
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('data_version', ?)", (version,))
+
+    def check_version(self):
+        """Drop entries of older data now instead of at the next throttled check (e.g. before refilling)"""
+        with self.lock:
+            self._version_checked = 0.0
+            self._connect()
+
+    def _count(self, name: str, amount: int = 1):
+        self._db.execute("INSERT INTO counters VALUES (?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, amount))
+
+    def retain_model(self, namespace: str, model: str) -> int:
+        """Drop a namespace's entries produced by any other model; returns rows removed"""
+        with self.lock:
+            db = self._connect()
+            return db.execute("DELETE FROM responses WHERE namespace = ? AND model != ?",
+                              (namespace, model)).rowcount
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Cached response for key, or None; a hit credits the entry's tokens to tokens_saved"""
+        with self.lock:
+            db = self._connect()
+            row = db.execute("SELECT response, tokens, created FROM responses WHERE key = ?", (key,)).fetchone()
+            now = time.time()
+            if row and self.ttl and now - row[2] > self.ttl:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self._count("misses")
+                return None
+
+            db.execute("UPDATE responses SET accessed = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            self._count("hits")
+            self._count("tokens_saved", row[1] or 0)
+            return {"response": json.loads(row[0]), "tokens": row[1]}
+
+    def put(self, key: str, namespace: str, model: str, response, tokens: int = 0):
+        with self.lock:
+            db = self._connect()
+            now = time.time()
+            db.execute("INSERT OR REPLACE INTO responses (key, namespace, model, response, tokens, created, accessed) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (key, namespace, model, json.dumps(response), tokens, now, now))
+            # Evict least recently used entries beyond the size bound
+            db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                       "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def clear(self, namespace: str = None):
+        with self.lock:
+            db = self._connect()
+            if namespace:
+                db.execute("DELETE FROM responses WHERE namespace = ?", (namespace,))
+            else:
+                db.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict:
+        with self.lock:
+            db = self._connect()
+            counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+            entries = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "tokens_saved": counters.get("tokens_saved", 0)
+        }
+
+
+def langchain_cache(cache: ResponseCache, namespace: str):
+    """LangChain BaseCache adapter so chat models (e.g. the SQL agent's) share the persistent cache"""
+    from langchain_core.caches import BaseCache
+    from langchain_core.load import dumps, loads
+
+    class PersistentLangChainCache(BaseCache):
+        def _key(self, prompt: str, llm_string: str) -> str:
+            return request_key(namespace, llm_string, [{"role": "prompt", "content": prompt}])
+
+        def lookup(self, prompt: str, llm_string: str):
+            entry = cache.get(self._key(prompt, llm_string))
+            return loads(entry["response"]) if entry else None
+
+        def update(self, prompt: str, llm_string: str, return_val):
+            # Usage is not attached to individual generations; estimate at 4 characters per token
+            tokens = (len(prompt) + sum(len(g.text) for g in return_val)) // 4
+            cache.put(self._key(prompt, llm_string), namespace, llm_string, dumps(return_val), tokens)
+
+        def clear(self, **kwargs):
+            cache.clear(namespace)
+
+    return PersistentLangChainCache()
+
+
+# Shared instance; the SQLite file is opened on first use
+response_cache = ResponseCache()
@@ -0,0 +1,242 @@
+import json
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from config.settings import Settings
+from tools.tracing import current_span
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Continuously refilling budget of `per_minute` units; acquire blocks until enough is available"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float) -> float:
+        """Take `amount` units, returning the seconds spent waiting"""
+        # A single request larger than the whole budget still goes through once the bucket is full
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return waited
+                wait = (amount - self.available) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def refund(self, amount: float):
+        with self.lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+
+
+class SlotReleasingStream(httpx.SyncByteStream):
+    """Response body that gives back its concurrency slot when closed, after a streamed body is read"""
+
+    def __init__(self, stream: httpx.SyncByteStream, release):
+        self.stream = stream
+        self.release = release
+        self.released = False
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            with self.lock:
+                released, self.released = self.released, True
+            if not released:
+                self.release()
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """Keep-alive HTTP transport that caps concurrency, paces requests/tokens per minute and retries 429/5xx"""
+
+    def __init__(self, max_connections: int, max_concurrency: int, requests_per_minute: int,
+                 tokens_per_minute: int, max_retries: int, backoff_base: float = 0.5, backoff_cap: float = 20.0):
+        self.transport = httpx.HTTPTransport(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections,
+                                keepalive_expiry=60)
+        )
+        self.concurrency = threading.BoundedSemaphore(max_concurrency)
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0, "throttle_seconds": 0.0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str, amount=1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _estimate_tokens(self, request: httpx.Request) -> int:
+        """Prompt characters / 4 plus the completion budget, the same estimate providers meter against"""
+        try:
+            body = json.loads(request.content or b"{}")
+        except (ValueError, httpx.RequestNotRead):
+            return 1
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+        return prompt_chars // 4 + int(body.get("max_tokens") or body.get("max_completion_tokens") or 256)
+
+    def _backoff(self, attempt: int, headers: Optional[httpx.Headers]) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if headers is not None:
+            try:
+                if "retry-after-ms" in headers:
+                    delay = max(delay, float(headers["retry-after-ms"]) / 1000)
+                elif "retry-after" in headers:
+                    delay = max(delay, float(headers["retry-after"]))
+            except ValueError:
+                pass
+        return min(delay, self.backoff_cap)
+
+    def _settle(self, response: httpx.Response, estimate: int):
+        """Give back the unused part of the token estimate once real usage is known"""
+        if "application/json" not in response.headers.get("content-type", ""):
+            return
+        try:
+            usage = json.loads(response.read()).get("usage") or {}
+        except ValueError:
+            return
+        if usage.get("total_tokens"):
+            self.tokens.refund(max(estimate - usage["total_tokens"], 0))
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        # The slot is held until the response body is closed, so streamed completions count
+        # against the cap while their tokens arrive, not just until the headers do
+        self.concurrency.acquire()
+        try:
+            response = self._send(request)
+        except BaseException:
+            self.concurrency.release()
+            raise
+        if response.is_closed:
+            self.concurrency.release()
+        else:
+            response.stream = SlotReleasingStream(response.stream, self.concurrency.release)
+        return response
+
+    def _send(self, request: httpx.Request) -> httpx.Response:
+        estimate = self._estimate_tokens(request)
+        # Attempts, throttling and timeouts are recorded on the calling span (e.g. llm.completion)
+        trace_span, throttled, timeouts = current_span(), 0.0, 0
+        for attempt in range(self.max_retries + 1):
+            waited = self.requests.acquire(1) + self.tokens.acquire(estimate)
+            throttled += waited
+            self._count("throttle_seconds", waited)
+            self._count("requests")
+            try:
+                response = self.transport.handle_request(request)
+            except (httpx.TimeoutException, httpx.NetworkError) as e:
+                timeouts += isinstance(e, httpx.TimeoutException)
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    trace_span.set(http_attempts=attempt + 1, throttle_ms=round(throttled * 1000, 1),
+                                   timeouts=timeouts, timeout=isinstance(e, httpx.TimeoutException))
+                    raise
+                delay = self._backoff(attempt, None)
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    if response.status_code >= 400:
+                        self._count("failures")
+                    self._settle(response, estimate)
+                    trace_span.set(http_attempts=attempt + 1, throttle_ms=round(throttled * 1000, 1),
+                                   timeouts=timeouts, http_status=response.status_code)
+                    return response
+                if response.status_code == 429:
+                    self._count("rate_limited")
+                delay = self._backoff(attempt, response.headers)
+                response.close()
+
+            # A rejected attempt consumed no model tokens
+            self.tokens.refund(estimate)
+            self._count("retries")
+            time.sleep(delay)
+
+    def close(self):
+        self.transport.close()
+
+
+class LLMClient:
+    """Process-wide LLM client layer shared by the RAG pipeline and the LangChain agents"""
+
+    _instance = None
+    _http_client = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(LLMClient, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if self._http_client is None:
+            self.transport = RateLimitedTransport(
+                max_connections=Settings.LLM_MAX_CONNECTIONS,
+                max_concurrency=Settings.LLM_MAX_CONCURRENCY,
+                requests_per_minute=Settings.LLM_REQUESTS_PER_MINUTE,
+                tokens_per_minute=Settings.LLM_TOKENS_PER_MINUTE,
+                max_retries=Settings.LLM_MAX_RETRIES
+            )
+            self._http_client = httpx.Client(
+                transport=self.transport,
+                timeout=httpx.Timeout(Settings.LLM_TIMEOUT, connect=5.0)
+            )
+            self._openai_clients: Dict[str, object] = {}
+
+    @property
+    def http_client(self) -> httpx.Client:
+        return self._http_client
+
+    @property
+    def stats(self) -> Dict:
+        return dict(self.transport.stats)
+
+    def openai(self, api_key: str):
+        """OpenAI SDK client on the shared pool; retries are handled by the transport, not the SDK"""
+        if api_key not in self._openai_clients:
+            import openai
+            self._openai_clients[api_key] = openai.OpenAI(
+                api_key=api_key,
+                base_url=Settings.OPENAI_BASE_URL,
+                http_client=self._http_client,
+                max_retries=0,
+                timeout=Settings.LLM_TIMEOUT
+            )
+        return self._openai_clients[api_key]
+
+    def chat_model(self, **kwargs):
+        """LangChain ChatOpenAI on the shared pool"""
+        from langchain_community.chat_models import ChatOpenAI
+        if Settings.OPENAI_BASE_URL:
+            kwargs.setdefault("openai_api_base", Settings.OPENAI_BASE_URL)
+        return ChatOpenAI(http_client=self._http_client, max_retries=0,
+                          request_timeout=Settings.LLM_TIMEOUT, **kwargs)
+
+
+# Singleton instance
+llm_client = LLMClient()
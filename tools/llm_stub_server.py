@@ -0,0 +1,159 @@
+"""Local OpenAI-compatible chat completions stub for exercising the LLM client under load
+
+Answers POST /v1/chat/completions (plain and stream=true) after an injected latency and
+rejects a share of requests with 429 (with Retry-After) or 503. Like the real API it reports
+prompt_tokens_details.cached_tokens for prompt prefixes of 1024+ tokens it has seen before,
+in 128-token steps (estimated at 4 characters per token). Answers quote the first fact line of
+the request's context, and with logprobs=true each token carries log(confidence), settable per
+model with --model-confidence, so cascade validation can be exercised. Point the app at it with
+OPENAI_BASE_URL=http://localhost:8089/v1 and any OPENAI_API_KEY.
+
+    python tools/llm_stub_server.py --latency 0.4 --rate-limit 0.2 --server-error 0.05
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "Stub answer: Natural Gas Solutions (C013) has 6 active violations."
+
+# Provider prompt caching granularity, in characters at 4 per token
+CACHE_MIN_CHARS = 1024 * 4
+CACHE_STEP_CHARS = 128 * 4
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+    counts = {"requests": 0, "ok": 0, "429": 0, "503": 0}
+    lock = threading.Lock()
+    seen_prefixes = set()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _cached_tokens(self, messages) -> int:
+        """Longest previously seen prompt prefix, in cache steps, as a token count"""
+        prompt = "".join(f"{m.get('role')}:{m.get('content', '')}" for m in messages)
+        boundaries = range(CACHE_MIN_CHARS, len(prompt) + 1, CACHE_STEP_CHARS)
+        with self.lock:
+            cached = max((n for n in boundaries if hash(prompt[:n]) in self.seen_prefixes), default=0)
+            self.seen_prefixes.update(hash(prompt[:n]) for n in boundaries)
+        return cached // 4
+
+    def _answer(self, messages) -> str:
+        """Quote the first context line that carries a number, like a grounded model answer would"""
+        user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+        context = user.split("Context:", 1)[-1].split("Question:", 1)[0]
+        fact = next((line.strip(" -") for line in context.split("\n") if re.search(r"\d", line)), None)
+        return f"Based on the data: {fact}" if fact else ANSWER
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self._count("requests")
+        if not self.path.endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "not found"}})
+
+        roll = random.random()
+        if roll < self.config.rate_limit:
+            self._count("429")
+            return self._send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                                   {"Retry-After": str(self.config.retry_after)})
+        if roll < self.config.rate_limit + self.config.server_error:
+            self._count("503")
+            return self._send_json(503, {"error": {"message": "Service unavailable"}})
+
+        time.sleep(self.config.latency * random.uniform(0.5, 1.5))
+        self._count("ok")
+        answer = self._answer(body.get("messages", []))
+        confidence = self.config.model_confidence.get(body.get("model"), self.config.confidence)
+        logprobs = {"content": [{"token": word, "logprob": math.log(confidence), "bytes": None, "top_logprobs": []}
+                                for word in answer.split(" ")]} if body.get("logprobs") else None
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        completion_tokens = len(answer) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens,
+                 "prompt_tokens_details": {"cached_tokens": self._cached_tokens(body.get("messages", []))}}
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                "model": body.get("model", "stub")}
+
+        if not body.get("stream"):
+            return self._send_json(200, {
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop", "logprobs": logprobs,
+                             "message": {"role": "assistant", "content": answer}}]
+            })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for word in answer.split(" "):
+            chunk = {**base, "object": "chat.completion.chunk", "usage": None,
+                     "choices": [{"index": 0, "finish_reason": None, "delta": {"content": word + " "}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.config.token_delay)
+        final = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+        self.close_connection = True
+
+
+def serve(port=8089, latency=0.3, rate_limit=0.1, server_error=0.0, retry_after=1.0, token_delay=0.02,
+          confidence=0.95, model_confidence=None):
+    """Start the stub in a background thread and return the server (call shutdown() to stop)"""
+    StubHandler.config = argparse.Namespace(latency=latency, rate_limit=rate_limit, server_error=server_error,
+                                            retry_after=retry_after, token_delay=token_delay,
+                                            confidence=confidence, model_confidence=model_confidence or {})
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean seconds before answering")
+    parser.add_argument("--rate-limit", type=float, default=0.1, help="share of requests answered with 429")
+    parser.add_argument("--server-error", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--confidence", type=float, default=0.95, help="per-token probability reported in logprobs")
+    parser.add_argument("--model-confidence", action="append", default=[], metavar="MODEL=P",
+                        help="override --confidence for one model, e.g. gpt-4o-mini=0.6")
+    args = parser.parse_args()
+
+    model_confidence = {name: float(p) for name, p in (item.rsplit("=", 1) for item in args.model_confidence)}
+    server = serve(args.port, args.latency, args.rate_limit, args.server_error, args.retry_after, args.token_delay,
+                   args.confidence, model_confidence)
+    print(f"LLM stub listening on http://127.0.0.1:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(10)
+            print(f" {StubHandler.counts}")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
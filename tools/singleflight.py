@@ -0,0 +1,250 @@
+import copy
+import functools
+import re
+import threading
+from typing import Callable, Dict, Hashable, Iterator, List, Tuple
+
+from config.settings import Settings
+from tools.tracing import current_span
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def normalize(text: str) -> str:
+    """Case- and whitespace-insensitive form of a query, for coalescing keys"""
+    return WHITESPACE.sub(" ", text).strip().lower()
+
+
+class _Stalled(Exception):
+    """The leader published nothing within the wait timeout"""
+
+
+class _Call:
+    """One in-flight execution; followers read what the leader publishes"""
+
+    __slots__ = ("cond", "events", "done", "result", "error")
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.events: List = []
+        self.done = False
+        self.result = None
+        self.error = None
+
+    def publish(self, event):
+        with self.cond:
+            # Followers get their own copy, taken before the leader's caller can modify the value
+            self.events.append(copy.deepcopy(event))
+            self.cond.notify_all()
+
+    def finish(self, result=None, error: BaseException = None):
+        with self.cond:
+            self.result, self.error, self.done = copy.deepcopy(result), error, True
+            self.cond.notify_all()
+
+    def wait(self, timeout: float = None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.done, timeout):
+                raise _Stalled()
+        if self.error is not None:
+            raise self.error
+        return copy.deepcopy(self.result)
+
+    def follow(self, timeout: float = None) -> Iterator:
+        """Every published event, including those before the follower joined, then the end
+
+        Raises _Stalled when the leader publishes nothing for timeout seconds."""
+        seen = 0
+        while True:
+            with self.cond:
+                if not self.cond.wait_for(lambda: self.done or len(self.events) > seen, timeout):
+                    raise _Stalled()
+                batch, finished = self.events[seen:], self.done
+            seen += len(batch)
+            for event in batch:
+                yield copy.deepcopy(event)
+            if finished and seen == len(self.events):
+                break
+        if self.error is not None:
+            raise self.error
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution and its result (or exception)
+
+    The first caller for a key (the leader) runs the work; callers arriving while it runs
+    (followers) wait for it instead of repeating it. Nothing is cached: once the execution
+    ends, the next call for the key runs again. A follower that hears nothing from the leader
+    for `timeout` seconds runs the work itself."""
+
+    def __init__(self, name: str, timeout: float = None):
+        self.name = name
+        self.timeout = timeout if timeout is not None else Settings.COALESCE_WAIT_TIMEOUT
+        self.lock = threading.Lock()
+        self.calls: Dict[Hashable, _Call] = {}
+        self.stats = {"executions": 0, "coalesced": 0, "errors": 0, "timeouts": 0}
+
+    def _join(self, key: Hashable) -> Tuple[_Call, bool]:
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                self.stats["coalesced"] += 1
+                return call, False
+            call = self.calls[key] = _Call()
+            self.stats["executions"] += 1
+            return call, True
+
+    def _leave(self, key: Hashable, call: _Call, result=None, error: BaseException = None):
+        with self.lock:
+            if self.calls.get(key) is call:
+                del self.calls[key]
+            if error is not None:
+                self.stats["errors"] += 1
+        call.finish(result, error)
+
+    def _stalled(self):
+        with self.lock:
+            self.stats["timeouts"] += 1
+        current_span().set(coalesce_timeout=True)
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Tuple[object, bool]:
+        """(result, shared): shared is True when the result came from another caller's execution"""
+        call, leader = self._join(key)
+        if not leader:
+            current_span().set(coalesced=True)
+            try:
+                return call.wait(self.timeout), True
+            except _Stalled:
+                self._stalled()
+                return fn(*args, **kwargs), False
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._leave(key, call, error=e)
+            raise
+        self._leave(key, call, result)
+        return result, False
+
+    def stream(self, key: Hashable, fn: Callable[..., Iterator], *args, **kwargs) -> Tuple[Iterator, bool]:
+        """(events, shared) for a generator: followers replay the leader's events as they arrive
+
+        A follower whose leader stalls before its first event runs the generator itself, after
+        which events.shared is False."""
+        call, leader = self._join(key)
+        if not leader:
+            current_span().set(coalesced=True)
+            follower = _Follow(self, call, fn, args, kwargs)
+            return follower, follower.shared
+        return _Lead(self, key, call, fn, args, kwargs), False
+
+
+class _Lead:
+    """The leader's events, published to followers as they are read
+
+    However the stream ends, including being closed or dropped before its first event,
+    the execution is removed from its group so later calls do not wait on it."""
+
+    shared = False
+
+    def __init__(self, group: SingleFlight, key: Hashable, call: _Call, fn: Callable[..., Iterator], args, kwargs):
+        self.group, self.key, self.call = group, key, call
+        self.fn, self.args, self.kwargs = fn, args, kwargs
+        self.events = None
+        self.open = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.open:
+            raise StopIteration
+        try:
+            if self.events is None:
+                self.events = iter(self.fn(*self.args, **self.kwargs))
+            event = next(self.events)
+        except StopIteration:
+            self._end()
+            raise
+        except BaseException as e:
+            self._end(e if isinstance(e, Exception) else self._abandoned())
+            raise
+        self.call.publish(event)
+        return event
+
+    def close(self):
+        if self.open and self.events is not None and hasattr(self.events, "close"):
+            self.events.close()
+        self._end(self._abandoned())
+
+    __del__ = close
+
+    def _abandoned(self) -> Exception:
+        return RuntimeError(f"{self.group.name}: shared execution was abandoned")
+
+    def _end(self, error: BaseException = None):
+        if self.open:
+            self.open = False
+            self.group._leave(self.key, self.call, error=error)
+
+
+class _Follow:
+    """A follower's replay of the leader's events, or its own run when the leader stalls first"""
+
+    def __init__(self, group: SingleFlight, call: _Call, fn: Callable[..., Iterator], args, kwargs):
+        self.shared = True
+        self.events = self._events(group, call, fn, args, kwargs)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.events)
+
+    def close(self):
+        self.events.close()
+
+    def _events(self, group: SingleFlight, call: _Call, fn: Callable[..., Iterator], args, kwargs) -> Iterator:
+        started = False
+        try:
+            for event in call.follow(group.timeout):
+                started = True
+                yield event
+            return
+        except _Stalled:
+            group._stalled()
+        if started:
+            # Running it again would repeat the events already passed on
+            raise TimeoutError(f"{group.name}: shared execution stalled for {group.timeout}s")
+        self.shared = False
+        yield from fn(*args, **kwargs)
+
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_flight(name: str) -> SingleFlight:
+    """One shared group per name within a process, so its counters cover every caller"""
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+
+def flight_stats() -> Dict[str, Dict[str, int]]:
+    with _groups_lock:
+        return {name: dict(group.stats) for name, group in _groups.items()}
+
+
+def coalesced(name: str):
+    """Method decorator: identical concurrent calls (same instance, normalised query and
+    arguments) share one execution"""
+    group = get_flight(name)
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, query: str, *args, **kwargs):
+            key = (id(self), normalize(query), repr(args), repr(sorted(kwargs.items())))
+            return group.do(key, method, self, query, *args, **kwargs)[0]
+        return wrapper
+    return decorator
@@ -0,0 +1,106 @@
+import mmap
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class TextStore:
+    """Append-only chunk text store, memory-mapped for reads with an id -> (offset, length) index"""
+
+    def __init__(self, store_dir="data/index/text"):
+        self.store_dir = Path(store_dir)
+        self.data_file = self.store_dir / "chunks.bin"
+        self.index_file = self.store_dir / "chunks.idx"
+        self.index: Dict[str, Tuple[int, int]] = {}
+        self._index_size = 0
+        self._mmap = None
+        self._mapped_size = 0
+
+        self._load_index()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.index
+
+    def _load_index(self):
+        """Read index lines appended since the last load; later entries win"""
+        if not self.index_file.exists():
+            return
+        with open(self.index_file, 'r') as f:
+            f.seek(self._index_size)
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                chunk_id, offset, length = line.rstrip('\n').rsplit('\t', 2)
+                self.index[chunk_id] = (int(offset), int(length))
+                self._index_size += len(line.encode())
+
+    def _view(self) -> Optional[mmap.mmap]:
+        """Map the data file, remapping when it has grown"""
+        if not self.data_file.exists():
+            return None
+        size = self.data_file.stat().st_size
+        if self._mmap is None or size > self._mapped_size:
+            # The old map is left to the GC since callers may still hold views into it
+            with open(self.data_file, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            self._mapped_size = size
+        return self._mmap
+
+    def put_many(self, texts: Dict[str, str]) -> int:
+        """Append texts whose id is new or whose content changed; returns the number written"""
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+        pending = []
+        for chunk_id, text in texts.items():
+            encoded = text.encode('utf-8')
+            if self.get_bytes(chunk_id) == encoded:
+                continue
+            pending.append((chunk_id, encoded))
+
+        if not pending:
+            return 0
+
+        with open(self.data_file, 'ab') as data, open(self.index_file, 'a') as index:
+            offset = data.seek(0, os.SEEK_END)
+            lines = []
+            for chunk_id, encoded in pending:
+                data.write(encoded)
+                lines.append(f"{chunk_id}\t{offset}\t{len(encoded)}\n")
+                offset += len(encoded)
+            # Data is flushed before the index so readers never see offsets past the end
+            data.flush()
+            index.write("".join(lines))
+
+        self._load_index()
+        return len(pending)
+
+    def get_bytes(self, chunk_id: str) -> Optional[memoryview]:
+        """Zero-copy view of the stored bytes"""
+        if chunk_id not in self.index:
+            self._load_index()
+        if chunk_id not in self.index:
+            return None
+        offset, length = self.index[chunk_id]
+        view = self._view()
+        if view is None or offset + length > self._mapped_size:
+            return None
+        return memoryview(view)[offset:offset + length]
+
+    def get(self, chunk_id: str, max_chars: int = None) -> Optional[str]:
+        """Decode a chunk's text, or only enough bytes for the first max_chars characters"""
+        data = self.get_bytes(chunk_id)
+        if data is None:
+            return None
+        if max_chars is not None:
+            # UTF-8 needs at most 4 bytes per character
+            data = data[:max_chars * 4]
+            return bytes(data).decode('utf-8', errors='ignore')[:max_chars]
+        return bytes(data).decode('utf-8')
+
+    def get_many(self, chunk_ids: Iterable[str], max_chars: int = None) -> Dict[str, str]:
+        return {chunk_id: text for chunk_id in chunk_ids
+                if (text := self.get(chunk_id, max_chars)) is not None}
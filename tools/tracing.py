@@ -0,0 +1,203 @@
+import functools
+import os
+import threading
+import time
+from contextvars import ContextVar, copy_context
+from typing import Callable, Dict, Iterator, List, Optional
+
+from config.settings import Settings
+
+
+class Span:
+    """One timed pipeline stage; use as a context manager and add attributes with set()"""
+
+    __slots__ = ("trace", "name", "span_id", "parent_id", "attributes", "start_ns", "end_ns",
+                 "_perf_start", "status", "error", "_token")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.error = None
+        self.end_ns = None
+
+    def set(self, **attributes) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.time_ns()
+        self._perf_start = time.perf_counter_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Wall-clock start plus monotonic duration, so clock steps do not distort durations
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._perf_start)
+        if exc is not None:
+            self.status, self.error = "error", f"{exc_type.__name__}: {exc}"
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Exited from another context (e.g. a generator finished elsewhere)
+            _current_span.set(None)
+        self.trace.add(self)
+        if self.parent_id is None:
+            self.trace.finish()
+        return False
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6 if self.end_ns else 0.0
+
+    def to_dict(self, origin_ns: int) -> Dict:
+        entry = {
+            "name": self.name,
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "start_ms": round((self.start_ns - origin_ns) / 1e6, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status
+        }
+        if self.attributes:
+            entry["attrs"] = self.attributes
+        if self.error:
+            entry["error"] = self.error
+        return entry
+
+
+class _NoopSpan:
+    """Returned whenever tracing is off or no trace is active; every call is a no-op"""
+
+    __slots__ = ()
+    name = span_id = None
+    attributes = {}
+
+    def set(self, **attributes):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """Spans of one query; the query log entry written during the trace is held until it ends"""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+        self.log_entry = None
+        self.log_write: Callable = None
+
+    def add(self, span: Span):
+        with self.lock:
+            self.spans.append(span)
+
+    def finish(self):
+        root = self.spans[-1]
+        ordered = sorted(self.spans, key=lambda s: s.start_ns)
+        if self.log_write is not None:
+            self.log_entry["trace_id"] = self.trace_id
+            self.log_entry["spans"] = [s.to_dict(root.start_ns) for s in ordered]
+            self.log_write(self.log_entry)
+        if Settings.TRACE_EXPORT_PATH:
+            from logs.jsonl_writer import get_writer
+            get_writer(Settings.TRACE_EXPORT_PATH).write(to_otlp_json(self, ordered))
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+def span(name: str, **attributes):
+    """Child span of the current one; a no-op outside a trace or with tracing disabled"""
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+def start_trace(name: str, **attributes):
+    """Root span of a new trace, or a child span when a trace is already active"""
+    if not Settings.TRACING_ENABLED:
+        return NOOP_SPAN
+    parent = _current_span.get()
+    if parent is not None:
+        return Span(parent.trace, name, parent.span_id, attributes)
+    return Span(Trace(), name, None, attributes)
+
+
+def isolated(generator: Callable[..., Iterator]) -> Callable[..., Iterator]:
+    """Decorator for generators that yield inside spans: each step runs in a context of its own
+
+    A generator shares its consumer's context, so a span entered before a yield would stay the
+    current span in the consumer's frame between events, and spans the consumer opens there
+    would join this trace."""
+    @functools.wraps(generator)
+    def wrapper(*args, **kwargs) -> Iterator:
+        events = generator(*args, **kwargs)
+        context = copy_context()
+        try:
+            while True:
+                try:
+                    event = context.run(next, events)
+                except StopIteration:
+                    return
+                yield event
+        finally:
+            context.run(events.close)
+    return wrapper
+
+
+def defer_log(entry: Dict, write: Callable) -> bool:
+    """Hold a log entry until the active trace ends so it can carry the spans; False when untraced"""
+    parent = _current_span.get()
+    if parent is None:
+        return False
+    parent.trace.log_entry, parent.trace.log_write = entry, write
+    return True
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_json(trace: Trace, spans: List[Span] = None) -> Dict:
+    """Trace as an OTLP/JSON ExportTraceServiceRequest (readable by the collector's otlpjsonfile receiver)"""
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": Settings.TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": "compass.tracing"},
+            "spans": [{
+                "traceId": trace.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()
+                               if v is not None],
+                "status": {"code": 2, "message": s.error} if s.error else {"code": 1}
+            } for s in (spans or trace.spans)]
+        }]
+    }]}
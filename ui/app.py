@@ -13,6 +13,9 @@ from retrievers.sql import SQLRetriever
 from retrievers.vector import VectorRetriever
 from retrievers.graph import GraphRetriever
 from src.rag import RAGPipeline
+from src.risk_scores import RiskScorer
+from src.quick_actions import QUICK_ACTIONS, SAMPLE_QUERIES, domain_query
+from src.warmup import start_warmup
 from agents.multi_tool_agent import MultiToolAgent
 from feedback.simple_feedback import SimpleFeedback
 from dashboards.metrics import MetricsDashboard
@@ -25,10 +28,11 @@ def init_system():
         ingester = DataIngester()
         ingester.ingest_structured()
         ingester.ingest_unstructured()
+        RiskScorer(ingester.get_db_path()).run()
         
         sql_retriever = SQLRetriever(ingester.get_db_path())
         vector_retriever = VectorRetriever()
-        graph_retriever = GraphRetriever()
+        graph_retriever = GraphRetriever(ingester.get_db_path())
         
         openai_key = os.getenv("OPENAI_API_KEY")
         rag_pipeline = RAGPipeline(openai_key)
@@ -39,6 +43,15 @@ def init_system():
         # Wrap with security layer
         secure_agent = SecureQueryWrapper(agent)
         
+        def refresh_risk_scores():
+            RiskScorer(ingester.get_db_path()).run()
+            sql_retriever.reload_risk_scores()
+            graph_retriever.reload_risk_scores()
+        
+        # Watches the data version (once per process): recomputes risk scores on change and, with
+        # WARMUP_ENABLED, pre-executes quick actions and frequent queries in the background
+        start_warmup(secure_agent, on_data_change=refresh_risk_scores)
+        
         return secure_agent
     
     except Exception as e:
@@ -105,41 +118,17 @@ def main():
     st.session_state.selected_domain = domain
     
     # Quick Actions
-    quick_actions = {
-        "Finance": [
-            ("📊 Revenue Analytics", "Show me top customers by revenue"),
-            ("🎯 Risk Analysis", "Which customers are high risk?"),
-            ("💰 Profit Margins", "Show profit margins by customer")
-        ],
-        "Biotech": [
-            ("🧪 Lab Compliance", "Which labs have safety violations?"),
-            ("⚗️ Clinical Trials", "Show clinical trial compliance status"),
-            ("🔬 Research Issues", "Find research protocol deviations")
-        ],
-        "Energy": [
-            ("⚠️ Emissions Violations", "Find CO2 emissions violations"),
-            ("🏭 Facility Status", "Show facility emission levels"),
-            ("🌱 Green Compliance", "Environmental compliance status")
-        ]
-    }
-    
     st.subheader(f"Quick Actions - {domain}")
     col1, col2, col3 = st.columns(3)
     
-    for idx, (label, query_text) in enumerate(quick_actions[domain]):
+    for idx, (label, query_text) in enumerate(QUICK_ACTIONS[domain]):
         with [col1, col2, col3][idx]:
             if st.button(label, use_container_width=True):
                 st.session_state.query = query_text
     
     # Sample Queries
-    sample_queries = {
-        "Finance": ["What's our total revenue by sector?", "Find financial performance trends"],
-        "Biotech": ["Find adverse outcomes for molecule X", "Patient data privacy compliance"],
-        "Energy": ["Renewable energy adoption rates", "Carbon footprint by facility"]
-    }
-    
     with st.expander(f"📝 More {domain} Queries"):
-        for query in sample_queries[domain]:
+        for query in SAMPLE_QUERIES[domain]:
             if st.button(query, key=f"sample_{query}"):
                 st.session_state.query = query
     
@@ -159,10 +148,21 @@ def main():
     
     with col_search:
         if st.button("🔍 Search", type="primary", use_container_width=True) and query:
-            with st.spinner("🧠 Analyzing..."):
-                enhanced_query = f"[Domain: {domain}] {query}"
-                result = st.session_state.agent.execute(enhanced_query)
-                
+            enhanced_query = domain_query(domain, query)
+            
+            # Render tokens as they stream; the full result replaces this once it completes
+            stream_box = st.empty()
+            stream_box.markdown("🧠 Analyzing...")
+            answer, result = "", None
+            for event in st.session_state.agent.execute_stream(enhanced_query):
+                if event["type"] == "token":
+                    answer += event["text"]
+                    stream_box.markdown(answer + " ▌")
+                elif event["type"] == "result":
+                    result = event["result"]
+            stream_box.empty()
+            
+            if result:
                 st.session_state.last_query_result = {
                     "query": query,
                     "answer": result["answer"],
@@ -200,6 +200,8 @@ def main():
             tools_display = [tool_badges.get(tool, tool) for tool in result["tools_used"]]
             st.write(f"**Tools Used:** {' + '.join(tools_display)}")
             st.write(f"**Time:** {result['execution_time']:.2f}s")
+            if result.get("time_to_first_token") is not None:
+                st.write(f"**First token:** {result['time_to_first_token']:.2f}s")
             
             # Feedback
             st.subheader("👍 Rate Answer")
@@ -210,7 +212,9 @@ def main():
                     feedback.log(
                         st.session_state.last_query_result["query"], 
                         st.session_state.last_query_result["answer"], 
-                        1
+                        1,
+                        query_id=result.get("query_id"),
+                        domain=result.get("domain")
                     )
                     st.success("Thanks!")
                     st.rerun()
@@ -220,7 +224,9 @@ def main():
                     feedback.log(
                         st.session_state.last_query_result["query"], 
                         st.session_state.last_query_result["answer"], 
-                        -1
+                        -1,
+                        query_id=result.get("query_id"),
+                        domain=result.get("domain")
                     )
                     st.info("Will improve!")
                     st.rerun()